@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Measure bytes saved and CPU cost of response compression on representative payloads."""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.utils.compression import brotli, compress_bytes, compress_stream  # noqa: E402
+
+WORDS = ['التحكيم', 'البيانات', 'النص', 'رأي', 'محايد', 'خبر', 'تصنيف', 'مراجعة', 'الجملة',
+         'المستخدم', 'العربية', 'في', 'من', 'على', 'إلى', 'هذا', 'التي', 'كان']
+TAGS = [('Opinion', 'رأي'), ('Neutral', 'محايد'), ('News', 'خبر'), ('Question', 'سؤال')]
+
+
+def _item(i, rng):
+    tag_en, tag_ar = rng.choice(TAGS)
+    return {
+        'id': i,
+        'text': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 40))),
+        'tag_en': tag_en, 'tag_ar': tag_ar, 'status': rng.choice(['pending', 'approved', 'reviewed']),
+        'original_tags': json.dumps({'sentiment': tag_en}, ensure_ascii=False),
+        'uploaded_at': '2024-06-01T12:00:00',
+    }
+
+
+def payloads(rows):
+    rng = random.Random(1)
+    items = [_item(i, rng) for i in range(1, rows + 1)]
+    data_page = json.dumps({'data': items[:100], 'total': rows, 'pages': rows // 100}, ensure_ascii=False)
+    export_lines = [json.dumps(it, ensure_ascii=False) + '\n' for it in items]
+    out = {
+        '/data page (100 rows)': data_page.encode('utf-8'),
+        f'/export ({rows} rows, buffered)': ''.join(export_lines).encode('utf-8'),
+    }
+    admin_js = ROOT_DIR / 'src' / 'static' / 'js' / 'admin.js'
+    if admin_js.exists():
+        out['static admin.js'] = admin_js.read_bytes()
+    return out, export_lines
+
+
+def _measure(fn, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        out = fn()
+    return out, (time.process_time() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    settings = [('gzip', {'gzip_level': level}) for level in (1, 4, 6, 9)]
+    if brotli is not None:
+        settings += [('br', {'brotli_quality': q}) for q in (4, 5, 8)]
+    else:
+        print('brotli not installed: gzip only\n')
+
+    blobs, export_lines = payloads(args.rows)
+    print(f"{'payload':34} {'setting':12} {'raw KB':>9} {'out KB':>9} {'saved':>7} {'cpu ms':>8}")
+    for name, raw in blobs.items():
+        for encoding, kw in settings:
+            out, ms = _measure(lambda: compress_bytes(raw, encoding, **kw), args.repeat)
+            label = f"{encoding}-{list(kw.values())[0]}"
+            print(f"{name:34} {label:12} {len(raw) / 1024:9.1f} {len(out) / 1024:9.1f} "
+                  f"{1 - len(out) / len(raw):7.1%} {ms:8.2f}")
+
+    # streamed export: every flush trades compression ratio for immediate delivery
+    raw_len = sum(len(line.encode('utf-8')) for line in export_lines)
+    for per_chunk in (1, 1000):
+        chunks = [''.join(export_lines[i:i + per_chunk]) for i in range(0, len(export_lines), per_chunk)]
+        for encoding in (['gzip', 'br'] if brotli is not None else ['gzip']):
+            out, ms = _measure(lambda: b''.join(compress_stream(chunks, encoding, gzip_level=4)), args.repeat)
+            name = f'/export (streamed, {per_chunk} rows/flush)'
+            print(f"{name:34} {encoding:12} {raw_len / 1024:9.1f} "
+                  f"{len(out) / 1024:9.1f} {1 - len(out) / raw_len:7.1%} {ms:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from flask import Flask
+
+# Ensure project root on path
+ROOT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.models.user import db  # noqa: E402
+from src.models import archive  # noqa: E402,F401  (registers the archive tables)
+from src.utils.snapshot import build_snapshot, SNAPSHOT_CHUNK, EXTENSIONS  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Append new tagging rows to an incremental columnar snapshot for offline analysis")
+    parser.add_argument("--out", default=os.environ.get("SNAPSHOT_DIR", "snapshot"))
+    parser.add_argument("--database-url", default=os.environ.get("SNAPSHOT_DATABASE_URL")
+                        or os.environ.get("SQLALCHEMY_DATABASE_URI") or os.environ.get("DATABASE_URL"))
+    parser.add_argument("--chunk-size", type=int, default=SNAPSHOT_CHUNK)
+    parser.add_argument("--format", choices=sorted(EXTENSIONS), default=None,
+                        help="parquet (needs pyarrow) or pickle; defaults to parquet when available")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        raise RuntimeError("SNAPSHOT_DATABASE_URL, SQLALCHEMY_DATABASE_URI or DATABASE_URL must be set")
+    db_uri = args.database_url
+    if db_uri.startswith('postgres://'):
+        db_uri = db_uri.replace('postgres://', 'postgresql://', 1)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        run = build_snapshot(args.out, chunk=args.chunk_size, fmt=args.format)
+    print(json.dumps(run, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from flask import Flask
+
+# Ensure project root on path
+ROOT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.models.user import db  # noqa: E402
+from src.models import archive  # noqa: E402,F401  (registers the archive tables)
+from src.utils.tag_analytics import refresh_tag_transitions, BATCH_SIZE  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fold newly settled reviews into the tag transition matrix (run from cron)")
+    parser.add_argument("--database-url", default=os.environ.get("SQLALCHEMY_DATABASE_URI")
+                        or os.environ.get("DATABASE_URL"))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if not args.database_url:
+        raise RuntimeError("SQLALCHEMY_DATABASE_URI or DATABASE_URL must be set")
+    db_uri = args.database_url
+    if db_uri.startswith('postgres://'):
+        db_uri = db_uri.replace('postgres://', 'postgresql://', 1)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        processed = refresh_tag_transitions(batch_size=args.batch_size)
+    print(json.dumps({'processed': processed}))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,8 +9,17 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from src.models.user import db, User
 from src.models.tagging import TaggingData, TaggingReview, UploadSession
+from src.models.analytics import TagTransition, AnalyticsWatermark
+from src.models.dedup import TextSignature, LshBucket
+from src.models.archive import tagging_data_archive, tagging_reviews_archive
+from src.models.jobs import BulkJob
+from src.models.catalog import TagCatalog
+from src.models.schema import ensure_schema
+from src.models.routing import init_replicas, watch_replicas
 from src.routes.user import user_bp
 from src.routes.tagging import tagging_bp
+from src.utils.compression import init_compression
+from src.utils.profiler import init_profiler
 
 # -------------------------
 # Flask app & basic configs
@@ -29,6 +38,12 @@ CORS(app, supports_credentials=True)
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(tagging_bp, url_prefix='/api/tagging')
 
+# ضغط gzip/br للاستجابات النصية الكبيرة (JSON، التصدير، الملفات الثابتة)
+init_compression(app)
+
+# تحليل أداء طلب واحد عند الطلب (X-Profile لمشرف، أو X-Profile-Token)
+init_profiler(app)
+
 # -------------------------
 # Database configuration
 # -------------------------
@@ -47,6 +62,9 @@ if 'sslmode=' not in db_uri and 'localhost' not in db_uri:
 app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# نسخ قراءة اختيارية (SQLALCHEMY_REPLICA_URIS)
+init_replicas(app)
+
 db.init_app(app)
 
 # -------------------------------------
@@ -69,6 +87,31 @@ with app.app_context():
         # لو كان بالفعل TEXT أو مناسب؛ تجاهل
         print("Skip/ignore password_hash alter (maybe already TEXT):", e)
 
+    # 3) أضف الأعمدة والفهارس الجديدة للجداول الموجودة مسبقاً
+    try:
+        ensure_schema()
+    except Exception as e:
+        print("Schema upgrade error:", e)
+
+    # 4) راقب أخطاء نسخ القراءة للتحويل التلقائي إلى الأساسية
+    watch_replicas(db.engines)
+
+    # 5) املأ قاموس الوسوم الفارغ من الترجمات الثابتة
+    try:
+        from src.utils.tag_catalog import seed_catalog
+        seed_catalog()
+    except Exception as e:
+        db.session.rollback()
+        print("Tag catalog seed error:", e)
+
+    # 6) مفاتيح العيّنات للعناصر السابقة للميزة (مرة واحدة؛ بعدها العمود NOT NULL)
+    try:
+        from src.utils.sampling import ensure_sample_keys
+        ensure_sample_keys()
+    except Exception as e:
+        db.session.rollback()
+        print("Sample key backfill error:", e)
+
 
 # -------------------------
 # Error handlers (JSON only)
@@ -0,0 +1,26 @@
+from datetime import datetime
+from .user import db
+
+
+class TagTransition(db.Model):
+    """مصفوفة الالتباس المجمّعة: كم مرة تحوّل الوسم الأصلي إلى وسم آخر حسب القرار"""
+    __tablename__ = 'tag_transitions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    from_tag = db.Column(db.String(200), nullable=False)  # الوسم الأصلي وقت المراجعة
+    to_tag = db.Column(db.String(200), nullable=False)  # الوسم بعد القرار (نفسه في الموافقة والرفض)
+    decision = db.Column(db.String(50), nullable=False)  # approve, reject, modify
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('from_tag', 'to_tag', 'decision', name='uq_tag_transition'),
+    )
+
+
+class AnalyticsWatermark(db.Model):
+    """آخر معرف مراجعة تمت معالجته لكل مُجمِّع تحليلات"""
+    __tablename__ = 'analytics_watermarks'
+
+    name = db.Column(db.String(100), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,34 @@
+from datetime import datetime
+from .user import db
+from .tagging import TaggingData, TaggingReview
+
+
+def _archive_of(table, name):
+    """
+    نسخة من جدول حي بنفس الأعمدة (تتبع أي عمود يُضاف للنموذج لاحقاً عبر ensure_schema)
+    دون فهارسه، مع عمود archived_at.
+    """
+    archive = table.to_metadata(db.metadata, name=name)
+    archive.indexes.clear()
+    archive.append_column(db.Column('archived_at', db.DateTime, default=datetime.utcnow, index=True))
+    return archive
+
+
+# العناصر المحسومة وحركات مراجعتها تُنقل إلى هنا حتى يبقى الجدول الحي بحجم العمل المعلّق
+tagging_data_archive = _archive_of(TaggingData.__table__, 'tagging_data_archive')
+tagging_reviews_archive = _archive_of(TaggingReview.__table__, 'tagging_reviews_archive')
+
+db.Index('ix_tagging_data_archive_status', tagging_data_archive.c.status)
+# العيّنات تقرأ الأرشيف مع الجدول الحي (المعتمد يُؤرشف): نفس فهارس sample_key
+db.Index('ix_tagging_data_archive_status_sample_key',
+         tagging_data_archive.c.status, tagging_data_archive.c.sample_key)
+db.Index('ix_tagging_data_archive_status_tag_sample_key',
+         tagging_data_archive.c.status, tagging_data_archive.c.tag_en, tagging_data_archive.c.sample_key)
+db.Index('ix_tagging_reviews_archive_data_id', tagging_reviews_archive.c.data_id)
+db.Index('ix_tagging_reviews_archive_reviewer_id_id',
+         tagging_reviews_archive.c.reviewer_id, tagging_reviews_archive.c.id)
+db.Index('ix_tagging_reviews_archive_reviewer_history', tagging_reviews_archive.c.reviewer_id,
+         tagging_reviews_archive.c.reviewed_at, tagging_reviews_archive.c.id)
+db.Index('ix_tagging_reviews_archive_reviewer_decision_history', tagging_reviews_archive.c.reviewer_id,
+         tagging_reviews_archive.c.decision, tagging_reviews_archive.c.reviewed_at, tagging_reviews_archive.c.id)
+db.Index('ix_tagging_data_archive_upload_session_id', tagging_data_archive.c.upload_session_id)
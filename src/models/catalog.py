@@ -0,0 +1,29 @@
+from datetime import datetime
+from .user import db
+
+
+class TagCatalog(db.Model):
+    """مفردات الوسوم المعتمدة: زوج إنجليزي↔عربي لكل بُعد (general للوسم الرئيسي tag_en/tag_ar)"""
+    __tablename__ = 'tag_catalog'
+
+    id = db.Column(db.Integer, primary_key=True)
+    dimension = db.Column(db.String(50), nullable=False, default='general')  # general, ideological, syntactic, functional, discourse
+    tag_en = db.Column(db.String(200), nullable=False)
+    tag_ar = db.Column(db.String(200), nullable=False)
+    created_by = db.Column(db.String(36))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('dimension', 'tag_en', name='uq_tag_catalog_dimension_en'),
+        db.UniqueConstraint('dimension', 'tag_ar', name='uq_tag_catalog_dimension_ar'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'dimension': self.dimension,
+            'tag_en': self.tag_en,
+            'tag_ar': self.tag_ar,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,24 @@
+from .user import db
+
+
+class TextSignature(db.Model):
+    """توقيع MinHash لنص العنصر وعنقود التكرار الذي ينتمي إليه"""
+    __tablename__ = 'text_signatures'
+
+    data_id = db.Column(db.Integer, primary_key=True)  # tagging_data.id
+    signature = db.Column(db.LargeBinary, nullable=False)  # NUM_PERM × uint32
+    cluster_id = db.Column(db.Integer, nullable=False, index=True)  # معرف الممثل (أول عنصر في العنقود)
+
+
+class LshBucket(db.Model):
+    """فهرس LSH: كل عنصر يظهر مرة في كل شريحة (band) تحت مفتاح دلو"""
+    __tablename__ = 'lsh_buckets'
+
+    id = db.Column(db.Integer, primary_key=True)
+    band = db.Column(db.SmallInteger, nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False)
+    data_id = db.Column(db.Integer, nullable=False, index=True)
+
+    __table_args__ = (
+        db.Index('ix_lsh_buckets_band_bucket', 'band', 'bucket'),
+    )
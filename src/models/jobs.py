@@ -0,0 +1,40 @@
+from datetime import datetime
+import json
+from .user import db
+
+
+class BulkJob(db.Model):
+    """عملية جماعية على tagging_data تُنفَّذ في الخلفية على دفعات مع تقدّم محفوظ"""
+    __tablename__ = 'bulk_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    action = db.Column(db.String(50), nullable=False)  # set_status, retag, delete
+    filters = db.Column(db.Text)  # JSON
+    params = db.Column(db.Text)  # JSON
+    status = db.Column(db.String(20), default='queued')  # queued, running, completed, failed, cancelled
+    total = db.Column(db.Integer, default=0)  # العدد المطابق عند البدء (تقديري)
+    processed = db.Column(db.Integer, default=0)  # صفوف مُسحت
+    affected = db.Column(db.Integer, default=0)  # صفوف تغيّرت فعلاً
+    error = db.Column(db.Text)
+    created_by = db.Column(db.String(36))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'filters': json.loads(self.filters or '{}'),
+            'params': json.loads(self.params or '{}'),
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'affected': self.affected,
+            'progress': round(self.processed / self.total * 100, 1) if self.total else 100.0,
+            'error': self.error,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
@@ -0,0 +1,114 @@
+from __future__ import annotations
+import itertools
+import os
+import threading
+import time
+from typing import Any, List, Optional
+
+import sqlalchemy as sa
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+
+# نسخ القراءة اختيارية: عناوين مفصولة بفواصل، كل منها يصبح bind باسم replica_<n>
+REPLICA_URIS = [u.strip() for u in os.getenv('SQLALCHEMY_REPLICA_URIS', '').split(',') if u.strip()]
+REPLICA_KEYS = [f'replica_{i}' for i in range(len(REPLICA_URIS))]
+HEALTH_INTERVAL = float(os.getenv('REPLICA_HEALTH_INTERVAL', '5'))  # ثوانٍ بين فحوص الصحة
+DOWN_SECONDS = float(os.getenv('REPLICA_DOWN_SECONDS', '30'))  # مدة استبعاد نسخة معطلة
+
+_lock = threading.Lock()
+_rr = itertools.count()
+_checked_at: dict = {}  # key -> آخر فحص ناجح
+_down_until: dict = {}  # key -> مستبعدة حتى
+
+
+def mark_down(key: str) -> None:
+    with _lock:
+        _down_until[key] = time.monotonic() + DOWN_SECONDS
+        _checked_at.pop(key, None)
+
+
+def _healthy(key: str, engine: sa.engine.Engine) -> bool:
+    """فحص SELECT 1 مخزّن مؤقتاً HEALTH_INTERVAL ثانية"""
+    now = time.monotonic()
+    with _lock:
+        if _down_until.get(key, 0) > now:
+            return False
+        if now - _checked_at.get(key, 0) < HEALTH_INTERVAL:
+            return True
+    try:
+        with engine.connect() as conn:
+            conn.execute(sa.text('SELECT 1'))
+    except Exception:
+        mark_down(key)
+        return False
+    with _lock:
+        _checked_at[key] = now
+    return True
+
+
+def pick_replica(engines) -> Optional[str]:
+    """نسخة سليمة بالتناوب، أو None للرجوع إلى الأساسية"""
+    if not REPLICA_KEYS:
+        return None
+    start = next(_rr)
+    for i in range(len(REPLICA_KEYS)):
+        key = REPLICA_KEYS[(start + i) % len(REPLICA_KEYS)]
+        engine = engines.get(key)
+        if engine is not None and _healthy(key, engine):
+            return key
+    return None
+
+
+def replica_status() -> List[dict]:
+    now = time.monotonic()
+    with _lock:
+        return [{'bind': key, 'down': _down_until.get(key, 0) > now} for key in REPLICA_KEYS]
+
+
+class RoutingSession(Session):
+    """
+    يوجّه استعلامات SELECT الصرفة إلى نسخة القراءة المختارة للطلب (g.replica_bind)،
+    وكل ما عداها (الكتابة، flush، SELECT … FOR UPDATE، النصوص الخام) إلى الأساسية.
+    """
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, bind: Any = None, **kwargs: Any):
+        if bind is None and not self._flushing and has_request_context():
+            key = g.get('replica_bind')
+            if key and isinstance(clause, sa.sql.Select) and clause._for_update_arg is None:
+                engine = self._db.engines.get(key)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', '10'))  # قراءة ما بعد الكتابة من الأساسية
+_SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def init_replicas(app) -> None:
+    """يسجّل binds نسخ القراءة (قبل db.init_app) ويثبّت المستخدم على الأساسية بعد كتاباته"""
+    if not REPLICA_URIS:
+        return
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.update(dict(zip(REPLICA_KEYS, REPLICA_URIS)))
+
+    @app.after_request
+    def _stick_after_write(response):
+        if request.method not in _SAFE_METHODS and response.status_code < 400 and 'user_id' in session:
+            session['primary_until'] = time.time() + STICKY_SECONDS
+        return response
+
+
+def watch_replicas(engines) -> None:
+    """أي خطأ اتصال على نسخة قراءة يستبعدها DOWN_SECONDS فتذهب القراءات للأساسية"""
+    for key in REPLICA_KEYS:
+        engine = engines.get(key)
+        if engine is None:
+            continue
+
+        def _on_error(ctx, key=key):
+            if ctx.is_disconnect or isinstance(ctx.original_exception, sa.exc.OperationalError) \
+                    or isinstance(ctx.sqlalchemy_exception, sa.exc.OperationalError):
+                mark_down(key)
+
+        sa.event.listen(engine, 'handle_error', _on_error)
@@ -0,0 +1,45 @@
+from sqlalchemy import inspect, text
+from .user import db
+
+# فهارس أُزيلت من النماذج لأن فهرساً مركباً يغطيها؛ تُحذف من القواعد الموجودة لتوفير كلفة الكتابة
+OBSOLETE_INDEXES = (
+    ('annotations', 'ix_annotations_is_correct'),
+)
+
+
+def ensure_schema():
+    """
+    يكمّل ما لا يفعله db.create_all() للجداول الموجودة مسبقاً:
+    - يضيف الأعمدة الجديدة المعرّفة في النماذج وغير الموجودة في القاعدة
+    - ينشئ الفهارس المعرّفة في النماذج إن لم تكن موجودة، ويحذف OBSOLETE_INDEXES
+    يُستدعى عند الإقلاع، وهو آمن للتكرار.
+    """
+    engine = db.engine
+    insp = inspect(engine)
+    existing_tables = set(insp.get_table_names())
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_cols = {c['name'] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing_cols:
+                    continue
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(engine.dialect)}'
+                if col.server_default is not None:
+                    default = col.server_default.arg
+                    ddl += f" DEFAULT {getattr(default, 'text', default)}"
+                conn.execute(text(ddl))
+                print(f"Added column {table.name}.{col.name}")
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    with engine.begin() as conn:
+        for table_name, index_name in OBSOLETE_INDEXES:
+            if table_name in existing_tables and \
+                    any(ix['name'] == index_name for ix in insp.get_indexes(table_name)):
+                conn.execute(text(f'DROP INDEX {index_name}'))
+                print(f"Dropped index {index_name}")
@@ -1,5 +1,6 @@
 from datetime import datetime
 import json
+import random
 from .user import db
 
 class TaggingData(db.Model):
@@ -14,6 +15,36 @@ class TaggingData(db.Model):
     status = db.Column(db.String(50), default='pending')  # pending, reviewed, approved
     uploaded_by = db.Column(db.Integer)  # معرف المستخدم الذي رفع البيانات
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    upload_session_id = db.Column(db.Integer, db.ForeignKey('upload_sessions.id'))  # الدفعة (جلسة الرفع) التي أنشأته
+    consensus_state = db.Column(db.String(20))  # open, settled, contested (في أوضاع الإجماع فقط)
+
+    # بيانات المراجعة المجمّعة: تُحدَّث ذرياً مع كل مراجعة وتُصحَّح بـ reconcile_review_meta
+    review_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_reviewed_at = db.Column(db.DateTime)
+    last_decision = db.Column(db.String(50))
+    requeue_review_id = db.Column(db.Integer)  # أُعيد للطابور: مراجعاته حتى هذا المعرف سجلّ فقط ولا تُحتسب
+
+    # مفتاح عشوائي ثابت في [0, 1) للعيّنات: المسح من نقطة بدء على الفهرس بدلاً من ORDER BY random()
+    sample_key = db.Column(db.Float, nullable=False, default=random.random)
+
+    # تزامن متفائل: كل تعديل عبر ORM يصبح UPDATE ... WHERE id=? AND version=? ويزيد الإصدار
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # آخر تغيير في المحتوى أو الحالة (ORM تلقائياً، وعبارات Core الجماعية تضبطه صراحةً): علامة اللقطات التزايدية
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # قوائم مثل "العناصر المعلّقة بأقل من مراجعتين" دون تجميع لكل صف
+        db.Index('ix_tagging_data_status_review_count', 'status', 'review_count'),
+        # طابور المحكّم: مسح المعلّق بترتيب المعرف من scan_from
+        db.Index('ix_tagging_data_status_id', 'status', 'id'),
+        db.Index('ix_tagging_data_status_sample_key', 'status', 'sample_key'),
+        db.Index('ix_tagging_data_status_tag_sample_key', 'status', 'tag_en', 'sample_key'),
+        # نطاق الدفعة: الإحصاءات والطابور والتراجع
+        db.Index('ix_tagging_data_upload_session_status', 'upload_session_id', 'status', 'id'),
+        db.Index('ix_tagging_data_updated_at', 'updated_at'),
+    )
+    __mapper_args__ = {'version_id_col': version}
     
     # العلاقات - معطلة مؤقتاً
     # reviews = db.relationship('TaggingReview', backref='data_item', lazy=True)
@@ -26,7 +57,10 @@ class TaggingData(db.Model):
             'tag_ar': self.tag_ar,
             'status': self.status,
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None,
-            'review_count': 0  # سيتم حسابها لاحقاً
+            'review_count': self.review_count or 0,
+            'last_reviewed_at': self.last_reviewed_at.isoformat() if self.last_reviewed_at else None,
+            'last_decision': self.last_decision,
+            'version': self.version
         }
 
 class TaggingReview(db.Model):
@@ -34,13 +68,14 @@ class TaggingReview(db.Model):
     __tablename__ = 'tagging_reviews'
     
     id = db.Column(db.Integer, primary_key=True)
-    data_id = db.Column(db.Integer, nullable=False)  # معرف البيانات
+    data_id = db.Column(db.Integer, nullable=False, index=True)  # معرف البيانات
     reviewer_id = db.Column(db.Integer, nullable=False)  # معرف المحكم
     
     # قرار المراجع
     decision = db.Column(db.String(50), nullable=False)  # approve, reject, modify
     new_tag_en = db.Column(db.String(200))  # الوسم الجديد بالإنجليزية (في حالة التعديل)
     new_tag_ar = db.Column(db.String(200))  # الوسم الجديد بالعربية (في حالة التعديل)
+    original_tag_en = db.Column(db.String(200))  # الوسم الإنجليزي للعنصر لحظة المراجعة (قبل أي تعديل)
     
     # ملاحظات المراجع
     notes = db.Column(db.Text)
@@ -49,6 +84,13 @@ class TaggingReview(db.Model):
     # معلومات التوقيت
     reviewed_at = db.Column(db.DateTime, default=datetime.utcnow)
     time_spent = db.Column(db.Integer)  # الوقت المستغرق بالثواني
+
+    __table_args__ = (
+        db.Index('ix_tagging_reviews_reviewer_id_id', 'reviewer_id', 'id'),
+        # سجل المحكّم: keyset على (reviewed_at, id) مع تصفية القرار اختيارياً
+        db.Index('ix_tagging_reviews_reviewer_history', 'reviewer_id', 'reviewed_at', 'id'),
+        db.Index('ix_tagging_reviews_reviewer_decision_history', 'reviewer_id', 'decision', 'reviewed_at', 'id'),
+    )
     
     def to_dict(self):
         return {
@@ -70,27 +112,104 @@ class UploadSession(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
+    # tagging: دفعة عناصر tagging_data | sentences: رفع CSV القديم للجمل (لا يدخل قائمة الدفعات ولا التراجع)
+    kind = db.Column(db.String(20), nullable=False, default='tagging', server_default=db.text("'tagging'"))
+    source_sheet = db.Column(db.String(255))  # اسم الورقة داخل المصنّف (للمصنّفات متعددة الأوراق)
     total_records = db.Column(db.Integer, default=0)
     processed_records = db.Column(db.Integer, default=0)
     failed_records = db.Column(db.Integer, default=0)
-    status = db.Column(db.String(50), default='processing')  # processing, completed, failed
+    status = db.Column(db.String(50), default='processing')  # receiving, processing, completed, failed, expired, rolled_back
     uploaded_by = db.Column(db.Integer)  # معرف المستخدم الذي رفع البيانات
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
-    error_log = db.Column(db.Text)  # سجل الأخطاء
+    total_bytes = db.Column(db.BigInteger)  # حجم الملف المعلن عند بدء الرفع المجزّأ
+    bytes_received = db.Column(db.BigInteger, default=0)  # ما وصل فعلاً على القرص
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # آخر جزء وصل (لانتهاء صلاحية الرفع المتروك)
+    error_log = db.Column(db.Text)  # خطأ عام أوقف الجلسة؛ أخطاء الأسطر في upload_errors
     
+    def progress_percentage(self):
+        # قبل معرفة عدد السطور (رفع CSV ببث) يُقاس التقدم بالبايتات المقروءة
+        if self.total_records:
+            return round((self.processed_records or 0) / self.total_records * 100, 2)
+        if self.total_bytes:
+            return round((self.bytes_received or 0) / self.total_bytes * 100, 2)
+        return 0
+
     def to_dict(self):
         return {
             'id': self.id,
             'filename': self.filename,
+            'source_sheet': self.source_sheet,
             'total_records': self.total_records,
             'processed_records': self.processed_records,
             'failed_records': self.failed_records,
             'status': self.status,
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None,
-            'progress_percentage': round((self.processed_records / self.total_records * 100), 2) if self.total_records > 0 else 0
+            'total_bytes': self.total_bytes,
+            'bytes_received': self.bytes_received,
+            'progress_percentage': self.progress_percentage()
         }
 
-# قاموس ترجمة الوسوم من الإنجليزية للعربية
+class UploadError(db.Model):
+    """خطأ في سطر واحد أثناء الرفع (بدلاً من تجميعها في error_log)"""
+    __tablename__ = 'upload_errors'
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('upload_sessions.id'), nullable=False)
+    row_number = db.Column(db.Integer)  # رقم السطر داخل الورقة (بدءاً من 1 بعد الترويسة)
+    column = db.Column(db.String(100))  # العمود المسبب إن عُرف
+    message = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_upload_errors_session_id_id', 'session_id', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'session_id': self.session_id,
+            'row_number': self.row_number,
+            'column': self.column,
+            'message': self.message
+        }
+
+class DeletedItem(db.Model):
+    """أثر حذف عنصر (حي أو مؤرشف) حتى تُسقطه اللقطات التزايدية"""
+    __tablename__ = 'tagging_data_deletions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    data_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ItemVote(db.Model):
+    """عدّاد الأصوات لكل خيار على عنصر واحد (يُحدَّث تزايدياً مع كل مراجعة)"""
+    __tablename__ = 'item_votes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    data_id = db.Column(db.Integer, nullable=False)
+    choice = db.Column(db.String(255), nullable=False)  # approve, reject, modify:<tag_en>
+    decision = db.Column(db.String(50), nullable=False)
+    tag_en = db.Column(db.String(200))
+    tag_ar = db.Column(db.String(200))
+    votes = db.Column(db.Integer, nullable=False, default=0)
+    weight = db.Column(db.Integer, nullable=False, default=0)  # مجموع درجات الثقة
+
+    __table_args__ = (
+        db.UniqueConstraint('data_id', 'choice', name='uq_item_vote_choice'),
+    )
+
+class ReviewerProgress(db.Model):
+    """مجموعة العناصر التي راجعها كل محكّم كخريطة بتات فوق tagging_data.id (قابلة لإعادة البناء)"""
+    __tablename__ = 'reviewer_progress'
+
+    reviewer_id = db.Column(db.String(36), primary_key=True)
+    bitmap = db.deferred(db.Column(db.LargeBinary))  # البت n = العنصر ذو المعرف n تمت مراجعته
+    reviewed_count = db.Column(db.Integer, nullable=False, default=0)
+    max_review_id = db.Column(db.Integer, nullable=False, default=0)  # آخر مراجعة مُدمجة في الخريطة
+    pending_reviewed = db.Column(db.Integer)  # عناصر معلّقة الآن راجعها المحكّم (NULL: صف قديم يُعاد بناؤه)
+    scan_from = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # ما قبله من المعلّق مراجَع كله
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# قاموس ترجمة الوسوم من الإنجليزية للعربية (البذرة الأولى لجدول tag_catalog)
 TAG_TRANSLATIONS = {
     'ReligiousReference': 'مرجع ديني',
     'SelfRepresentation': 'تمثيل الذات',
@@ -107,7 +226,8 @@ TAG_TRANSLATIONS = {
     'Opinion': 'رأي'
 }
 
-def get_arabic_tag(english_tag):
-    """ترجمة الوسم من الإنجليزية للعربية"""
-    return TAG_TRANSLATIONS.get(english_tag, english_tag)
+def get_arabic_tag(english_tag, dimension=None):
+    """ترجمة الوسم من الإنجليزية للعربية عبر قاموس الوسوم في الذاكرة (ثم القاموس الثابت أعلاه)"""
+    from src.utils.tag_catalog import arabic_for
+    return arabic_for(english_tag, dimension) or TAG_TRANSLATIONS.get(english_tag, english_tag)
 
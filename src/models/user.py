@@ -3,8 +3,9 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import uuid
 import json
 from datetime import datetime
+from .routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = "users"
@@ -58,15 +59,23 @@ class Sentence(db.Model):
 class Annotation(db.Model):
     __tablename__ = "annotations"
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    sentence_id = db.Column(db.String(36), db.ForeignKey("sentences.id"), nullable=False)
+    sentence_id = db.Column(db.String(36), db.ForeignKey("sentences.id"), nullable=False, index=True)
     tag_key = db.Column(db.String(100), nullable=False)
     tag_value = db.Column(db.String(200), nullable=False)
-    is_correct = db.Column(db.Boolean, default=None)
+    is_correct = db.Column(db.Boolean, default=None)  # مغطّى بـ ix_annotations_pending_lease (العمود الأول فيه)
     reviewer_comment = db.Column(db.Text, default="")
     reviewer_id = db.Column(db.String(36), db.ForeignKey("users.id"), nullable=True)
     reviewed_at = db.Column(db.DateTime, nullable=True)
+    # حجز مؤقت حتى لا يحصل محكّمان على نفس الدفعة
+    leased_by = db.Column(db.String(36), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
     sentence = db.relationship("Sentence", back_populates="annotations")
     reviewer = db.relationship("User", foreign_keys=[reviewer_id])
+
+    __table_args__ = (
+        db.Index('ix_annotations_pending_lease', 'is_correct', 'lease_expires_at'),
+        db.Index('ix_annotations_leased_by', 'leased_by', 'lease_expires_at'),
+    )
     
     def to_dict(self):
         return {
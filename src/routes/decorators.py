@@ -1,5 +1,6 @@
+import time
 from functools import wraps
-from flask import session, jsonify
+from flask import session, jsonify, g
 
 
 def admin_required(fn):
@@ -12,3 +13,39 @@ def admin_required(fn):
             return jsonify({'error': 'forbidden'}), 403
         return fn(*args, **kwargs)
     return wrapper
+
+
+def read_replica(fn=None, *, admin_only=False, retry=True):
+    """
+    Route SELECTs of a read-only view to a healthy replica, falling back to the primary.
+
+    admin_only: only admin sessions use the replica; use it for views whose other
+    paths write (or read what they just wrote) and must see the primary.
+    retry: if the replica fails mid-request, run the view again on the primary.
+    Only safe for side-effect-free views; pass retry=False otherwise.
+    """
+    if fn is None:
+        return lambda f: read_replica(f, admin_only=admin_only, retry=retry)
+    from src.models.user import db
+    from src.models.routing import pick_replica, replica_status
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        # reads right after this user's own write stay on the primary
+        if session.get('primary_until', 0) > time.time():
+            return fn(*args, **kwargs)
+        if admin_only and (session.get('user_type') or '').lower() != 'admin':
+            return fn(*args, **kwargs)
+        g.replica_bind = pick_replica(db.engines)
+        try:
+            resp = fn(*args, **kwargs)
+            key = g.replica_bind
+            if retry and key and any(r['bind'] == key and r['down'] for r in replica_status()):
+                # the replica failed mid-request: retry once on the primary
+                db.session.rollback()
+                g.replica_bind = None
+                resp = fn(*args, **kwargs)
+            return resp
+        finally:
+            g.replica_bind = None
+    return wrapper
@@ -1,29 +1,212 @@
 ﻿# -*- coding: utf-8 -*-
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context, current_app
 from werkzeug.utils import secure_filename
 import os
 import json
 import pandas as pd
-from datetime import datetime
-from sqlalchemy import func
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update, insert, case, or_, and_, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 import traceback
+import math
+import hashlib
+import fcntl
 
-from src.models.tagging import db, TaggingData, TaggingReview, UploadSession, get_arabic_tag
+from src.models.tagging import db, TaggingData, TaggingReview, UploadSession, UploadError, get_arabic_tag
 from src.models.user import User
-from .decorators import admin_required
-from src.utils.parse_bilingual import parse_bilingual_file  # <= محوّل أعمدة ملفك
+from src.models.dedup import TextSignature
+from src.models.archive import tagging_data_archive, tagging_reviews_archive
+from src.models.jobs import BulkJob
+from src.models.catalog import TagCatalog
+from src.utils.tag_analytics import refresh_in_background, tag_analytics_snapshot
+from src.utils.fields import requested_fields, projection, rows_to_dicts
+from src.utils.rate_limit import rate_limit, concurrency_limit
+from src.utils.consensus import apply_vote, tally, CONSENSUS_MODE, CONSENSUS_K
+from src.utils.compression import compress
+from src.utils.archive import archive_settled, archive_counts, status_counts, data_union, reviews_union
+from src.utils.near_dup import index_items, index_missing
+from src.utils.bulk_ops import start_bulk_job, build_conditions, count_matching, validate_params, reap_stale_jobs
+from src.utils.sampling import stratified_sample, backfill_sample_keys, invalidate_strata
+from src.utils.datasets import backfill_upload_session_ids
+from src.utils.tag_catalog import (suggest, canonical_pair, invalidate_catalog, catalog_status,
+                                   DIMENSIONS as CATALOG_DIMENSIONS, MAX_SUGGEST)
+from src.utils.review_meta import reconcile_review_meta
+from src.utils.reviewer_progress import (reviewer_progress, rebuild_reviewer_progress, unreviewed_ids,
+                                         unreviewed_count, review_applied, items_left_queue,
+                                         items_entered_queue)
+from .decorators import admin_required, read_replica
+from src.utils.parse_bilingual import iter_workbook_sheets, preview_file  # <= محوّل أعمدة ملفك
 
 tagging_bp = Blueprint('tagging', __name__)
 
-UPLOAD_FOLDER = 'uploads'
+UPLOAD_FOLDER = os.path.abspath(os.getenv('UPLOAD_FOLDER', 'uploads'))
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}  # Excel فقط
 
+# حدود التزامن للمسارات المكلفة (لكل عامل)؛ الزائد يُرفض بـ 429 بدل الانتظار
+MAX_CONCURRENT_UPLOADS = int(os.getenv('MAX_CONCURRENT_UPLOADS', '2'))
+MAX_CONCURRENT_STATS = int(os.getenv('MAX_CONCURRENT_STATS', '4'))
+MAX_CONCURRENT_EXPORTS = int(os.getenv('MAX_CONCURRENT_EXPORTS', '2'))
+
 def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
 # ========================= رفع ملف (Excel فقط) =========================
+ERROR_INSERT_BATCH = 1000
+
+def _ingest_records(records, upload_session, user_id):
+    """يُدرج سجلات ورقة واحدة في tagging_data ويحدّث عدادات جلسة الرفع الخاصة بها"""
+    upload_session.total_records = len(records)
+    successful = 0
+    failed = 0
+    errors = []
+    added = []
+
+    for i, item in enumerate(records):
+        try:
+            if not (item.get('text') or '').strip():
+                failed += 1
+                errors.append({'session_id': upload_session.id, 'row_number': i + 1,
+                               'column': 'text', 'message': 'النص فارغ'})
+                continue
+
+            # جهّز original_tags من الأعمدة الثنائية إن لم تكن موجودة
+            tag_cols = [
+                'ideological_en', 'ideological_ar',
+                'syntactic_en',   'syntactic_ar',
+                'functional_en',  'functional_ar',
+                'discourse_en',   'discourse_ar'
+            ]
+            original_tags_val = item.get('original_tags')
+            if original_tags_val is None:
+                tags_dict = {k: (item.get(k) or '').strip()
+                             for k in tag_cols if (item.get(k) or '').strip()}
+                original_tags_val = json.dumps(tags_dict, ensure_ascii=False) if tags_dict else '{}'
+
+            # جهّز tag_en / tag_ar من أول زوج متوفر
+            tag_en = (item.get('tag_en') or '').strip()
+            tag_ar = (item.get('tag_ar') or '').strip()
+            if not tag_en and not tag_ar:
+                pairs = [
+                    ('ideological_en', 'ideological_ar'),
+                    ('syntactic_en',   'syntactic_ar'),
+                    ('functional_en',  'functional_ar'),
+                    ('discourse_en',   'discourse_ar'),
+                ]
+                for en_col, ar_col in pairs:
+                    en_val = (item.get(en_col) or '').strip()
+                    ar_val = (item.get(ar_col) or '').strip()
+                    if en_val or ar_val:
+                        tag_en = en_val or ''
+                        tag_ar = ar_val or (get_arabic_tag(en_val, en_col[:-3]) if en_val else '')
+                        break
+            if not tag_en and not tag_ar:
+                tag_en = 'Unknown'
+                tag_ar = 'غير محدد'
+
+            rec = TaggingData(
+                text=item.get('text', ''),
+                original_tags=original_tags_val,
+                tag_en=tag_en[:100],
+                tag_ar=tag_ar[:100],
+                uploaded_by=user_id,
+                upload_session_id=upload_session.id
+            )
+            db.session.add(rec)
+            added.append(rec)
+            successful += 1
+        except Exception as e:
+            failed += 1
+            errors.append({'session_id': upload_session.id, 'row_number': i + 1,
+                           'column': None, 'message': str(e)})
+
+    # توقيعات MinHash وعناقيد التكرار للعناصر الجديدة
+    db.session.flush()
+    index_items([(rec.id, rec.text) for rec in added])
+
+    # أخطاء الأسطر تُكتب دفعة واحدة في جدول مفهرس
+    for start in range(0, len(errors), ERROR_INSERT_BATCH):
+        db.session.execute(insert(UploadError), errors[start:start + ERROR_INSERT_BATCH])
+
+    upload_session.processed_records = successful
+    upload_session.failed_records = failed
+    upload_session.status = 'completed'
+    db.session.commit()
+
+
+def _ingest_workbook(file_path, filename, user_id, first_session=None):
+    """
+    يقرأ أوراق المصنّف (بالتوازي، وتصل بالترتيب) ويُدرج كل ورقة في جلسة رفع خاصة بها.
+    first_session: جلسة موجودة (كالرفع المجزّأ) تُستخدم للورقة الأولى.
+    يحذف الملف في النهاية ويعيد قائمة الجلسات؛ عند خطأ عام يُعلّم الجلسات بالفشل ثم يعيد رفعه.
+    """
+    sessions = []
+    try:
+        for sheet_name, records, error in iter_workbook_sheets(file_path):
+            if first_session is not None and not sessions:
+                upload_session = first_session
+                upload_session.source_sheet = sheet_name or None
+                upload_session.status = 'processing'
+            else:
+                upload_session = UploadSession(filename=filename, source_sheet=sheet_name or None,
+                                               uploaded_by=user_id, status='processing')
+                db.session.add(upload_session)
+            db.session.commit()
+            sessions.append(upload_session)
+
+            if error is not None:
+                upload_session.status = 'failed'
+                upload_session.error_log = error
+                db.session.commit()
+                continue
+            _ingest_records(records, upload_session, user_id)
+    except Exception as e:
+        db.session.rollback()
+        if not sessions:
+            sessions.append(first_session or UploadSession(filename=filename, uploaded_by=user_id))
+            db.session.add(sessions[-1])
+        for s in sessions:
+            if s.status in (None, 'receiving', 'processing'):
+                s.status = 'failed'
+                s.error_log = str(e)
+        db.session.commit()
+        raise
+    finally:
+        # تنظيف الملف المؤقت
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception:
+            pass
+    return sessions
+
+
+def _upload_result(sessions):
+    """ردّ موحّد لرفع مصنّف (مباشر أو مجزّأ)"""
+    if all(s.status == 'failed' for s in sessions):
+        return jsonify({'error': 'server_error', 'details': sessions[0].error_log if sessions else ''}), 500
+
+    total = sum(s.total_records or 0 for s in sessions)
+    successful = sum(s.processed_records or 0 for s in sessions)
+    failed = sum(s.failed_records or 0 for s in sessions)
+    return jsonify({
+        'success': True,
+        'message': f'تم رفع الملف بنجاح. تم معالجة {successful} سجل',
+        'session_id': sessions[0].id,
+        'total_records': total,
+        'successful_records': successful,
+        'failed_records': failed,
+        'sheets': [{
+            'sheet': s.source_sheet, 'session_id': s.id, 'status': s.status,
+            'total_records': s.total_records, 'successful_records': s.processed_records,
+            'failed_records': s.failed_records
+        } for s in sessions]
+    })
+
+
 @tagging_bp.route('/upload-csv', methods=['POST'])  # احتفاظ بالمسار القديم لواجهتك
+@concurrency_limit('uploads', MAX_CONCURRENT_UPLOADS)
 @admin_required
 def upload_csv():
     try:
@@ -45,137 +228,339 @@ def upload_csv():
         file_path = os.path.join(UPLOAD_FOLDER, filename)
         file.save(file_path)
 
-        upload_session = UploadSession(filename=filename, uploaded_by=user.id, status='processing')
-        db.session.add(upload_session)
-        db.session.commit()
-
         try:
-            # نقرأ الملف بصيغة الأعمدة الثنائية (ملفك المرفق)
-            processed = parse_bilingual_file(file_path)
-
-            upload_session.total_records = len(processed)
-            successful = 0
-            failed = 0
-            errors = []
-
-            for i, item in enumerate(processed):
-                try:
-                    # جهّز original_tags من الأعمدة الثنائية إن لم تكن موجودة
-                    tag_cols = [
-                        'ideological_en', 'ideological_ar',
-                        'syntactic_en',   'syntactic_ar',
-                        'functional_en',  'functional_ar',
-                        'discourse_en',   'discourse_ar'
-                    ]
-                    original_tags_val = item.get('original_tags')
-                    if original_tags_val is None:
-                        tags_dict = {k: (item.get(k) or '').strip()
-                                     for k in tag_cols if (item.get(k) or '').strip()}
-                        original_tags_val = json.dumps(tags_dict, ensure_ascii=False) if tags_dict else '{}'
-
-                    # جهّز tag_en / tag_ar من أول زوج متوفر
-                    tag_en = (item.get('tag_en') or '').strip()
-                    tag_ar = (item.get('tag_ar') or '').strip()
-                    if not tag_en and not tag_ar:
-                        pairs = [
-                            ('ideological_en', 'ideological_ar'),
-                            ('syntactic_en',   'syntactic_ar'),
-                            ('functional_en',  'functional_ar'),
-                            ('discourse_en',   'discourse_ar'),
-                        ]
-                        for en_col, ar_col in pairs:
-                            en_val = (item.get(en_col) or '').strip()
-                            ar_val = (item.get(ar_col) or '').strip()
-                            if en_val or ar_val:
-                                tag_en = en_val or ''
-                                tag_ar = ar_val or (get_arabic_tag(en_val) if en_val else '')
-                                break
-                    if not tag_en and not tag_ar:
-                        tag_en = 'Unknown'
-                        tag_ar = 'غير محدد'
-
-                    rec = TaggingData(
-                        text=item.get('text', ''),
-                        original_tags=original_tags_val,
-                        tag_en=tag_en[:100],
-                        tag_ar=tag_ar[:100],
-                        uploaded_by=user.id
-                    )
-                    db.session.add(rec)
-                    successful += 1
-                except Exception as e:
-                    failed += 1
-                    errors.append(f"السطر {i+1}: {str(e)}")
-
-            upload_session.processed_records = successful
-            upload_session.failed_records = failed
-            upload_session.status = 'completed'
-            upload_session.error_log = '\n'.join(errors) if errors else None
-            db.session.commit()
+            sessions = _ingest_workbook(file_path, filename, user.id)
+        except Exception as e:
+            return jsonify({'error': 'server_error', 'details': str(e)}), 500
+        return _upload_result(sessions)
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+# ========================= معاينة الرفع (دون إدراج) =========================
+def _preview_response(file_path):
+    """معاينة ملف على القرص بخيارات ?head_rows=&sample_size=&seconds=&seed="""
+    args = request.values
+    head_rows = min(max(args.get('head_rows', 50, type=int), 1), 1000)
+    sample_size = min(max(args.get('sample_size', 200, type=int), 0), 5000)
+    seconds = min(max(args.get('seconds', 0.8, type=float), 0.0), 5.0)
+    started = datetime.now()
+    sheets = preview_file(file_path, head_rows, sample_size, seconds, args.get('seed', type=int))
+    return jsonify({
+        'sheets': sheets,
+        'elapsed_ms': int((datetime.now() - started).total_seconds() * 1000)
+    })
 
-            # تنظيف الملف المؤقت
+
+@tagging_bp.route('/upload-preview', methods=['POST'])
+@rate_limit(rate=1, burst=10)
+@admin_required
+def preview_upload():
+    """تشغيل تجريبي: ربط الأعمدة ومدرجات الوسوم والأخطاء المتوقعة دون الكتابة في tagging_data"""
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'error': 'لم يتم اختيار ملف'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'نوع الملف غير مدعوم. يرجى رفع ملف Excel (xlsx/xls)'}), 400
+
+    folder = os.path.join(UPLOAD_FOLDER, 'preview')
+    os.makedirs(folder, exist_ok=True)
+    file_path = os.path.join(folder, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{secure_filename(file.filename)}")
+    file.save(file_path)
+    try:
+        return _preview_response(file_path)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+    finally:
+        os.remove(file_path)
+
+
+# ========================= رفع مجزّأ قابل للاستئناف =========================
+# init -> PUT chunk?offset= -> finalize ؛ الأجزاء تُكتب مباشرة في ملف واحد على القرص
+CHUNK_SIZE = 4 * 1024 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+STREAM_BLOCK = 64 * 1024
+UPLOAD_RECEIVE_TTL = int(os.getenv('UPLOAD_RECEIVE_TTL_HOURS', '24'))  # رفع بلا أجزاء جديدة بعدها يُعدّ متروكاً
+
+def _part_path(upload_session):
+    ext = upload_session.filename.rsplit('.', 1)[1].lower()
+    return os.path.join(UPLOAD_FOLDER, 'chunked', f"{upload_session.id}.{ext}")
+
+def _chunked_state(upload_session):
+    return {
+        'session_id': upload_session.id,
+        'filename': upload_session.filename,
+        'status': upload_session.status,
+        'total_bytes': upload_session.total_bytes,
+        'bytes_received': upload_session.bytes_received or 0,
+        'chunk_size': CHUNK_SIZE
+    }
+
+def expire_stale_uploads(hours=UPLOAD_RECEIVE_TTL):
+    """يعلّم جلسات الاستقبال المتروكة expired ويحذف ملفاتها الجزئية؛ يعيد عددها"""
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    stale = db.session.execute(
+        select(UploadSession.id, UploadSession.filename, UploadSession.bytes_received)
+        .where(UploadSession.status == 'receiving',
+               func.coalesce(UploadSession.updated_at, UploadSession.uploaded_at) < cutoff)
+    ).all()
+    expired = 0
+    for row in stale:
+        # compare-and-set: جزء وصل للتو يُبقي الجلسة حية
+        res = db.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == row.id, UploadSession.status == 'receiving',
+                   UploadSession.bytes_received == row.bytes_received)
+            .values(status='expired')
+        )
+        db.session.commit()
+        if res.rowcount:
+            expired += 1
             try:
-                os.remove(file_path)
-            except Exception:
+                os.remove(_part_path(row))
+            except OSError:
                 pass
+    return expired
+
+def _get_receiving_session(session_id):
+    upload_session = db.session.get(UploadSession, session_id)
+    if not upload_session or upload_session.total_bytes is None:
+        return None, (jsonify({'error': 'جلسة الرفع غير موجودة'}), 404)
+    if upload_session.status != 'receiving':
+        return None, (jsonify({'error': 'جلسة الرفع لا تستقبل أجزاء', **_chunked_state(upload_session)}), 409)
+    return upload_session, None
+
+@tagging_bp.route('/uploads', methods=['POST'])
+@admin_required
+def init_chunked_upload():
+    """بدء رفع مجزّأ: {filename, total_size}"""
+    data = request.get_json() or {}
+    original = data.get('filename') or ''
+    total_size = data.get('total_size')
+    if not original or not allowed_file(original):
+        return jsonify({'error': 'نوع الملف غير مدعوم. يرجى رفع ملف Excel (xlsx/xls)'}), 400
+    if not isinstance(total_size, int) or total_size <= 0:
+        return jsonify({'error': 'الحقل total_size مطلوب'}), 400
+    # تنظيف انتهازي للرفعات المتروكة
+    expire_stale_uploads()
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    upload_session = UploadSession(
+        filename=f"{timestamp}_{secure_filename(original)}",
+        uploaded_by=session['user_id'],
+        status='receiving',
+        total_bytes=total_size,
+        bytes_received=0
+    )
+    db.session.add(upload_session)
+    db.session.commit()
+
+    os.makedirs(os.path.dirname(_part_path(upload_session)), exist_ok=True)
+    open(_part_path(upload_session), 'wb').close()
+    return jsonify(_chunked_state(upload_session)), 201
+
+@tagging_bp.route('/uploads/<int:session_id>', methods=['GET'])
+@admin_required
+def get_chunked_upload(session_id):
+    """حالة الرفع المجزّأ (للاستئناف من bytes_received)"""
+    upload_session = db.session.get(UploadSession, session_id)
+    if not upload_session or upload_session.total_bytes is None:
+        return jsonify({'error': 'جلسة الرفع غير موجودة'}), 404
+    return jsonify(_chunked_state(upload_session))
+
+@tagging_bp.route('/uploads/<int:session_id>', methods=['PUT'])
+@compress(enabled=False)  # ردود صغيرة على كل جزء
+@rate_limit(rate=10, burst=30)
+@admin_required
+def put_upload_chunk(session_id):
+    """
+    استقبال جزء خام في جسم الطلب عند ?offset= ؛ يجب أن يساوي offset ما وصل حتى الآن.
+    ترويسة X-Chunk-SHA256 (اختيارية) للتحقق من سلامة الجزء.
+    """
+    upload_session, err = _get_receiving_session(session_id)
+    if err:
+        return err
+
+    length = request.content_length
+    if not length or length > MAX_CHUNK_SIZE:
+        return jsonify({'error': 'حجم الجزء غير صالح', **_chunked_state(upload_session)}), 400
+
+    path = _part_path(upload_session)
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b') as f:
+        # كاتب واحد لكل ملف: طلب متزامن (إعادة محاولة على نفس offset) يُرفض قبل أن يلمس الملف
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return jsonify({'error': 'جزء آخر قيد الكتابة لهذه الجلسة', **_chunked_state(upload_session)}), 409
+        # التحقق من offset بعد أخذ القفل وعلى أحدث قيمة
+        db.session.refresh(upload_session)
+        offset = request.args.get('offset', type=int)
+        received = upload_session.bytes_received or 0
+        if upload_session.status != 'receiving' or offset != received:
+            return jsonify({'error': 'offset غير متوافق', **_chunked_state(upload_session)}), 409
+        if received + length > upload_session.total_bytes:
+            return jsonify({'error': 'حجم الجزء غير صالح', **_chunked_state(upload_session)}), 400
+        f.seek(offset)
+        while written < length:
+            block = request.stream.read(min(STREAM_BLOCK, length - written))
+            if not block:
+                break
+            f.write(block)
+            digest.update(block)
+            written += len(block)
+
+        expected = (request.headers.get('X-Chunk-SHA256') or '').lower()
+        if written != length or (expected and expected != digest.hexdigest()):
+            # تراجع عن الجزء الناقص أو التالف؛ يعيد العميل إرساله من نفس offset
+            f.truncate(offset)
+            return jsonify({'error': 'الجزء ناقص أو تالف', **_chunked_state(upload_session)}), 400
+        f.truncate(offset + written)
+
+        # compare-and-set (والقفل ما زال مأخوذاً) حتى لا يتقدم طلبان على نفس offset
+        res = db.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session_id, UploadSession.status == 'receiving',
+                   UploadSession.bytes_received == received)
+            .values(bytes_received=received + written, updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+    if res.rowcount == 0:
+        db.session.refresh(upload_session)
+        return jsonify({'error': 'offset غير متوافق', **_chunked_state(upload_session)}), 409
+    db.session.refresh(upload_session)
+    return jsonify(_chunked_state(upload_session))
 
-            return jsonify({
-                'success': True,
-                'message': f'تم رفع الملف بنجاح. تم معالجة {successful} سجل',
-                'session_id': upload_session.id,
-                'total_records': len(processed),
-                'successful_records': successful,
-                'failed_records': failed
-            })
+@tagging_bp.route('/uploads/<int:session_id>/preview', methods=['POST'])
+@rate_limit(rate=1, burst=10)
+@admin_required
+def preview_chunked_upload(session_id):
+    """معاينة ملف رفع مجزّأ مكتمل قبل finalize"""
+    upload_session, err = _get_receiving_session(session_id)
+    if err:
+        return err
+    if (upload_session.bytes_received or 0) != upload_session.total_bytes:
+        return jsonify({'error': 'الملف لم يكتمل بعد', **_chunked_state(upload_session)}), 409
+    try:
+        return _preview_response(_part_path(upload_session))
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+@tagging_bp.route('/uploads/<int:session_id>/finalize', methods=['POST'])
+@concurrency_limit('uploads', MAX_CONCURRENT_UPLOADS)
+@admin_required
+def finalize_chunked_upload(session_id):
+    """بعد اكتمال الأجزاء يبدأ التحليل والإدراج كما في الرفع المباشر"""
+    try:
+        upload_session, err = _get_receiving_session(session_id)
+        if err:
+            return err
+        if (upload_session.bytes_received or 0) != upload_session.total_bytes:
+            return jsonify({'error': 'الملف لم يكتمل بعد', **_chunked_state(upload_session)}), 409
+
+        # compare-and-set قبل التحليل: طلب finalize واحد فقط (مثلاً عند إعادة محاولة العميل) يُدرج الملف
+        res = db.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session_id, UploadSession.status == 'receiving',
+                   UploadSession.bytes_received == UploadSession.total_bytes)
+            .values(status='processing', updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+        if res.rowcount == 0:
+            db.session.refresh(upload_session)
+            return jsonify({'error': 'جلسة الرفع لا تستقبل أجزاء', **_chunked_state(upload_session)}), 409
+        db.session.refresh(upload_session)
+
+        try:
+            sessions = _ingest_workbook(_part_path(upload_session), upload_session.filename,
+                                        session['user_id'], first_session=upload_session)
         except Exception as e:
-            upload_session.status = 'failed'
-            upload_session.error_log = str(e)
-            db.session.commit()
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except Exception:
-                pass
             return jsonify({'error': 'server_error', 'details': str(e)}), 500
-
+        return _upload_result(sessions)
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': 'server_error', 'details': str(e)}), 500
 
 
 # ========================= جلب بيانات للمراجعة =========================
+# الأعمدة المتاحة عبر ?fields= ؛ الإضافية تُرسل فقط عند طلبها صراحة
+TAGGING_DATA_FIELDS = ('id', 'text', 'tag_en', 'tag_ar', 'status', 'uploaded_by', 'uploaded_at', 'original_tags',
+                       'review_count', 'last_reviewed_at', 'last_decision', 'version')
+TAGGING_DATA_SORTS = {
+    'id': TaggingData.id.asc(),
+    'review_count': TaggingData.review_count.asc(),
+    '-review_count': TaggingData.review_count.desc(),
+    'last_reviewed_at': TaggingData.last_reviewed_at.asc(),
+    '-last_reviewed_at': TaggingData.last_reviewed_at.desc(),
+}
+TAGGING_DATA_OPT_IN = ('uploaded_at', 'original_tags')
+
 @tagging_bp.route('/data', methods=['GET'])
+@rate_limit(rate=5, burst=20)
+@read_replica(admin_only=True)  # مسار المحكّم يكتب خريطته ويقرأها: يبقى على الأساسية
 def get_tagging_data():
     if 'user_id' not in session:
         return jsonify({'error': 'unauthorized'}), 401
 
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = max(request.args.get('per_page', 10, type=int), 1)
     status = request.args.get('status', 'pending')
+    fields = requested_fields(TAGGING_DATA_FIELDS, TAGGING_DATA_OPT_IN)
 
-    query = TaggingData.query.filter_by(status=status)
-
-    user = User.query.get(session['user_id'])
-    if (user.user_type or '').lower() == 'reviewer':
-        reviewed_ids = db.session.query(TaggingReview.data_id).filter_by(reviewer_id=user.id).subquery()
-        query = query.filter(~TaggingData.id.in_(reviewed_ids))
-
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    filters = []
+    upload_session_id = request.args.get('upload_session_id', type=int)
+    if upload_session_id is not None:
+        filters.append(TaggingData.upload_session_id == upload_session_id)
+    # تصفية على بيانات المراجعة المجمّعة (أعمدة على الصف نفسه، دون تجميع)
+    min_reviews = request.args.get('min_reviews', type=int)
+    max_reviews = request.args.get('max_reviews', type=int)
+    if min_reviews is not None:
+        filters.append(TaggingData.review_count >= min_reviews)
+    if max_reviews is not None:
+        filters.append(TaggingData.review_count <= max_reviews)
+    if request.args.get('last_decision'):
+        filters.append(TaggingData.last_decision == request.args['last_decision'])
+    conds = [TaggingData.status == status, *filters]
+    sort = request.args.get('sort', 'id')
+    if sort not in TAGGING_DATA_SORTS:
+        return jsonify({'error': 'ترتيب غير صالح'}), 400
+    stmt = projection(TaggingData, fields)
+    if (session.get('user_type') or '').lower() == 'reviewer':
+        # طابور المحكّم يُمسح بترتيب المعرف فقط
+        if sort != 'id':
+            return jsonify({'error': 'الترتيب غير مدعوم في طابور المحكّم'}), 400
+        # الصفحة عبر الخريطة من scan_from، والعدد من عدّادات المحكّم، بدلاً من NOT IN وبنفس المرشحات
+        page_ids = unreviewed_ids(session['user_id'], status, filters, per_page, (page - 1) * per_page)
+        stmt = stmt.where(TaggingData.id.in_(page_ids)).order_by(TaggingData.id)
+        total = unreviewed_count(session['user_id'], status, filters)
+    else:
+        order = [TAGGING_DATA_SORTS[sort]] + ([TaggingData.id.asc()] if sort != 'id' else [])
+        stmt = stmt.where(*conds).order_by(*order).limit(per_page).offset((page - 1) * per_page)
+        total = db.session.execute(select(func.count(TaggingData.id)).where(*conds)).scalar() or 0
+    pages = math.ceil(total / per_page) if total else 0
     return jsonify({
-        'data': [{
-            'id': d.id, 'text': d.text, 'tag_en': d.tag_en, 'tag_ar': d.tag_ar,
-            'status': d.status, 'uploaded_by': d.uploaded_by
-        } for d in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
+        'data': rows_to_dicts(db.session.execute(stmt)),
+        'total': total,
+        'pages': pages,
         'current_page': page,
-        'has_next': pagination.has_next,
-        'has_prev': pagination.has_prev
+        'has_next': page < pages,
+        'has_prev': page > 1
     })
 
 
 # ========================= إرسال مراجعة =========================
+def _version_conflict(item):
+    return jsonify({'error': 'conflict', 'message': 'تم تعديل هذا العنصر من محكّم آخر، راجع الحالة الحالية',
+                    'current': item.to_dict() if item else None}), 409
+
+
 @tagging_bp.route('/review', methods=['POST'])
+@rate_limit(rate=5, burst=20)
 def submit_review():
     if 'user_id' not in session:
         return jsonify({'error': 'unauthorized'}), 401
@@ -193,44 +578,130 @@ def submit_review():
     if not tagging_data:
         return jsonify({'error': 'البيانات غير موجودة'}), 404
 
-    exists = TaggingReview.query.filter_by(data_id=data['data_id'], reviewer_id=user.id).first()
+    # مراجعات ما قبل إعادة العنصر للطابور لا تمنع مراجعته من جديد
+    exists = TaggingReview.query.filter_by(data_id=data['data_id'], reviewer_id=user.id)\
+        .filter(TaggingReview.id > (tagging_data.requeue_review_id or 0)).first()
     if exists:
         return jsonify({'error': 'تم مراجعة هذا العنصر مسبقًا'}), 400
 
+    # الإصدار الذي رآه المحكّم (اختياري): إن تغيّر العنصر منذ عرضه نرفض بدل الكتابة فوق تعديل غيره
+    if data.get('version') is not None:
+        try:
+            version = int(data['version'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'الحقل version يجب أن يكون رقماً صحيحاً'}), 400
+        if version != tagging_data.version:
+            return _version_conflict(tagging_data)
+
+    if data['decision'] == 'modify':
+        # إملاء القاموس المعتمد بدل الكتابة الحرة (ويُكمل الطرف الناقص من الزوج)
+        data['new_tag_en'], data['new_tag_ar'] = canonical_pair(data.get('new_tag_en'), data.get('new_tag_ar'))
+
     review = TaggingReview(
         data_id=data['data_id'],
         reviewer_id=user.id,
         decision=data['decision'],
         new_tag_en=data.get('new_tag_en'),
         new_tag_ar=data.get('new_tag_ar'),
+        original_tag_en=tagging_data.tag_en,
         notes=data.get('notes'),
         confidence=data.get('confidence', 5),
-        time_spent=data.get('time_spent')
+        time_spent=data.get('time_spent'),
+        reviewed_at=datetime.utcnow()
     )
     db.session.add(review)
+    was_pending = tagging_data.status == 'pending'
 
-    if data['decision'] == 'approve':
-        tagging_data.status = 'approved'
-    elif data['decision'] == 'modify':
-        tagging_data.tag_en = data.get('new_tag_en', tagging_data.tag_en)
-        tagging_data.tag_ar = data.get('new_tag_ar', tagging_data.tag_ar)
-        tagging_data.status = 'reviewed'
+    try:
+        consensus = apply_vote(tagging_data, data['decision'], data.get('new_tag_en'), data.get('new_tag_ar'),
+                               data.get('confidence', 5))
+        # بيانات المراجعة على العنصر في نفس UPDATE المشروط بالإصدار (لا قفل مبكر بعبارة منفصلة)؛
+        # updated_at يتغيّر دائماً فكل مراجعة تتحقق من الإصدار وترفعه حتى لو لم يتغيّر الوسم أو الحالة
+        tagging_data.review_count = TaggingData.review_count + 1
+        tagging_data.last_reviewed_at = review.reviewed_at
+        tagging_data.last_decision = data['decision']
+        tagging_data.updated_at = datetime.utcnow()
+        # عدّادات طوابير المحكّمين في نفس المعاملة
+        review_applied(tagging_data.id, user.id, was_pending, tagging_data.status == 'pending')
+        db.session.commit()
+    except StaleDataError:
+        # سبقنا تعديل متزامن بين القراءة والكتابة: لا مراجعة ولا صوت، والحالة الحالية للعميل
+        db.session.rollback()
+        return _version_conflict(db.session.get(TaggingData, data['data_id']))
+    return jsonify({'success': True, 'message': 'تم إرسال المراجعة بنجاح', 'review_id': review.id,
+                    'consensus': consensus})
 
-    db.session.commit()
-    return jsonify({'success': True, 'message': 'تم إرسال المراجعة بنجاح', 'review_id': review.id})
+
+@tagging_bp.route('/consensus/<int:data_id>', methods=['GET'])
+@admin_required
+def get_item_consensus(data_id):
+    """حالة الإجماع وعدّادات الأصوات لعنصر"""
+    item = db.session.get(TaggingData, data_id)
+    if not item:
+        return jsonify({'error': 'البيانات غير موجودة'}), 404
+    return jsonify({'data_id': data_id, 'status': item.status, 'state': item.consensus_state,
+                    'mode': CONSENSUS_MODE, 'required': CONSENSUS_K, **tally(data_id)})
+
+
+@tagging_bp.route('/review-meta/reconcile', methods=['POST'])
+@admin_required
+@concurrency_limit('uploads', MAX_CONCURRENT_UPLOADS)
+def reconcile_review_metadata():
+    """يعيد حساب review_count وآخر مراجعة لكل العناصر على دفعات"""
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(reconcile_review_meta(int(data.get('batch_size') or 1000)))
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+# ========================= تقدّم المحكّم =========================
+@tagging_bp.route('/progress', methods=['GET'])
+@rate_limit(rate=5, burst=20)
+def get_my_progress():
+    """ما راجعه المستخدم الحالي وما تبقى له"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        return jsonify(reviewer_progress(session['user_id']))
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+@tagging_bp.route('/progress/rebuild', methods=['POST'])
+@admin_required
+def rebuild_progress():
+    """إعادة بناء خريطة محكّم من tagging_reviews: {reviewer_id}"""
+    reviewer_id = (request.get_json() or {}).get('reviewer_id')
+    if not reviewer_id:
+        return jsonify({'error': 'الحقل reviewer_id مطلوب'}), 400
+    try:
+        _, count = rebuild_reviewer_progress(reviewer_id)
+        return jsonify({'reviewer_id': reviewer_id, 'reviewed_count': count})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
 
 
 # ========================= إحصائيات عامة =========================
 @tagging_bp.route('/stats', methods=['GET'])
+@rate_limit(rate=1, burst=10)
+@concurrency_limit('stats', MAX_CONCURRENT_STATS)
+@read_replica
 def get_stats():
     try:
         if 'user_id' not in session:
             return jsonify({'error': 'unauthorized'}), 401
 
-        total_data = db.session.query(func.count(TaggingData.id)).scalar() or 0
-        pending_data = db.session.query(func.count(TaggingData.id)).filter(TaggingData.status == 'pending').scalar() or 0
-        reviewed_data = db.session.query(func.count(TaggingData.id)).filter(TaggingData.status == 'reviewed').scalar() or 0
-        approved_data = db.session.query(func.count(TaggingData.id)).filter(TaggingData.status == 'approved').scalar() or 0
+        # الحي والمؤرشف معاً، اختيارياً ضمن دفعة رفع: ?upload_session_id=
+        counts = status_counts(request.args.get('upload_session_id', type=int))
+        total_data = sum(counts.values())
+        pending_data = counts.get('pending', 0)
+        reviewed_data = counts.get('reviewed', 0)
+        approved_data = counts.get('approved', 0)
 
         return jsonify({
             'total_data': total_data,
@@ -245,24 +716,176 @@ def get_stats():
 
 
 # ========================= جلسات الرفع =========================
+UPLOAD_SESSION_FIELDS = ('id', 'filename', 'source_sheet', 'status', 'total_records', 'processed_records',
+                         'failed_records', 'total_bytes', 'bytes_received', 'uploaded_by', 'uploaded_at',
+                         'error_log')
+UPLOAD_SESSION_OPT_IN = ('uploaded_by', 'error_log')
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 200
+
+def _page_limit():
+    return min(max(request.args.get('limit', DEFAULT_PAGE_LIMIT, type=int), 1), MAX_PAGE_LIMIT)
+
 @tagging_bp.route('/upload-sessions', methods=['GET'])
+@rate_limit(rate=1, burst=10)
 @admin_required
+@read_replica
 def get_upload_sessions():
+    """قائمة الجلسات (الأحدث أولاً) بترقيم keyset: ?before=<آخر id>&limit=&kind=tagging|sentences"""
     try:
-        sessions = UploadSession.query.order_by(UploadSession.uploaded_at.desc()).all()
-        out = []
-        for s in sessions:
-            out.append({
-                'id': getattr(s, 'id', None),
-                'filename': getattr(s, 'filename', None),
-                'status': getattr(s, 'status', None),
-                'total_records': getattr(s, 'total_records', None),
-                'processed_records': getattr(s, 'processed_records', None),
-                'failed_records': getattr(s, 'failed_records', None),
-                'error_log': getattr(s, 'error_log', None),
-                'uploaded_at': (s.uploaded_at.isoformat() if getattr(s, 'uploaded_at', None) else None),
-            })
-        return jsonify(out)
+        limit = _page_limit()
+        before = request.args.get('before', type=int)
+        fields = requested_fields(UPLOAD_SESSION_FIELDS, UPLOAD_SESSION_OPT_IN)
+
+        stmt = projection(UploadSession, fields).where(UploadSession.kind == request.args.get('kind', 'tagging'))
+        if before is not None:
+            stmt = stmt.where(UploadSession.id < before)
+        rows = rows_to_dicts(db.session.execute(stmt.order_by(UploadSession.id.desc()).limit(limit + 1)))
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return jsonify({
+            'sessions': rows,
+            'next_before': rows[-1]['id'] if has_more and rows else None
+        })
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+@tagging_bp.route('/upload-sessions/<int:session_id>/rollback', methods=['POST'])
+@admin_required
+def rollback_upload_session(session_id):
+    """تراجع عن دفعة رفع كاملة: مهمة حذف خلفية على دفعات (العناصر ومراجعاتها، الحية والمؤرشفة)"""
+    try:
+        upload_session = db.session.get(UploadSession, session_id)
+        if not upload_session or upload_session.kind != 'tagging':
+            return jsonify({'error': 'جلسة الرفع غير موجودة'}), 404
+        if upload_session.status == 'rolled_back':
+            return jsonify({'error': 'تم التراجع عن هذه الدفعة مسبقاً'}), 409
+        try:
+            job = start_bulk_job(current_app._get_current_object(), 'delete',
+                                 {'upload_session_id': session_id}, {}, session.get('user_id'))
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 409
+        return jsonify(job.to_dict()), 202
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+@tagging_bp.route('/upload-sessions/backfill', methods=['POST'])
+@admin_required
+def backfill_upload_sessions():
+    """يربط العناصر السابقة للميزة بجلسات رفعها حيث تتطابق الأعداد تماماً"""
+    try:
+        return jsonify(backfill_upload_session_ids())
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+@tagging_bp.route('/upload-sessions/<int:session_id>/errors', methods=['GET'])
+@admin_required
+def get_upload_errors(session_id):
+    """أخطاء أسطر جلسة رفع بترقيم keyset: ?after=<آخر id>&limit="""
+    try:
+        limit = _page_limit()
+        after = request.args.get('after', 0, type=int)
+        stmt = select(UploadError.id, UploadError.row_number, UploadError.column, UploadError.message)\
+            .where(UploadError.session_id == session_id, UploadError.id > after)\
+            .order_by(UploadError.id).limit(limit + 1)
+        rows = rows_to_dicts(db.session.execute(stmt))
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return jsonify({
+            'session_id': session_id,
+            'errors': rows,
+            'next_after': rows[-1]['id'] if has_more and rows else None
+        })
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+# ========================= سجل المحكّم =========================
+HISTORY_DECISIONS = ('approve', 'modify', 'reject')
+
+
+def _parse_history_cursor(cursor):
+    """المؤشر بصيغة '<reviewed_at ISO>|<id>' كما يعيده next_cursor"""
+    at, _, rid = (cursor or '').partition('|')
+    return datetime.fromisoformat(at), int(rid)
+
+
+def _history_branch(reviews, items, reviewer_id, decision, cursor, limit):
+    """صفحة من فرع واحد (حي أو مؤرشف) مع نص العنصر، على فهرس (reviewer_id[, decision], reviewed_at, id)"""
+    stmt = select(reviews.c.id, reviews.c.data_id, reviews.c.decision, reviews.c.new_tag_en,
+                  reviews.c.new_tag_ar, reviews.c.confidence, reviews.c.reviewed_at,
+                  reviews.c.time_spent, items.c.text)\
+        .join(items, items.c.id == reviews.c.data_id, isouter=True)\
+        .where(reviews.c.reviewer_id == reviewer_id)
+    if decision:
+        stmt = stmt.where(reviews.c.decision == decision)
+    if cursor:
+        at, rid = cursor
+        stmt = stmt.where(or_(reviews.c.reviewed_at < at,
+                              and_(reviews.c.reviewed_at == at, reviews.c.id < rid)))
+    return stmt.order_by(reviews.c.reviewed_at.desc(), reviews.c.id.desc()).limit(limit).subquery()
+
+
+@tagging_bp.route('/reviews', methods=['GET'])
+@rate_limit(rate=5, burst=20)
+@read_replica
+def get_review_history():
+    """
+    مراجعات المحكّم السابقة (الأحدث أولاً) مع نص العنصر:
+    ?filter=all|approve|modify|reject&cursor=<next_cursor>&limit=
+    (page مقبول للتوافق لكنه لا يُستخدم؛ الترقيم بالمؤشر فقط)
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    reviewer_id = session['user_id']
+    if session.get('user_type') == 'admin' and request.args.get('reviewer_id'):
+        reviewer_id = request.args['reviewer_id']
+
+    decision = request.args.get('filter') or 'all'
+    if decision != 'all' and decision not in HISTORY_DECISIONS:
+        return jsonify({'error': 'فلتر غير صالح'}), 400
+    decision = None if decision == 'all' else decision
+    try:
+        cursor = _parse_history_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'مؤشر غير صالح'}), 400
+
+    try:
+        limit = _page_limit()
+        # كل فرع يجلب limit+1 على فهرسه ثم يُدمجان؛ الكلفة لا تعتمد على عدد مراجعات المحكّم
+        branches = [
+            _history_branch(TaggingReview.__table__, TaggingData.__table__,
+                            reviewer_id, decision, cursor, limit + 1),
+            _history_branch(tagging_reviews_archive, tagging_data_archive,
+                            reviewer_id, decision, cursor, limit + 1),
+        ]
+        merged = union_all(*[select(b) for b in branches]).subquery()
+        rows = db.session.execute(
+            select(merged).order_by(merged.c.reviewed_at.desc(), merged.c.id.desc()).limit(limit + 1)
+        ).mappings().all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        reviews = []
+        for r in rows:
+            item = dict(r)
+            item['reviewed_at'] = r['reviewed_at'].isoformat() if r['reviewed_at'] else None
+            reviews.append(item)
+        last = rows[-1] if rows else None
+        return jsonify({
+            'reviews': reviews,
+            'next_cursor': f"{last['reviewed_at'].isoformat()}|{last['id']}"
+            if has_more and last and last['reviewed_at'] else None
+        })
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': 'server_error', 'details': str(e)}), 500
@@ -270,21 +893,19 @@ def get_upload_sessions():
 
 # ========================= إحصائيات اليوم =========================
 @tagging_bp.route('/daily-stats', methods=['GET'])
+@rate_limit(rate=1, burst=10)
+@concurrency_limit('stats', MAX_CONCURRENT_STATS)
 @admin_required
+@read_replica
 def get_daily_stats():
     try:
         today = datetime.now().date()
-        daily_reviews = db.session.query(func.count(TaggingReview.id))\
-            .filter(TaggingReview.reviewed_at >= today).scalar() or 0
-
-        reviews_with_time = TaggingReview.query\
-            .filter(TaggingReview.time_spent.isnot(None), TaggingReview.reviewed_at >= today).all()
-
-        if reviews_with_time:
-            total_time = sum((getattr(r, 'time_spent', 0) or 0) for r in reviews_with_time)
-            avg_time = round(total_time / len(reviews_with_time), 1) if len(reviews_with_time) else 0
-        else:
-            avg_time = 0
+        reviews = reviews_union('reviewed_at', 'time_spent')
+        daily_reviews, avg_time = db.session.execute(
+            select(func.count(), func.avg(reviews.c.time_spent)).where(reviews.c.reviewed_at >= today)
+        ).one()
+        daily_reviews = daily_reviews or 0
+        avg_time = round(float(avg_time), 1) if avg_time is not None else 0
 
         return jsonify({'daily_reviews': daily_reviews, 'avg_review_time': avg_time})
     except Exception as e:
@@ -294,22 +915,390 @@ def get_daily_stats():
 
 # ========================= إحصائيات المحكّمين =========================
 @tagging_bp.route('/reviewer-stats', methods=['GET'])
+@rate_limit(rate=1, burst=10)
+@concurrency_limit('stats', MAX_CONCURRENT_STATS)
 @admin_required
+@read_replica
 def get_reviewer_stats():
     try:
-        reviewers = User.query.filter_by(user_type='reviewer').all()
+        # استعلام مجمّع واحد على المراجعات الحية والمؤرشفة بدلاً من استعلامين لكل محكّم
+        reviews = reviews_union('reviewer_id', 'decision')
+        per_reviewer = {
+            str(rid): (total, ok) for rid, total, ok in db.session.execute(
+                select(reviews.c.reviewer_id, func.count(),
+                       func.sum(case((reviews.c.decision == 'approve', 1), else_=0)))
+                .group_by(reviews.c.reviewer_id)
+            )
+        }
+        reviewers = db.session.execute(select(User.id, User.username).where(User.user_type == 'reviewer')).all()
         out = []
-        for r in reviewers:
-            rid = getattr(r, 'id', None)
-            total = db.session.query(func.count(TaggingReview.id))\
-                .filter(TaggingReview.reviewer_id == rid).scalar() or 0
-            ok = db.session.query(func.count(TaggingReview.id))\
-                .filter(TaggingReview.reviewer_id == rid, TaggingReview.decision == 'approve').scalar() or 0
+        for rid, username in reviewers:
+            total, ok = per_reviewer.get(str(rid), (0, 0))
             rate = round((ok / total) * 100, 1) if total > 0 else 0
-            out.append({'username': getattr(r, 'username', None), 'review_count': total, 'approval_rate': rate})
+            out.append({'username': username, 'review_count': total, 'approval_rate': rate})
 
         out.sort(key=lambda x: x['review_count'], reverse=True)
         return jsonify(out)
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+# ========================= تحليلات تغيير الوسوم =========================
+@tagging_bp.route('/analytics/tags', methods=['GET'])
+@rate_limit(rate=1, burst=10)
+@concurrency_limit('stats', MAX_CONCURRENT_STATS)
+@admin_required
+def get_tag_analytics():
+    """
+    مصفوفة الالتباس بين الوسوم ونسب الموافقة/الرفض/التعديل لكل وسم (قراءة فقط من الجدول المجمّع؛
+    last_review_id و updated_at يبيّنان حداثتها).
+    """
+    try:
+        return jsonify(tag_analytics_snapshot())
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+@tagging_bp.route('/analytics/tags/refresh', methods=['POST'])
+@admin_required
+def refresh_tag_analytics():
+    """يحتسب المراجعات الجديدة في الخلفية؛ للجدولة الدورية استخدم refresh_tag_analytics.py"""
+    started = refresh_in_background(current_app._get_current_object())
+    return jsonify({'started': started}), 202 if started else 409
+
+
+# ========================= النصوص شبه المكررة =========================
+@tagging_bp.route('/duplicates', methods=['GET'])
+@admin_required
+@read_replica
+def get_duplicate_clusters():
+    """عناقيد التكرار (أكثر من عنصر) بترقيم keyset: ?after=<cluster_id>&limit="""
+    try:
+        limit = _page_limit()
+        after = request.args.get('after', 0, type=int)
+        size = func.count(TextSignature.data_id).label('size')
+        rows = db.session.execute(
+            select(TextSignature.cluster_id, size)
+            .where(TextSignature.cluster_id > after)
+            .group_by(TextSignature.cluster_id)
+            .having(func.count(TextSignature.data_id) > 1)
+            .order_by(TextSignature.cluster_id).limit(limit + 1)
+        ).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        texts = dict(db.session.execute(
+            select(TaggingData.id, TaggingData.text).where(TaggingData.id.in_([r.cluster_id for r in rows]))
+        ).all())
+        return jsonify({
+            'clusters': [{'cluster_id': r.cluster_id, 'size': r.size,
+                          'representative_text': (texts.get(r.cluster_id) or '')[:200]} for r in rows],
+            'next_after': rows[-1].cluster_id if has_more and rows else None
+        })
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+@tagging_bp.route('/duplicates/<int:cluster_id>', methods=['GET'])
+@admin_required
+def get_duplicate_cluster(cluster_id):
+    """أعضاء عنقود واحد"""
+    stmt = select(TaggingData.id, TaggingData.text, TaggingData.tag_en, TaggingData.tag_ar, TaggingData.status)\
+        .join(TextSignature, TextSignature.data_id == TaggingData.id)\
+        .where(TextSignature.cluster_id == cluster_id).order_by(TaggingData.id)
+    return jsonify({'cluster_id': cluster_id, 'members': rows_to_dicts(db.session.execute(stmt))})
+
+
+def _cluster_members(cluster_id):
+    return select(TextSignature.data_id).where(TextSignature.cluster_id == cluster_id,
+                                               TextSignature.data_id != cluster_id)
+
+
+@tagging_bp.route('/duplicates/<int:cluster_id>/collapse', methods=['POST'])
+@admin_required
+def collapse_duplicate_cluster(cluster_id):
+    """يُخرج الأعضاء المعلّقين من الطابور (status=duplicate) ويُبقي الممثل وحده"""
+    ids = db.session.execute(
+        update(TaggingData)
+        .where(TaggingData.id.in_(_cluster_members(cluster_id)), TaggingData.status == 'pending')
+        .values(status='duplicate', version=TaggingData.version + 1, updated_at=datetime.utcnow())
+        .returning(TaggingData.id)
+    ).scalars().all()
+    items_left_queue(ids)
+    db.session.commit()
+    return jsonify({'cluster_id': cluster_id, 'collapsed': len(ids)})
+
+
+@tagging_bp.route('/duplicates/<int:cluster_id>/expand', methods=['POST'])
+@admin_required
+def expand_duplicate_cluster(cluster_id):
+    """يعيد أعضاء العنقود المطويين إلى الطابور"""
+    ids = db.session.execute(
+        update(TaggingData)
+        .where(TaggingData.id.in_(_cluster_members(cluster_id)), TaggingData.status == 'duplicate')
+        .values(status='pending', version=TaggingData.version + 1, updated_at=datetime.utcnow())
+        .returning(TaggingData.id)
+    ).scalars().all()
+    items_entered_queue(ids)
+    db.session.commit()
+    return jsonify({'cluster_id': cluster_id, 'expanded': len(ids)})
+
+
+@tagging_bp.route('/duplicates/reindex', methods=['POST'])
+@admin_required
+@concurrency_limit('uploads', MAX_CONCURRENT_UPLOADS)
+def reindex_duplicates():
+    """يفهرس العناصر التي لا توقيع لها (البيانات السابقة)"""
+    try:
+        return jsonify(index_missing())
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+# ========================= عيّنات التدقيق =========================
+MAX_SAMPLE_PER_STRATUM = 500
+
+@tagging_bp.route('/sample', methods=['GET'])
+@rate_limit(rate=1, burst=10)
+@admin_required
+@read_replica
+def get_sample():
+    """
+    عيّنة عشوائية طبقية: ?n=&by=tag_en|status|dimension:<name>&status=approved&seed=&strata=a,b
+    الكلفة تتبع n (مسح نطاق على فهرس sample_key) وليس حجم الجدول.
+    """
+    n = min(max(request.args.get('n', 20, type=int), 1), MAX_SAMPLE_PER_STRATUM)
+    strata = [v for v in (request.args.get('strata') or '').split(',') if v] or None
+    status = request.args.get('status', 'approved')
+    try:
+        return jsonify(stratified_sample(n, by=request.args.get('by', 'tag_en'),
+                                         status=None if status == 'all' else status,
+                                         seed=request.args.get('seed'), strata=strata))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+@tagging_bp.route('/sample/backfill', methods=['POST'])
+@admin_required
+@concurrency_limit('uploads', MAX_CONCURRENT_UPLOADS)
+def backfill_samples():
+    """يملأ مفاتيح العيّنات للعناصر السابقة لهذه الميزة"""
+    try:
+        return jsonify({'filled': backfill_sample_keys()})
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+# ========================= عمليات جماعية =========================
+@tagging_bp.route('/bulk', methods=['POST'])
+@admin_required
+def create_bulk_job():
+    """
+    {action: set_status|retag|delete, filter: {status, tag_en, uploaded_by, id_min, id_max},
+     params: {...}, dry_run?} ؛ يعيد المهمة (202) وتُتابع عبر GET /bulk/<id>
+    """
+    data = request.get_json() or {}
+    action = data.get('action')
+    filters = data.get('filter') or {}
+    params = data.get('params') or {}
+    try:
+        if data.get('dry_run'):
+            validate_params(action, params)
+            return jsonify({'action': action, 'matched': count_matching(build_conditions(filters))})
+        job = start_bulk_job(current_app._get_current_object(), action, filters, params, session.get('user_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(job.to_dict()), 202
+
+
+@tagging_bp.route('/bulk', methods=['GET'])
+@admin_required
+def list_bulk_jobs():
+    reap_stale_jobs()
+    jobs = BulkJob.query.order_by(BulkJob.id.desc()).limit(_page_limit()).all()
+    return jsonify({'jobs': [j.to_dict() for j in jobs]})
+
+
+@tagging_bp.route('/bulk/<int:job_id>', methods=['GET'])
+@admin_required
+def get_bulk_job(job_id):
+    job = db.session.get(BulkJob, job_id)
+    if not job:
+        return jsonify({'error': 'المهمة غير موجودة'}), 404
+    return jsonify(job.to_dict())
+
+
+@tagging_bp.route('/bulk/<int:job_id>/cancel', methods=['POST'])
+@admin_required
+def cancel_bulk_job(job_id):
+    """يوقف المهمة قبل دفعتها التالية؛ الدفعات المنجزة تبقى"""
+    res = db.session.execute(
+        update(BulkJob).where(BulkJob.id == job_id, BulkJob.status.in_(('queued', 'running')))
+        .values(status='cancelled', finished_at=datetime.utcnow(), updated_at=datetime.utcnow())
+    )
+    db.session.commit()
+    job = db.session.get(BulkJob, job_id)
+    if not job:
+        return jsonify({'error': 'المهمة غير موجودة'}), 404
+    if res.rowcount == 0:
+        return jsonify({'error': 'المهمة منتهية', **job.to_dict()}), 409
+    return jsonify(job.to_dict())
+
+
+# ========================= الأرشفة =========================
+@tagging_bp.route('/archive', methods=['GET'])
+@admin_required
+def get_archive_status():
+    """أحجام الأرشيف"""
+    return jsonify(archive_counts())
+
+
+@tagging_bp.route('/archive/run', methods=['POST'])
+@admin_required
+@concurrency_limit('uploads', MAX_CONCURRENT_UPLOADS)
+def run_archive():
+    """ينقل العناصر المحسومة إلى الأرشيف: {statuses?, older_than_days?, max_batches?}"""
+    data = request.get_json(silent=True) or {}
+    statuses = data.get('statuses') or ['approved']
+    if not isinstance(statuses, list) or 'pending' in statuses:
+        return jsonify({'error': 'حالات غير صالحة للأرشفة'}), 400
+    try:
+        result = archive_settled(statuses, older_than_days=int(data.get('older_than_days') or 0),
+                                 max_batches=data.get('max_batches'))
+        invalidate_strata()
+        return jsonify(result)
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        return jsonify({'error': 'server_error', 'details': str(e)}), 500
+
+
+# ========================= التصدير =========================
+EXPORT_FIELDS = ('id', 'text', 'original_tags', 'tag_en', 'tag_ar', 'status', 'uploaded_at', 'upload_session_id')
+EXPORT_BATCH = 1000
+
+@tagging_bp.route('/export', methods=['GET'])
+@compress(gzip_level=4, brotli_quality=4)  # تصدير كبير: ضغط أخف على المعالج
+@concurrency_limit('exports', MAX_CONCURRENT_EXPORTS)
+@admin_required
+def export_data():
+    """تصدير JSON Lines متدفق للعناصر الحية والمؤرشفة معاً: ?status=&upload_session_id="""
+    status = request.args.get('status')
+    upload_session_id = request.args.get('upload_session_id', type=int)
+    items = data_union(*EXPORT_FIELDS)
+    stmt = select(items).order_by(items.c.id)
+    if status:
+        stmt = stmt.where(items.c.status == status)
+    if upload_session_id is not None:
+        stmt = stmt.where(items.c.upload_session_id == upload_session_id)
+
+    def generate():
+        result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH))
+        # جزء واحد لكل دفعة: أقل عدد من عمليات flush عند الضغط المتدفق
+        for rows in result.mappings().partitions():
+            lines = []
+            for row in rows:
+                item = dict(row)
+                if item['uploaded_at'] is not None:
+                    item['uploaded_at'] = item['uploaded_at'].isoformat()
+                lines.append(json.dumps(item, ensure_ascii=False) + '\n')
+            yield ''.join(lines)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=tagging_export.jsonl'})
+
+
+# ========================= قاموس الوسوم =========================
+@tagging_bp.route('/tags/autocomplete', methods=['GET'])
+@rate_limit(rate=20, burst=40)
+def autocomplete_tags():
+    """اقتراحات من trie في الذاكرة بالإنجليزية أو العربية: ?q=&dimension=&limit="""
+    if 'user_id' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    dimension = request.args.get('dimension')
+    if dimension and dimension not in CATALOG_DIMENSIONS:
+        return jsonify({'error': 'بُعد غير صالح'}), 400
+    limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_SUGGEST)
+    return jsonify({'suggestions': suggest(request.args.get('q', ''), dimension, limit)})
+
+
+@tagging_bp.route('/tags/catalog', methods=['GET'])
+@read_replica
+def list_tag_catalog():
+    """مدخلات القاموس: ?dimension="""
+    if 'user_id' not in session:
+        return jsonify({'error': 'unauthorized'}), 401
+    stmt = select(TagCatalog).order_by(TagCatalog.dimension, TagCatalog.tag_en)
+    if request.args.get('dimension'):
+        stmt = stmt.where(TagCatalog.dimension == request.args['dimension'])
+    return jsonify({'entries': [t.to_dict() for t in db.session.execute(stmt).scalars()],
+                    'status': catalog_status()})
+
+
+def _catalog_fields(data, entry=None):
+    dimension = (data.get('dimension') or (entry.dimension if entry else 'general')).strip()
+    tag_en = (data.get('tag_en') or (entry.tag_en if entry else '')).strip()
+    tag_ar = (data.get('tag_ar') or (entry.tag_ar if entry else '')).strip()
+    if dimension not in CATALOG_DIMENSIONS:
+        raise ValueError('بُعد غير صالح')
+    if not tag_en or not tag_ar:
+        raise ValueError('الحقلان tag_en و tag_ar مطلوبان')
+    return {'dimension': dimension, 'tag_en': tag_en[:200], 'tag_ar': tag_ar[:200]}
+
+
+@tagging_bp.route('/tags/catalog', methods=['POST'])
+@admin_required
+def add_tag_catalog_entry():
+    try:
+        entry = TagCatalog(created_by=session.get('user_id'), **_catalog_fields(request.get_json() or {}))
+        db.session.add(entry)
+        db.session.commit()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'الوسم موجود مسبقاً في هذا البُعد'}), 409
+    invalidate_catalog()
+    return jsonify(entry.to_dict()), 201
+
+
+@tagging_bp.route('/tags/catalog/<int:entry_id>', methods=['PUT'])
+@admin_required
+def update_tag_catalog_entry(entry_id):
+    entry = db.session.get(TagCatalog, entry_id)
+    if not entry:
+        return jsonify({'error': 'المدخل غير موجود'}), 404
+    try:
+        for k, v in _catalog_fields(request.get_json() or {}, entry).items():
+            setattr(entry, k, v)
+        db.session.commit()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'الوسم موجود مسبقاً في هذا البُعد'}), 409
+    invalidate_catalog()
+    return jsonify(entry.to_dict())
+
+
+@tagging_bp.route('/tags/catalog/<int:entry_id>', methods=['DELETE'])
+@admin_required
+def delete_tag_catalog_entry(entry_id):
+    entry = db.session.get(TagCatalog, entry_id)
+    if not entry:
+        return jsonify({'error': 'المدخل غير موجود'}), 404
+    db.session.delete(entry)
+    db.session.commit()
+    invalidate_catalog()
+    return jsonify({'deleted': entry_id})
@@ -1,13 +1,16 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, send_file
+from sqlalchemy import insert, update, func, or_
+from sqlalchemy.orm import joinedload
 from src.models.user import User, Sentence, Annotation, ContactMessage, db
-from .decorators import admin_required
-import csv
-import os
-import json
-import chardet
-import io
+from src.models.tagging import UploadSession
+from src.utils.csv_stream import iter_sentence_chunks
+from src.utils.fields import requested_fields, projection, rows_to_dicts
+from src.utils.rate_limit import limits_snapshot
+from src.utils.profiler import issue_token, list_profiles, profile_file
+from .decorators import admin_required, read_replica
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timedelta
+import os
 import traceback
 
 user_bp = Blueprint('user', __name__)
@@ -85,22 +88,17 @@ def get_all_users_legacy():
     # مسار قديم إن كان مستخدماً في الواجهة
     return get_users()
 
+USER_FIELDS = ('id', 'username', 'email', 'user_type', 'created_by', 'created_at')
+USER_OPT_IN = ('created_by',)
+
 @user_bp.route('/users', methods=['GET'])
 @admin_required
+@read_replica
 def get_users():
     """جلب قائمة المستخدمين (للآدمن فقط) مع معالجة أخطاء واضحة"""
     try:
-        users = User.query.all()
-        out = []
-        for u in users:
-            out.append({
-                'id': getattr(u, 'id', None),
-                'username': getattr(u, 'username', None),
-                'email': getattr(u, 'email', None),
-                'user_type': getattr(u, 'user_type', None),
-                'created_at': (u.created_at.isoformat() if getattr(u, 'created_at', None) else None)
-            })
-        return jsonify(out)
+        fields = requested_fields(USER_FIELDS, USER_OPT_IN)
+        return jsonify(rows_to_dicts(db.session.execute(projection(User, fields))))
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': 'server_error', 'details': str(e)}), 500
@@ -144,8 +142,12 @@ def delete_user_by_admin(user_id):
     db.session.commit()
     return {"message": "تم حذف المستخدم بنجاح"}
 
-# ========== رفع CSV القديم (متروك كما هو إن كان مستخدماً) ==========
+# ========== رفع CSV القديم (بث على دفعات) ==========
+UPLOAD_CHUNK_SIZE = 1000  # عدد الجمل في كل إدراج متعدد
+CSV_UPLOAD_MAX_MB = int(os.getenv('CSV_UPLOAD_MAX_MB', '0'))  # 0 = بلا حد (الرفع ببث لا يحمّل الملف في الذاكرة)
+
 @user_bp.route('/upload', methods=['POST'])
+@admin_required
 def upload_csv():
     try:
         if 'file' not in request.files:
@@ -160,38 +162,82 @@ def upload_csv():
 
         stream = file.stream
         stream.seek(0, os.SEEK_END)
-        if stream.tell() > 5 * 1024 * 1024:
-            return {"detail": "حجم الملف يتجاوز الحد المسموح (5MB)"}, 400
-        stream.seek(0)
-        sample = stream.read(1024)
-        enc = (chardet.detect(sample) or {}).get('encoding') or 'utf-8'
+        total_bytes = stream.tell()
+        if CSV_UPLOAD_MAX_MB and total_bytes > CSV_UPLOAD_MAX_MB * 1024 * 1024:
+            return {"detail": f"حجم الملف يتجاوز الحد المسموح ({CSV_UPLOAD_MAX_MB}MB)"}, 413
         stream.seek(0)
-        text_stream = io.TextIOWrapper(stream, encoding=enc, errors='ignore')
-        reader = csv.DictReader(text_stream)
 
-        sentences_added = 0
-        for row in reader:
-            if 'text' in row:
-                s = Sentence(text=row['text'])
-                tags = {k: v for k, v in row.items() if k != 'text' and v}
-                if tags:
-                    s.original_tags_json = json.dumps(tags, ensure_ascii=False)
-                db.session.add(s)
-                for k, v in tags.items():
-                    a = Annotation(sentence=s, tag_key=k, tag_value=v)
-                    db.session.add(a)
-                sentences_added += 1
+        # جلسة رفع لمتابعة التقدم من طلبات أخرى أثناء المعالجة: عدد السطور غير معروف قبل نهاية
+        # الملف، فالتقدم بالبايتات المقروءة (bytes_received / total_bytes) وtotal_records يُضبط في النهاية
+        upload_session = UploadSession(filename=secure_filename(file.filename), kind='sentences',
+                                       uploaded_by=session.get('user_id'), status='processing',
+                                       total_bytes=total_bytes, bytes_received=0)
+        db.session.add(upload_session)
+        db.session.commit()
 
+        sentences_added = 0
+        try:
+            for sentences, annotations in iter_sentence_chunks(stream, UPLOAD_CHUNK_SIZE):
+                db.session.execute(insert(Sentence), sentences)
+                if annotations:
+                    db.session.execute(insert(Annotation), annotations)
+                sentences_added += len(sentences)
+                upload_session.processed_records = sentences_added
+                upload_session.bytes_received = min(stream.tell(), total_bytes)
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            upload_session.status = 'failed'
+            upload_session.error_log = f"توقف بعد {sentences_added} جملة: {str(e)}"
+            db.session.commit()
+            raise
+
+        upload_session.status = 'completed'
+        upload_session.total_records = sentences_added
+        upload_session.bytes_received = total_bytes
         db.session.commit()
-        return {"message": f"تم رفع {sentences_added} جملة بنجاح"}
+        return {"message": f"تم رفع {sentences_added} جملة بنجاح", "session_id": upload_session.id}
     except Exception as e:
         traceback.print_exc()
         return {"detail": f"خطأ: {str(e)}"}, 400
 
 # ========== المراجعات والإحصائيات / الرسائل ==========
+PENDING_BATCH_SIZE = 50
+LEASE_TTL = timedelta(minutes=15)
+
+def _lease_annotations(user_id, now, limit):
+    """يحجز للمحكّم حتى limit وسماً غير محجوز (أو انتهى حجزه)"""
+    free = or_(Annotation.lease_expires_at.is_(None), Annotation.lease_expires_at < now)
+    candidate_ids = [row[0] for row in db.session.query(Annotation.id)
+                     .filter(Annotation.is_correct.is_(None), free)
+                     .limit(limit)
+                     .with_for_update(skip_locked=True)
+                     .all()]
+    if not candidate_ids:
+        return
+    # compare-and-set: لو سبقنا محكّم آخر إلى صف ما فلن يتحدث
+    db.session.execute(
+        update(Annotation)
+        .where(Annotation.id.in_(candidate_ids), free)
+        .values(leased_by=user_id, lease_expires_at=now + LEASE_TTL)
+    )
+    db.session.commit()
+
 @user_bp.route('/review/pending', methods=['GET'])
 def get_pending_reviews():
-    pending = Annotation.query.filter_by(is_correct=None).limit(50).all()
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'unauthorized'}), 401
+
+    now = datetime.utcnow()
+    mine = (Annotation.leased_by == user_id) & (Annotation.lease_expires_at >= now) & Annotation.is_correct.is_(None)
+
+    held = db.session.query(func.count(Annotation.id)).filter(mine).scalar() or 0
+    if held < PENDING_BATCH_SIZE:
+        _lease_annotations(user_id, now, PENDING_BATCH_SIZE - held)
+
+    pending = Annotation.query.options(joinedload(Annotation.sentence))\
+        .filter(mine).limit(PENDING_BATCH_SIZE).all()
     result = []
     for a in pending:
         result.append({
@@ -199,7 +245,8 @@ def get_pending_reviews():
                 'id': a.id, 'tag_key': a.tag_key, 'tag_value': a.tag_value,
                 'is_correct': a.is_correct
             },
-            'sentence': {'id': a.sentence.id, 'text': a.sentence.text}
+            'sentence': {'id': a.sentence.id, 'text': a.sentence.text},
+            'lease_expires_at': a.lease_expires_at.isoformat() if a.lease_expires_at else None
         })
     return jsonify(result)
 
@@ -214,10 +261,13 @@ def submit_review(annotation_id):
     annotation.reviewer_comment = comment
     annotation.reviewer_id = session.get('user_id')
     annotation.reviewed_at = datetime.utcnow()
+    annotation.leased_by = None
+    annotation.lease_expires_at = None
     db.session.commit()
     return {"message": "تم حفظ المراجعة بنجاح"}
 
 @user_bp.route('/stats', methods=['GET'])
+@read_replica
 def get_statistics():
     total_sentences = Sentence.query.count()
     total_annotations = Annotation.query.count()
@@ -249,18 +299,16 @@ def submit_contact():
     print(f"[CONTACT] to admin: {sender_name} <{sender_email}> :: {message}")
     return {"message": "تم إرسال رسالتك بنجاح"}
 
+CONTACT_MESSAGE_FIELDS = ('id', 'sender_name', 'sender_email', 'message', 'is_read', 'created_at')
+CONTACT_MESSAGE_OPT_IN = ('message',)  # نص الرسالة كبير: ?fields=...,message عند الحاجة
+
 @user_bp.route('/admin/messages', methods=['GET'])
 @admin_required
+@read_replica
 def get_contact_messages():
-    messages = ContactMessage.query.order_by(ContactMessage.created_at.desc()).all()
-    out = []
-    for m in messages:
-        out.append({
-            'id': m.id, 'sender_name': m.sender_name, 'sender_email': m.sender_email,
-            'message': m.message, 'is_read': m.is_read,
-            'created_at': (m.created_at.isoformat() if m.created_at else None)
-        })
-    return jsonify(out)
+    fields = requested_fields(CONTACT_MESSAGE_FIELDS, CONTACT_MESSAGE_OPT_IN)
+    stmt = projection(ContactMessage, fields).order_by(ContactMessage.created_at.desc())
+    return jsonify(rows_to_dicts(db.session.execute(stmt)))
 
 @user_bp.route('/admin/messages/<message_id>/read', methods=['POST'])
 @admin_required
@@ -269,3 +317,30 @@ def mark_message_read(message_id):
     message.is_read = True
     db.session.commit()
     return {"message": "تم تحديد الرسالة كمقروءة"}
+
+@user_bp.route('/admin/limits', methods=['GET'])
+@admin_required
+def get_limits():
+    """حالة محددات المعدل والتزامن في هذه العملية"""
+    return jsonify(limits_snapshot())
+
+@user_bp.route('/admin/profiles', methods=['GET'])
+@admin_required
+def get_profiles():
+    """تحليلات الطلبات المحفوظة (زمن الطلب، زمن SQL، عدد العينات)"""
+    return jsonify(list_profiles())
+
+@user_bp.route('/admin/profiles/token', methods=['POST'])
+@admin_required
+def create_profile_token():
+    """رمز لمرة واحدة: يُرسل في ترويسة X-Profile-Token مع الطلب المراد تحليله"""
+    return jsonify(issue_token(session.get('user_id'))), 201
+
+@user_bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def download_profile(profile_id):
+    """ملف folded stacks جاهز لـ flamegraph.pl أو speedscope"""
+    path = profile_file(profile_id)
+    if not path:
+        return jsonify({'error': 'التحليل غير موجود'}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=f'{profile_id}.folded')
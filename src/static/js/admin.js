@@ -49,27 +49,86 @@ async function loadStats() {
 
 async function loadUploadSessions() {
   try {
-    const r = await fetch('/api/tagging/upload-sessions');
+    const r = await fetch('/api/tagging/upload-sessions?limit=10');
     if (!r.ok) return;
-    const list = await r.json();
+    const list = (await r.json()).sessions || [];
     const box = document.getElementById('uploadSessionsList');
     if (!box) return;
-    box.innerHTML = (list.slice(0, 10).map(s => `
+    box.innerHTML = (list.map(s => `
       <div class="upload-session-item">
-        <div><b>#${s.id}</b> — ${escapeHtml(s.filename || '')}</div>
+        <div><b>#${s.id}</b> — ${escapeHtml(s.filename || '')}${s.source_sheet ? ' / ' + escapeHtml(s.source_sheet) : ''}</div>
         <div>الإجمالي: ${s.total_records ?? 0} | ناجح: ${s.processed_records ?? 0} | فشل: ${s.failed_records ?? 0}</div>
         <div>الحالة: ${escapeHtml(s.status || '')} | ${s.uploaded_at ? new Date(s.uploaded_at).toLocaleString('ar') : ''}</div>
-        ${s.error_log ? `<pre class="err">${escapeHtml(s.error_log)}</pre>` : ``}
+        ${s.failed_records ? `<button class="page-btn errors-btn" data-id="${s.id}">عرض الأخطاء</button><pre class="err" id="errors-${s.id}" style="display:none"></pre>` : ``}
       </div>
     `).join('')) || '<em>لا توجد جلسات</em>';
+    $$('.errors-btn', box).forEach(b => b.addEventListener('click', () => loadUploadErrors(b.getAttribute('data-id'))));
   } catch (e) { console.warn('upload-sessions:', e); }
 }
 
+async function loadUploadErrors(sessionId) {
+  const pre = document.getElementById('errors-' + sessionId);
+  if (!pre) return;
+  try {
+    const r = await fetch(`/api/tagging/upload-sessions/${sessionId}/errors?limit=50`);
+    if (!r.ok) return;
+    const data = await r.json();
+    pre.textContent = (data.errors || [])
+      .map(e => `السطر ${e.row_number ?? '-'}${e.column ? ' [' + e.column + ']' : ''}: ${e.message}`)
+      .join('\n') + (data.next_after ? '\n…' : '');
+    show(pre, true);
+  } catch (e) { console.warn('upload-errors:', e); }
+}
+
 async function refreshDashboard() {
   await Promise.all([loadStats(), loadUploadSessions()]);
 }
 
 // ================ رفع الملف ================
+async function sha256Hex(buf) {
+  if (!window.crypto?.subtle) return '';
+  const h = await crypto.subtle.digest('SHA-256', buf);
+  return [...new Uint8Array(h)].map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// رفع مجزّأ قابل للاستئناف: init -> PUT لكل جزء -> finalize (يعيد Response الأخير)
+async function chunkedUpload(file, onProgress) {
+  const init = await fetch('/api/tagging/uploads', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, total_size: file.size })
+  });
+  if (!init.ok) return init;
+  let state = await init.json();
+  let retries = 0;
+
+  while (state.bytes_received < state.total_bytes) {
+    const start = state.bytes_received;
+    const chunk = await file.slice(start, start + state.chunk_size).arrayBuffer();
+    const r = await fetch(`/api/tagging/uploads/${state.session_id}?offset=${start}`, {
+      method: 'PUT',
+      headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': await sha256Hex(chunk) },
+      body: chunk
+    }).catch(() => null);
+
+    if (r && r.ok) {
+      state = await r.json();
+      retries = 0;
+    } else {
+      if (++retries > 5) {
+        if (r) return r;
+        throw new Error('upload interrupted');
+      }
+      await new Promise(res => setTimeout(res, 1000 * retries));
+      // استئناف من آخر ما وصل فعلاً إلى الخادم
+      const s = await fetch(`/api/tagging/uploads/${state.session_id}`).catch(() => null);
+      if (s && s.ok) state = await s.json();
+    }
+    if (onProgress) onProgress(state.bytes_received / state.total_bytes);
+  }
+  return fetch(`/api/tagging/uploads/${state.session_id}/finalize`, { method: 'POST' });
+}
+
 function wireUpload() {
   const input = document.getElementById('csvFile');
   const btn = document.getElementById('uploadBtn');
@@ -110,18 +169,16 @@ function wireUpload() {
     const f = input.files?.[0];
     if (!f) { setMsg('اختر ملفًا أولاً', false); return; }
 
-    const fd = new FormData();
-    fd.append('file', f);
-
     inFlight = true;
     btn.disabled = true;
     show(prog, true);
-    setProgress(15, 'بدء الرفع...');
+    setProgress(5, 'بدء الرفع...');
     setMsg('', true);
 
     try {
-      setTimeout(() => setProgress(45, 'جارٍ الرفع...'), 250);
-      const res = await fetch('/api/tagging/upload-csv', { method: 'POST', body: fd });
+      const res = await chunkedUpload(f, p => {
+        setProgress(5 + Math.round(p * 85), p < 1 ? 'جارٍ الرفع...' : 'جارٍ المعالجة...');
+      });
       const txt = await res.text();
       let data; try { data = JSON.parse(txt); } catch {}
 
@@ -180,9 +237,9 @@ async function loadReviewData(page) {
               <span class="tag tag-ar">${escapeHtml(item.tag_ar || '')}</span>
             </div>
             <div class="review-actions">
-              <button class="save-btn" data-id="${item.id}" data-decision="approve">موافقة</button>
-              <button class="save-btn" data-id="${item.id}" data-decision="modify">تعديل</button>
-              <button class="cancel-btn" data-id="${item.id}" data-decision="reject">رفض</button>
+              <button class="save-btn" data-id="${item.id}" data-version="${item.version ?? ''}" data-decision="approve">موافقة</button>
+              <button class="save-btn" data-id="${item.id}" data-version="${item.version ?? ''}" data-decision="modify">تعديل</button>
+              <button class="cancel-btn" data-id="${item.id}" data-version="${item.version ?? ''}" data-decision="reject">رفض</button>
             </div>
           </div>
         `).join('');
@@ -219,7 +276,8 @@ async function loadReviewData(page) {
       btn.addEventListener('click', async () => {
         const id = Number(btn.getAttribute('data-id'));
         const decision = btn.getAttribute('data-decision');
-        await submitReview(id, decision);
+        const version = btn.getAttribute('data-version');
+        await submitReview(id, decision, version ? Number(version) : undefined);
       });
     });
 
@@ -229,14 +287,21 @@ async function loadReviewData(page) {
   }
 }
 
-async function submitReview(dataId, decision) {
+async function submitReview(dataId, decision, version) {
   try {
     const payload = { data_id: dataId, decision };
+    if (version !== undefined) payload.version = version;
     const r = await fetch('/api/tagging/review', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(payload)
     });
+    if (r.status === 409) {
+      // عدّله محكّم آخر منذ التحميل: نعرض الحالة الحالية بدل الكتابة فوقه
+      alert('تم تعديل هذا العنصر من محكّم آخر، أُعيد تحميل القائمة');
+      await loadReviewData(reviewState.page);
+      return;
+    }
     if (!r.ok) {
       const t = await r.text(); throw new Error(t || ('HTTP ' + r.status));
     }
@@ -1,7 +1,7 @@
 // متغيرات عامة
 let currentReviewData = null;
 let reviewStartTime = null;
-let currentPage = 1;
+let historyCursor = null;  // مؤشر الصفحة التالية في السجل
 
 // تهيئة الصفحة
 document.addEventListener('DOMContentLoaded', function() {
@@ -20,6 +20,10 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // تهيئة اختصارات لوحة المفاتيح
     initKeyboardShortcuts();
+    
+    // اقتراح الوسوم من القاموس في نموذج التعديل
+    wireTagAutocomplete('newTagEn', 'tagSuggestEn', 'tag_en', 'newTagAr', 'tag_ar');
+    wireTagAutocomplete('newTagAr', 'tagSuggestAr', 'tag_ar', 'newTagEn', 'tag_en');
 });
 
 // التحقق من الجلسة
@@ -139,6 +143,7 @@ function quickDecision(decision) {
     
     const reviewData = {
         data_id: currentReviewData.id,
+        version: currentReviewData.version,
         decision: decision,
         confidence: parseInt(document.getElementById('confidence').value),
         time_spent: reviewStartTime ? Math.floor((Date.now() - reviewStartTime) / 1000) : null
@@ -175,6 +180,7 @@ function submitModification() {
     
     const reviewData = {
         data_id: currentReviewData.id,
+        version: currentReviewData.version,
         decision: 'modify',
         new_tag_en: newTagEn,
         new_tag_ar: newTagAr,
@@ -201,6 +207,10 @@ function submitReview(reviewData) {
             showMessage('تم إرسال المراجعة بنجاح', 'success');
             loadNextReview();
             updateTodayCount();
+        } else if (data.error === 'conflict') {
+            // عدّله محكّم آخر منذ العرض: نعيد التحميل بدل الكتابة فوقه
+            showMessage(data.message, 'error');
+            loadReviewData();
         } else {
             showMessage(data.error, 'error');
         }
@@ -244,14 +254,16 @@ function loadProgress() {
         });
 }
 
-// تحميل السجل
-function loadHistory() {
+// تحميل السجل (append لتحميل الصفحة التالية بالمؤشر)
+function loadHistory(append = false) {
     const filter = document.getElementById('historyFilter').value;
+    if (!append) historyCursor = null;
+    const cursorParam = historyCursor ? `&cursor=${encodeURIComponent(historyCursor)}` : '';
     
-    fetch(`/api/tagging/reviews?filter=${filter}&page=${currentPage}`)
+    fetch(`/api/tagging/reviews?filter=${filter}${cursorParam}`)
         .then(response => response.json())
         .then(data => {
-            displayHistory(data);
+            displayHistory(data, append);
         })
         .catch(error => {
             console.error('خطأ في تحميل السجل:', error);
@@ -260,12 +272,14 @@ function loadHistory() {
 }
 
 // عرض السجل
-function displayHistory(data) {
+function displayHistory(data, append = false) {
     const container = document.getElementById('historyList');
-    container.innerHTML = '';
+    const moreButton = document.getElementById('historyMore');
+    if (moreButton) moreButton.remove();
+    if (!append) container.innerHTML = '';
     
     if (!data || !data.reviews || data.reviews.length === 0) {
-        container.innerHTML = '<p class="no-data">لا توجد مراجعات في السجل</p>';
+        if (!append) container.innerHTML = '<p class="no-data">لا توجد مراجعات في السجل</p>';
         return;
     }
     
@@ -290,6 +304,53 @@ function displayHistory(data) {
         `;
         container.appendChild(reviewElement);
     });
+
+    historyCursor = data.next_cursor || null;
+    if (historyCursor) {
+        const button = document.createElement('button');
+        button.id = 'historyMore';
+        button.className = 'next-btn';
+        button.textContent = 'عرض المزيد';
+        button.onclick = () => loadHistory(true);
+        container.appendChild(button);
+    }
+}
+
+// اقتراح الوسوم: عند اختيار اقتراح يُكمل الحقل الآخر من الزوج المعتمد
+let tagSuggestions = [];
+
+function wireTagAutocomplete(inputId, listId, field, otherId, otherField) {
+    const input = document.getElementById(inputId);
+    const list = document.getElementById(listId);
+    if (!input || !list) return;
+    
+    input.addEventListener('input', function() {
+        const q = input.value.trim();
+        const picked = tagSuggestions.find(s => s[field] === q);
+        if (picked) {
+            document.getElementById(otherId).value = picked[otherField];
+            return;
+        }
+        if (!q) {
+            list.innerHTML = '';
+            return;
+        }
+        fetch(`/api/tagging/tags/autocomplete?q=${encodeURIComponent(q)}`)
+            .then(response => response.json())
+            .then(data => {
+                tagSuggestions = data.suggestions || [];
+                list.innerHTML = '';
+                tagSuggestions.forEach(s => {
+                    const option = document.createElement('option');
+                    option.value = s[field];
+                    option.textContent = s[otherField];
+                    list.appendChild(option);
+                });
+            })
+            .catch(error => {
+                console.error('خطأ في اقتراح الوسوم:', error);
+            });
+    });
 }
 
 // تهيئة النماذج
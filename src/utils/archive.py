@@ -0,0 +1,130 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Sequence
+
+from sqlalchemy import select, insert, delete, literal, union_all, func
+
+from src.models.user import db
+from src.models.tagging import TaggingData, TaggingReview, DeletedItem
+from src.models.archive import tagging_data_archive, tagging_reviews_archive
+
+ARCHIVE_BATCH = 1000
+SETTLED_STATUSES = ('approved',)
+
+
+def data_union(*names: str):
+    """tagging_data الحي + الأرشيف كجدول فرعي واحد بالأعمدة المطلوبة"""
+    live = TaggingData.__table__
+    return union_all(
+        select(*[live.c[n] for n in names]),
+        select(*[tagging_data_archive.c[n] for n in names]),
+    ).subquery('tagging_data_all')
+
+
+def reviews_union(*names: str):
+    """tagging_reviews الحي + الأرشيف كجدول فرعي واحد بالأعمدة المطلوبة"""
+    live = TaggingReview.__table__
+    return union_all(
+        select(*[live.c[n] for n in names]),
+        select(*[tagging_reviews_archive.c[n] for n in names]),
+    ).subquery('tagging_reviews_all')
+
+
+def _move(source, target, where) -> int:
+    """
+    INSERT … SELECT ثم DELETE لنفس الصفوف داخل المعاملة الحالية.
+    المعرفات تُختار وتُقفل مرة واحدة: صف يطابق الشرط ويُثبَّت بين العبارتين (READ COMMITTED)
+    لا يُحذف دون أرشفة، ولا يتغيّر صف مُختار قبل حذفه.
+    """
+    ids = db.session.execute(select(source.c.id).where(where).with_for_update()).scalars().all()
+    if not ids:
+        return 0
+    names = [c.name for c in source.columns]
+    db.session.execute(
+        insert(target).from_select(names + ['archived_at'],
+                                   select(*source.columns, literal(datetime.utcnow())).where(source.c.id.in_(ids)))
+    )
+    return db.session.execute(delete(source).where(source.c.id.in_(ids))).rowcount
+
+
+def archive_settled(statuses: Sequence[str] = SETTLED_STATUSES, older_than_days: int = 0,
+                    batch_size: int = ARCHIVE_BATCH, max_batches: Optional[int] = None) -> Dict[str, int]:
+    """
+    ينقل العناصر المحسومة (ومراجعاتها) من الجداول الحية إلى الأرشيف على دفعات قصيرة،
+    كل دفعة في معاملة مستقلة حتى لا تُحجز الجداول الحية طويلاً.
+    العناصر المنقولة تخرج من فهرس التكرار (يُرقّى ممثل جديد لعناقيدها).
+    """
+    from src.utils.near_dup import forget_items  # استيراد متأخر: near_dup يستورد reviewer_progress الذي يستورد هذه الوحدة
+    live_data = TaggingData.__table__
+    live_reviews = TaggingReview.__table__
+    conds = [live_data.c.status.in_(statuses)]
+    if older_than_days > 0:
+        conds.append(live_data.c.uploaded_at <= datetime.utcnow() - timedelta(days=older_than_days))
+
+    moved_items = moved_reviews = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.session.execute(
+            select(live_data.c.id)
+            .where(*conds)
+            .order_by(live_data.c.id).limit(batch_size)
+            .with_for_update()
+        ).scalars().all()
+        if not ids:
+            break
+
+        forget_items(ids)
+        moved_reviews += _move(live_reviews, tagging_reviews_archive, live_reviews.c.data_id.in_(ids))
+        moved_items += _move(live_data, tagging_data_archive, live_data.c.id.in_(ids))
+        db.session.commit()
+        batches += 1
+
+    return {'archived_items': moved_items, 'archived_reviews': moved_reviews, 'batches': batches}
+
+
+def archive_counts() -> Dict[str, int]:
+    return {
+        'archived_items': db.session.execute(select(func.count()).select_from(tagging_data_archive)).scalar() or 0,
+        'archived_reviews': db.session.execute(select(func.count()).select_from(tagging_reviews_archive)).scalar() or 0,
+    }
+
+
+def status_counts(upload_session_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    عدد العناصر لكل حالة في الجدول الحي والأرشيف معاً (تجميع على كل جدول بفهرسه)،
+    اختيارياً ضمن دفعة رفع واحدة.
+    """
+    out: Dict[str, int] = {}
+    for table in (TaggingData.__table__, tagging_data_archive):
+        stmt = select(table.c.status, func.count()).group_by(table.c.status)
+        if upload_session_id is not None:
+            stmt = stmt.where(table.c.upload_session_id == upload_session_id)
+        for status, n in db.session.execute(stmt):
+            out[status] = out.get(status, 0) + n
+    return out
+
+
+def purge_archived_session(upload_session_id: int, batch_size: int = ARCHIVE_BATCH,
+                           on_batch: Optional[Callable[[], None]] = None) -> Dict[str, int]:
+    """
+    يحذف من الأرشيف عناصر دفعة رفع ومراجعاتها على دفعات (جزء من التراجع عن الدفعة).
+    on_batch: يُستدعى داخل معاملة كل دفعة قبل commit (نبض المهمة المستدعية).
+    """
+    from src.utils.tag_analytics import forget_reviews  # استيراد متأخر: tag_analytics يستورد هذه الوحدة
+    items = reviews = 0
+    while True:
+        ids = db.session.execute(
+            select(tagging_data_archive.c.id)
+            .where(tagging_data_archive.c.upload_session_id == upload_session_id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return {'archived_items': items, 'archived_reviews': reviews}
+        forget_reviews(ids)
+        reviews += db.session.execute(
+            delete(tagging_reviews_archive).where(tagging_reviews_archive.c.data_id.in_(ids))).rowcount
+        db.session.execute(insert(DeletedItem), [{'data_id': i} for i in ids])
+        items += db.session.execute(
+            delete(tagging_data_archive).where(tagging_data_archive.c.id.in_(ids))).rowcount
+        if on_batch is not None:
+            on_batch()
+        db.session.commit()
@@ -0,0 +1,216 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, update, delete, insert, func
+
+from src.models.user import db
+from src.models.tagging import TaggingData, TaggingReview, ItemVote, DeletedItem, get_arabic_tag
+from src.models.jobs import BulkJob
+from src.utils.tag_analytics import forget_reviews
+from src.utils.reviewer_progress import (invalidate_pending_items, drop_reviewer_progress, items_left_queue,
+                                         lower_scan_from)
+from src.utils.datasets import finish_session_rollback
+from src.utils.near_dup import forget_items
+from src.utils.sampling import invalidate_strata
+
+BULK_BATCH = int(os.getenv('BULK_BATCH_SIZE', '500'))
+MAX_RUNNING_JOBS = int(os.getenv('MAX_BULK_JOBS', '1'))
+# مهمة لم تُحدّث updated_at (نبضها بعد كل دفعة) خلال هذه المدة تُعدّ ميتة: مات خيطها مع العامل
+JOB_STALE = int(os.getenv('BULK_JOB_STALE_SECONDS', '900'))
+ACTIONS = ('set_status', 'retag', 'delete')
+STATUSES = ('pending', 'reviewed', 'approved', 'rejected', 'duplicate')
+
+
+def build_conditions(filters: Dict[str, Any]) -> List:
+    """شروط WHERE من الفلتر؛ فلتر فارغ مرفوض حتى لا يطال الجدول كله خطأً"""
+    conds = []
+    if filters.get('status'):
+        conds.append(TaggingData.status == filters['status'])
+    if filters.get('tag_en'):
+        conds.append(TaggingData.tag_en == filters['tag_en'])
+    if filters.get('upload_session_id') is not None:
+        conds.append(TaggingData.upload_session_id == int(filters['upload_session_id']))
+    if filters.get('uploaded_by') is not None:
+        conds.append(TaggingData.uploaded_by == filters['uploaded_by'])
+    if filters.get('id_min') is not None:
+        conds.append(TaggingData.id >= int(filters['id_min']))
+    if filters.get('id_max') is not None:
+        conds.append(TaggingData.id <= int(filters['id_max']))
+    if not conds:
+        raise ValueError('يجب تحديد فلتر واحد على الأقل')
+    return conds
+
+
+def validate_params(action: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    if action not in ACTIONS:
+        raise ValueError('إجراء غير مدعوم')
+    if action == 'set_status':
+        if params.get('status') not in STATUSES:
+            raise ValueError('حالة غير صالحة')
+        return {'status': params['status']}
+    if action == 'retag':
+        tag_en = (params.get('tag_en') or '').strip()
+        if not tag_en:
+            raise ValueError('الحقل tag_en مطلوب')
+        return {'tag_en': tag_en[:100], 'tag_ar': (params.get('tag_ar') or get_arabic_tag(tag_en))[:100]}
+    return {}
+
+
+def count_matching(conds: List) -> int:
+    return db.session.execute(select(func.count(TaggingData.id)).where(*conds)).scalar() or 0
+
+
+def _apply_batch(action: str, params: Dict[str, Any], ids: List[int], conds: List) -> int:
+    """ينفّذ الإجراء على دفعة واحدة بعبارات set-based (دون commit)؛ يعيد عدد الصفوف المتأثرة"""
+    # إعادة التحقق من الفلتر: ما تغيّر منذ اختيار الدفعة لا يُمس
+    where = [TaggingData.id.in_(ids), *conds]
+    if action == 'set_status':
+        values = {'status': params['status'], 'version': TaggingData.version + 1, 'updated_at': datetime.utcnow()}
+        if params['status'] == 'pending':
+            # إعادة للطابور: إجماع ومراجعات من الصفر. سجل المراجعات يبقى لكنه لا يُحتسب بعد requeue_review_id،
+            # وخرائط من راجعوها تُعاد بناؤها فيعود العنصر إلى طوابيرهم.
+            ids = db.session.execute(select(TaggingData.id).where(*where)).scalars().all()
+            if not ids:
+                return 0
+            where = [TaggingData.id.in_(ids)]
+            reviewers = db.session.execute(
+                select(TaggingReview.reviewer_id).where(TaggingReview.data_id.in_(ids)).distinct()
+            ).scalars().all()
+            values.update(consensus_state=None, review_count=0, last_reviewed_at=None, last_decision=None,
+                          requeue_review_id=db.session.execute(select(func.max(TaggingReview.id))).scalar() or 0)
+            db.session.execute(delete(ItemVote).where(ItemVote.data_id.in_(ids)))
+            drop_reviewer_progress(reviewers)
+            lower_scan_from(min(ids))
+        else:
+            # المعلّق منها يخرج من طوابير من راجعوه
+            items_left_queue(db.session.execute(
+                select(TaggingData.id).where(*where, TaggingData.status == 'pending')).scalars().all())
+        return db.session.execute(update(TaggingData).where(*where).values(**values)).rowcount
+
+    if action == 'retag':
+        return db.session.execute(
+            update(TaggingData).where(*where).values(tag_en=params['tag_en'], tag_ar=params['tag_ar'],
+                                                      version=TaggingData.version + 1, updated_at=datetime.utcnow())
+        ).rowcount
+
+    # delete: العنصر وكل ما يتبعه، مع إبقاء العدادات المشتقة متسقة
+    ids = db.session.execute(select(TaggingData.id).where(*where)).scalars().all()
+    if not ids:
+        return 0
+    reviewers = db.session.execute(
+        select(TaggingReview.reviewer_id).where(TaggingReview.data_id.in_(ids)).distinct()
+    ).scalars().all()
+    forget_reviews(ids)
+    db.session.execute(delete(TaggingReview).where(TaggingReview.data_id.in_(ids)))
+    db.session.execute(delete(ItemVote).where(ItemVote.data_id.in_(ids)))
+    forget_items(ids)
+    drop_reviewer_progress(reviewers)
+    db.session.execute(insert(DeletedItem), [{'data_id': i} for i in ids])
+    return db.session.execute(delete(TaggingData).where(TaggingData.id.in_(ids))).rowcount
+
+
+def _heartbeat(job_id: int) -> None:
+    """يحدّث نبض المهمة داخل معاملة الدفعة الحالية (دون commit)"""
+    db.session.execute(
+        update(BulkJob).where(BulkJob.id == job_id, BulkJob.status == 'running')
+        .values(updated_at=datetime.utcnow())
+    )
+
+
+def reap_stale_jobs() -> int:
+    """يعلّم failed المهام الجارية التي توقف نبضها أكثر من JOB_STALE ثانية حتى لا تحجز MAX_RUNNING_JOBS"""
+    now = datetime.utcnow()
+    res = db.session.execute(
+        update(BulkJob)
+        .where(BulkJob.status.in_(('queued', 'running')), BulkJob.updated_at < now - timedelta(seconds=JOB_STALE))
+        .values(status='failed', error='توقفت المهمة دون إكمال (انتهى العامل أثناء التنفيذ)',
+                finished_at=now, updated_at=now)
+    )
+    db.session.commit()
+    return res.rowcount
+
+
+def run_bulk_job(job_id: int, batch_size: int = BULK_BATCH) -> None:
+    """
+    ينفّذ المهمة على دفعات مرتبة بالمعرف، كل دفعة في معاملة قصيرة مستقلة تُحدّث تقدّم المهمة معها.
+    تتوقف عند الإلغاء (status=cancelled) بين الدفعات.
+    """
+    job = db.session.get(BulkJob, job_id)
+    filters = json.loads(job.filters or '{}')
+    params = json.loads(job.params or '{}')
+    conds = build_conditions(filters)
+    last_id = 0
+    try:
+        while True:
+            ids = db.session.execute(
+                select(TaggingData.id).where(*conds, TaggingData.id > last_id)
+                .order_by(TaggingData.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            affected = _apply_batch(job.action, params, ids, conds)
+            res = db.session.execute(
+                update(BulkJob).where(BulkJob.id == job_id, BulkJob.status == 'running')
+                .values(processed=BulkJob.processed + len(ids), affected=BulkJob.affected + affected,
+                        updated_at=datetime.utcnow())
+            )
+            if res.rowcount == 0:
+                # أُلغيت المهمة: لا تُطبّق هذه الدفعة
+                db.session.rollback()
+                return
+            db.session.commit()
+            last_id = ids[-1]
+
+        if job.action == 'delete' and set(filters) == {'upload_session_id'}:
+            # تراجع كامل عن دفعة رفع
+            finish_session_rollback(int(filters['upload_session_id']), on_batch=lambda: _heartbeat(job_id))
+        db.session.execute(
+            update(BulkJob).where(BulkJob.id == job_id, BulkJob.status == 'running')
+            .values(status='completed', finished_at=datetime.utcnow(), updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        db.session.execute(
+            update(BulkJob).where(BulkJob.id == job_id)
+            .values(status='failed', error=str(e), finished_at=datetime.utcnow(), updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+    finally:
+        invalidate_pending_items()
+        invalidate_strata()
+
+
+def start_bulk_job(app, action: str, filters: Dict[str, Any], params: Dict[str, Any],
+                   user_id: Optional[str]) -> BulkJob:
+    """
+    يسجّل المهمة ويشغّلها في خيط خلفي داخل سياق التطبيق.
+    ValueError لفلتر أو معاملات غير صالحة، RuntimeError إن كانت هناك مهمة جارية.
+    """
+    conds = build_conditions(filters)
+    params = validate_params(action, params)
+    reap_stale_jobs()
+    running = db.session.execute(
+        select(func.count(BulkJob.id)).where(BulkJob.status.in_(('queued', 'running')))
+    ).scalar() or 0
+    if running >= MAX_RUNNING_JOBS:
+        raise RuntimeError('توجد عملية جماعية قيد التنفيذ')
+
+    job = BulkJob(action=action, filters=json.dumps(filters, ensure_ascii=False),
+                  params=json.dumps(params, ensure_ascii=False), status='running',
+                  total=count_matching(conds), created_by=user_id)
+    db.session.add(job)
+    db.session.commit()
+
+    def _run(job_id=job.id):
+        with app.app_context():
+            run_bulk_job(job_id)
+
+    threading.Thread(target=_run, name=f'bulk-job-{job.id}', daemon=True).start()
+    return job
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import gzip
+import os
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from flask import request, current_app
+
+try:  # brotli اختياري؛ بدونه نكتفي بـ gzip
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', '1') != '0'
+MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))  # أصغر من هذا لا يستحق الضغط
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+MAX_FILE_SIZE = 8 * 1024 * 1024  # ملفات ثابتة أكبر من هذا تُرسل كما هي
+STREAM_BROTLI_QUALITY = 4  # جودة أخف للمتدفق حتى لا يتأخر إرسال الأجزاء
+
+COMPRESSIBLE = ('text/', 'application/json', 'application/x-ndjson', 'application/javascript',
+                'application/xml', 'image/svg+xml')
+
+
+def compress(enabled: bool = True, min_size: Optional[int] = None,
+             gzip_level: Optional[int] = None, brotli_quality: Optional[int] = None):
+    """ضبط الضغط لمسار بعينه (يُقرأ في after_request)"""
+    def deco(fn):
+        fn._compression = {'enabled': enabled, 'min_size': min_size,
+                           'gzip_level': gzip_level, 'brotli_quality': brotli_quality}
+        return fn
+    return deco
+
+
+def _route_options() -> dict:
+    view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+    return getattr(view, '_compression', None) or {}
+
+
+def choose_encoding(accept) -> Optional[str]:
+    """br إن قبِله العميل وكانت المكتبة متاحة، ثم gzip"""
+    if brotli is not None and accept.quality('br') > 0:
+        return 'br'
+    if accept.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress_bytes(data: bytes, encoding: str, gzip_level: int = GZIP_LEVEL,
+                   brotli_quality: int = BROTLI_QUALITY) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, gzip_level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """يضغط جزءاً بجزء مع flush بعد كل جزء، فيصل كل جزء للعميل فور إنتاجه"""
+    chunks = (c.encode('utf-8') if isinstance(c, str) else c for c in chunks)
+    if encoding == 'br':
+        comp = brotli.Compressor(quality=STREAM_BROTLI_QUALITY)
+        for chunk in chunks:
+            out = comp.process(chunk) + comp.flush()
+            if out:
+                yield out
+        yield comp.finish()
+        return
+
+    comp = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # ترويسة gzip
+    for chunk in chunks:
+        out = comp.compress(chunk) + comp.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield comp.flush()
+
+
+def _compressible(response) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if 'Content-Encoding' in response.headers or 'Content-Range' in response.headers:
+        return False
+    return (response.mimetype or '').startswith(COMPRESSIBLE)
+
+
+def init_compression(app) -> None:
+    """يسجّل ضغط الاستجابات المتفاوض عليه (br/gzip) لكل التطبيق"""
+    if not COMPRESSION_ENABLED:
+        return
+
+    @app.after_request
+    def _compress_response(response):
+        opts = _route_options()
+        if not opts.get('enabled', True) or not _compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        gzip_level = opts.get('gzip_level') or GZIP_LEVEL
+
+        min_size = opts.get('min_size')
+        min_size = MIN_SIZE if min_size is None else min_size
+        if response.direct_passthrough:
+            # ملفات ثابتة من send_from_directory: نقرأها فقط إن كانت بحجم معقول
+            if not response.content_length or response.content_length < min_size \
+                    or response.content_length > MAX_FILE_SIZE:
+                return response
+            response.direct_passthrough = False
+        elif response.is_streamed:
+            response.response = compress_stream(response.response, encoding, gzip_level)
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = encoding
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(compress_bytes(data, encoding, gzip_level,
+                                         opts.get('brotli_quality') or BROTLI_QUALITY))
+        # ETag يصف التمثيل المضغوط الآن
+        etag, _ = response.get_etag()
+        if etag:
+            response.set_etag(etag, weak=True)
+        response.headers['Content-Encoding'] = encoding
+        return response
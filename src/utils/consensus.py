@@ -0,0 +1,98 @@
+from __future__ import annotations
+import os
+from typing import Dict, Any, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.tagging import ItemVote
+
+# first: أول قرار نهائي (السلوك الأصلي)
+# majority: بعد K مراجعات يفوز الخيار الحاصل على أكثر من نصف الأصوات
+# weighted: مثل majority لكن بوزن درجات الثقة
+CONSENSUS_MODE = os.getenv('CONSENSUS_MODE', 'first').lower()
+CONSENSUS_K = int(os.getenv('CONSENSUS_K', '3'))
+
+DECISION_STATUS = {'approve': 'approved', 'modify': 'reviewed', 'reject': 'rejected'}
+
+
+def _choice_key(decision: str, tag_en: Optional[str]) -> str:
+    return f"modify:{tag_en or ''}"[:255] if decision == 'modify' else decision
+
+
+def _apply_first(item, decision: str, new_tag_en, new_tag_ar) -> None:
+    if decision == 'approve':
+        item.status = 'approved'
+    elif decision == 'modify':
+        item.tag_en = new_tag_en if new_tag_en is not None else item.tag_en
+        item.tag_ar = new_tag_ar if new_tag_ar is not None else item.tag_ar
+        item.status = 'reviewed'
+
+
+def _add_vote(data_id: int, decision: str, tag_en, tag_ar, confidence: int) -> None:
+    """يزيد عدّاد الخيار ذرياً؛ يُنشئ صفه عند أول صوت"""
+    choice = _choice_key(decision, tag_en)
+    inc = update(ItemVote)\
+        .where(ItemVote.data_id == data_id, ItemVote.choice == choice)\
+        .values(votes=ItemVote.votes + 1, weight=ItemVote.weight + confidence)
+    if db.session.execute(inc).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(ItemVote(data_id=data_id, choice=choice, decision=decision,
+                                    tag_en=tag_en, tag_ar=tag_ar, votes=1, weight=confidence))
+    except IntegrityError:
+        # أنشأ طلب متزامن الصف للتو
+        db.session.execute(inc)
+
+
+def tally(data_id: int) -> Dict[str, Any]:
+    """عدّادات عنصر واحد (صفوف قليلة بعدد الخيارات، دون مسح tagging_reviews)"""
+    rows = db.session.execute(
+        select(ItemVote.choice, ItemVote.decision, ItemVote.tag_en, ItemVote.tag_ar,
+               ItemVote.votes, ItemVote.weight)
+        .where(ItemVote.data_id == data_id)
+    ).mappings().all()
+    return {
+        'total_votes': sum(r['votes'] for r in rows),
+        'total_weight': sum(r['weight'] for r in rows),
+        'choices': [dict(r) for r in rows]
+    }
+
+
+def apply_vote(item, decision: str, new_tag_en=None, new_tag_ar=None, confidence=5) -> Dict[str, Any]:
+    """
+    يطبّق قرار مراجع على العنصر حسب CONSENSUS_MODE (دون commit).
+    يعيد ملخص حالة الإجماع للعنصر.
+    """
+    if CONSENSUS_MODE not in ('majority', 'weighted'):
+        _apply_first(item, decision, new_tag_en, new_tag_ar)
+        return {'mode': 'first', 'state': 'settled' if item.status != 'pending' else 'open'}
+
+    try:
+        confidence = max(int(confidence or 1), 1)
+    except (TypeError, ValueError):
+        confidence = 1
+    _add_vote(item.id, decision, new_tag_en, new_tag_ar, confidence)
+    db.session.flush()
+
+    t = tally(item.id)
+    state = 'open'
+    if t['total_votes'] >= CONSENSUS_K:
+        key = 'weight' if CONSENSUS_MODE == 'weighted' else 'votes'
+        total = t['total_weight'] if key == 'weight' else t['total_votes']
+        winner = max(t['choices'], key=lambda c: c[key])
+        if winner[key] * 2 > total:
+            state = 'settled'
+            item.status = DECISION_STATUS.get(winner['decision'], item.status)
+            if winner['decision'] == 'modify':
+                item.tag_en = winner['tag_en'] or item.tag_en
+                item.tag_ar = winner['tag_ar'] or item.tag_ar
+        else:
+            # يبقى العنصر في الطابور حتى تحسمه أصوات إضافية
+            state = 'contested'
+            item.status = 'pending'
+    item.consensus_state = state
+
+    return {'mode': CONSENSUS_MODE, 'required': CONSENSUS_K, 'state': state, **t}
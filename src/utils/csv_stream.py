@@ -0,0 +1,80 @@
+from __future__ import annotations
+import csv
+import io
+import json
+import uuid
+from typing import IO, Dict, Any, Iterator, List, Tuple
+
+from chardet.universaldetector import UniversalDetector
+
+DETECT_CHUNK = 64 * 1024
+DETECT_LIMIT = 1024 * 1024  # لا نقرأ أكثر من 1MB لتخمين الترميز
+
+
+def detect_encoding(stream: IO[bytes]) -> str:
+    """
+    يخمّن ترميز الملف تدريجياً بتغذية UniversalDetector على أجزاء حتى يحسم
+    (أو نبلغ DETECT_LIMIT)، ثم يعيد المؤشر لبداية الملف.
+    """
+    detector = UniversalDetector()
+    read = 0
+    stream.seek(0)
+    while read < DETECT_LIMIT:
+        chunk = stream.read(DETECT_CHUNK)
+        if not chunk:
+            break
+        read += len(chunk)
+        detector.feed(chunk)
+        if detector.done:
+            break
+    detector.close()
+    stream.seek(0)
+
+    enc = (detector.result or {}).get('encoding') or 'utf-8'
+    enc = enc.lower()
+    if enc == 'ascii':
+        # ascii جزء من utf-8؛ قد تظهر حروف عربية بعد حد العيّنة
+        return 'utf-8'
+    if enc == 'utf-8':
+        return 'utf-8-sig'  # يتجاهل BOM إن وُجد
+    return enc
+
+
+def iter_sentence_chunks(stream: IO[bytes], chunk_size: int = 1000
+                         ) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """
+    يقرأ CSV القديم سطراً سطراً ويعيد دفعات (sentences, annotations) جاهزة
+    للإدراج المتعدد، بمفاتيح UUID مولّدة مسبقاً لربط الوسوم بجملها دون ذهاب وإياب للقاعدة.
+    """
+    enc = detect_encoding(stream)
+    text_stream = io.TextIOWrapper(stream, encoding=enc, errors='ignore', newline='')
+    reader = csv.DictReader(text_stream)
+
+    sentences: List[Dict[str, Any]] = []
+    annotations: List[Dict[str, Any]] = []
+    try:
+        for row in reader:
+            if 'text' not in row:
+                continue
+            sentence_id = str(uuid.uuid4())
+            tags = {k: v for k, v in row.items() if k != 'text' and k is not None and v}
+            sentences.append({
+                'id': sentence_id,
+                'text': row['text'] or '',
+                'original_tags_json': json.dumps(tags, ensure_ascii=False) if tags else None,
+            })
+            for k, v in tags.items():
+                annotations.append({
+                    'id': str(uuid.uuid4()),
+                    'sentence_id': sentence_id,
+                    'tag_key': k,
+                    'tag_value': v,
+                })
+            if len(sentences) >= chunk_size:
+                yield sentences, annotations
+                sentences, annotations = [], []
+        if sentences:
+            yield sentences, annotations
+    finally:
+        # لا نغلق الملف الأصلي مع الغلاف النصي
+        text_stream.detach()
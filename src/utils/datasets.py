@@ -0,0 +1,63 @@
+from __future__ import annotations
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import select, update, func
+
+from src.models.user import db
+from src.models.tagging import TaggingData, UploadSession
+from src.utils.archive import purge_archived_session
+
+
+def backfill_upload_session_ids() -> Dict[str, int]:
+    """
+    يربط العناصر القديمة بجلسات رفعها حيث يمكن الجزم: لكل جلسة مكتملة نأخذ عناصر نفس الرافع
+    غير المربوطة والمُدرجة بين بداية الجلسة وبداية جلسته التالية، ونربطها فقط إن طابق عددها
+    processed_records تماماً. الحالات الملتبسة (تداخل جلسات) تُترك كما هي.
+    """
+    sessions = db.session.execute(
+        select(UploadSession.id, UploadSession.uploaded_by, UploadSession.uploaded_at,
+               UploadSession.processed_records)
+        .where(UploadSession.uploaded_at.isnot(None), UploadSession.kind == 'tagging')
+        .order_by(UploadSession.uploaded_by, UploadSession.uploaded_at, UploadSession.id)
+    ).all()
+
+    linked = matched = skipped = 0
+    for i, s in enumerate(sessions):
+        if not s.processed_records:
+            continue
+        nxt = sessions[i + 1] if i + 1 < len(sessions) and sessions[i + 1].uploaded_by == s.uploaded_by else None
+        have = db.session.execute(
+            select(func.count(TaggingData.id)).where(TaggingData.upload_session_id == s.id)
+        ).scalar() or 0
+        need = s.processed_records - have
+        if need <= 0:
+            continue
+
+        conds = [TaggingData.upload_session_id.is_(None), TaggingData.uploaded_by == s.uploaded_by,
+                 TaggingData.uploaded_at >= s.uploaded_at]
+        if nxt is not None:
+            conds.append(TaggingData.uploaded_at < nxt.uploaded_at)
+        ids = db.session.execute(
+            select(TaggingData.id).where(*conds).order_by(TaggingData.id).limit(need + 1)
+        ).scalars().all()
+        if len(ids) != need:
+            skipped += 1
+            continue
+        linked += db.session.execute(
+            update(TaggingData).where(TaggingData.id.in_(ids), TaggingData.upload_session_id.is_(None))
+            .values(upload_session_id=s.id).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        matched += 1
+    return {'sessions_linked': matched, 'sessions_skipped': skipped, 'items_linked': linked}
+
+
+def finish_session_rollback(upload_session_id: int, on_batch: Optional[Callable[[], None]] = None) -> None:
+    """بعد حذف عناصر الدفعة من الجدول الحي: يحذف المؤرشف منها ويعلّم الجلسة"""
+    purge_archived_session(upload_session_id, on_batch=on_batch)
+    db.session.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload_session_id, UploadSession.kind == 'tagging')
+        .values(status='rolled_back')
+    )
+    db.session.commit()
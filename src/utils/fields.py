@@ -0,0 +1,40 @@
+from __future__ import annotations
+from datetime import datetime, date
+from typing import Dict, Any, Iterable, List, Sequence
+
+from flask import request
+from sqlalchemy import select
+
+
+def requested_fields(allowed: Sequence[str], opt_in: Iterable[str] = ()) -> List[str]:
+    """
+    يحدد الأعمدة المطلوبة من ?fields=a,b,c (sparse fieldset).
+    - بدون المعامل: كل الأعمدة المسموحة عدا الإضافية (opt_in) كالنصوص الكبيرة
+    - الأسماء غير المعروفة تُتجاهل، و id مضمّن دائماً إن كان مسموحاً
+    """
+    opt_in = set(opt_in)
+    raw = (request.args.get('fields') or '').strip()
+    if not raw:
+        return [f for f in allowed if f not in opt_in]
+
+    wanted = {f.strip() for f in raw.split(',') if f.strip()}
+    out = [f for f in allowed if f in wanted]
+    if 'id' in allowed and 'id' not in out:
+        out.insert(0, 'id')
+    return out
+
+
+def projection(model, fields: Sequence[str]):
+    """select() على الأعمدة المحددة فقط من النموذج (Core، دون identity map)"""
+    return select(*[getattr(model, f) for f in fields])
+
+
+def _jsonable(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return v
+
+
+def rows_to_dicts(result) -> List[Dict[str, Any]]:
+    """يحوّل نتيجة execute() إلى list[dict] مع تحويل التواريخ إلى ISO"""
+    return [{k: _jsonable(v) for k, v in row.items()} for row in result.mappings()]
@@ -0,0 +1,196 @@
+from __future__ import annotations
+import hashlib
+import re
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select, insert, update, delete, func, bindparam, tuple_
+
+from src.models.user import db
+from src.models.tagging import TaggingData
+from src.models.dedup import TextSignature, LshBucket
+from src.utils.reviewer_progress import items_entered_queue
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # عتبة LSH التقريبية (1/BANDS)^(1/ROWS) ≈ 0.5
+SHINGLE = 5  # طول المقطع الحرفي
+THRESHOLD = 0.8  # تشابه جاكارد التقديري المطلوب لاعتبار النصين مكررين
+QUERY_CHUNK = 500
+INSERT_CHUNK = 1000
+
+_PRIME = (1 << 61) - 1
+# بذرة ثابتة: التواقيع يجب أن تتطابق بين العمليات وعبر عمليات النشر
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, 1 << 31, NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 1 << 31, NUM_PERM).astype(np.uint64)
+_EMPTY = np.full(NUM_PERM, 0xFFFFFFFF, dtype=np.uint32)
+
+_DIACRITICS = re.compile('[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')  # التشكيل والتطويل
+_PUNCT = re.compile(r'[^\w\s]|_')
+_LETTERS = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي', 'ة': 'ه', 'ؤ': 'و', 'ئ': 'ي'})
+
+
+def normalize_arabic(text: str) -> str:
+    """يزيل التشكيل وعلامات الترقيم ويوحّد أشكال الألف والياء والتاء المربوطة"""
+    t = _DIACRITICS.sub('', text or '').translate(_LETTERS)
+    t = _PUNCT.sub(' ', t)
+    return ' '.join(t.split()).lower()
+
+
+def _shingles(text: str) -> Set[str]:
+    if len(text) <= SHINGLE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)}
+
+
+def minhash(text: str) -> np.ndarray:
+    """توقيع MinHash (NUM_PERM × uint32) على مقاطع حرفية من النص المطبّع"""
+    sh = _shingles(normalize_arabic(text))
+    if not sh:
+        return _EMPTY.copy()
+    h = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in sh), dtype=np.uint64, count=len(sh))
+    # a < 2^31 و h < 2^32 فلا يفيض الضرب في uint64
+    permuted = (np.outer(_A, h) + _B[:, None]) % _PRIME
+    return (permuted.min(axis=1) & 0xFFFFFFFF).astype(np.uint32)
+
+
+def band_keys(sig: np.ndarray) -> List[int]:
+    """مفتاح دلو (int64) لكل شريحة من التوقيع"""
+    keys = []
+    for b in range(BANDS):
+        digest = hashlib.blake2b(sig[b * ROWS:(b + 1) * ROWS].tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """تقدير تشابه جاكارد من توقيعين"""
+    return float(np.mean(a == b))
+
+
+def _chunks(seq: List, size: int) -> Iterable[List]:
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def index_items(items: List[Tuple[int, str]]) -> Dict[str, int]:
+    """
+    يحسب توقيعات عناصر جديدة ويضمها إلى عناقيد التكرار (دون commit):
+    المرشحون يأتون من دلاء LSH المطابقة فقط (لا مقارنة مع كل المجموعة)،
+    ثم يُتحقق منهم بتشابه التوقيعات. العناصر داخل الدفعة نفسها تُقارن ببعضها أيضاً.
+    """
+    if not items:
+        return {'indexed': 0, 'duplicates': 0}
+
+    ids = [i for i, _ in items]
+    existing = set()
+    for part in _chunks(ids, QUERY_CHUNK):
+        existing.update(db.session.execute(
+            select(TextSignature.data_id).where(TextSignature.data_id.in_(part))).scalars())
+    items = [(i, t) for i, t in items if i not in existing]
+    if not items:
+        return {'indexed': 0, 'duplicates': 0}
+
+    sigs = {i: minhash(t) for i, t in items}
+    keys = {i: band_keys(sig) for i, sig in sigs.items()}
+
+    # دلاء القاعدة المطابقة لأي مفتاح في الدفعة
+    buckets: Dict[Tuple[int, int], List[int]] = {}
+    wanted = {(b, k) for ks in keys.values() for b, k in enumerate(ks)}
+    # أزواج (band, bucket) كاملة حتى يُستخدم الفهرس المركب ix_lsh_buckets_band_bucket
+    for part in _chunks(sorted(wanted), QUERY_CHUNK):
+        for band, bucket, data_id in db.session.execute(
+                select(LshBucket.band, LshBucket.bucket, LshBucket.data_id)
+                .where(tuple_(LshBucket.band, LshBucket.bucket).in_(part))):
+            buckets.setdefault((band, bucket), []).append(data_id)
+
+    known: Dict[int, Tuple[np.ndarray, int]] = {}
+    db_candidates = sorted({d for ds in buckets.values() for d in ds})
+    for part in _chunks(db_candidates, QUERY_CHUNK):
+        for data_id, sig, cluster_id in db.session.execute(
+                select(TextSignature.data_id, TextSignature.signature, TextSignature.cluster_id)
+                .where(TextSignature.data_id.in_(part))):
+            known[data_id] = (np.frombuffer(sig, dtype=np.uint32), cluster_id)
+
+    sig_rows, bucket_rows = [], []
+    duplicates = 0
+    for data_id, _ in items:
+        sig = sigs[data_id]
+        candidates = {d for b, k in enumerate(keys[data_id]) for d in buckets.get((b, k), ())}
+        clusters = [known[d][1] for d in candidates
+                    if d in known and similarity(sig, known[d][0]) >= THRESHOLD]
+        cluster_id = min(clusters) if clusters else data_id
+        if clusters:
+            duplicates += 1
+
+        known[data_id] = (sig, cluster_id)
+        sig_rows.append({'data_id': data_id, 'signature': sig.tobytes(), 'cluster_id': cluster_id})
+        for b, k in enumerate(keys[data_id]):
+            buckets.setdefault((b, k), []).append(data_id)
+            bucket_rows.append({'band': b, 'bucket': k, 'data_id': data_id})
+
+    for part in _chunks(sig_rows, INSERT_CHUNK):
+        db.session.execute(insert(TextSignature), part)
+    for part in _chunks(bucket_rows, INSERT_CHUNK):
+        db.session.execute(insert(LshBucket), part)
+    return {'indexed': len(sig_rows), 'duplicates': duplicates}
+
+
+def forget_items(ids: List[int]) -> int:
+    """
+    يُخرج عناصر محذوفة أو مؤرشفة من فهرس التكرار (دون commit): تُحذف توقيعاتها ودلاؤها،
+    وكل عنقود فقد ممثله يصبح ممثله أصغر أعضائه الباقين، ويعود هذا إلى الطابور إن كان مطوياً (duplicate).
+    يعيد عدد العناقيد التي تغيّر ممثلها.
+    """
+    if not ids:
+        return 0
+    promoted = []
+    for part in _chunks(list(ids), QUERY_CHUNK):
+        db.session.execute(delete(LshBucket).where(LshBucket.data_id.in_(part)))
+        db.session.execute(delete(TextSignature).where(TextSignature.data_id.in_(part)))
+        promoted.extend({'_old': old, '_new': new} for old, new in db.session.execute(
+            select(TextSignature.cluster_id, func.min(TextSignature.data_id))
+            .where(TextSignature.cluster_id.in_(part)).group_by(TextSignature.cluster_id)))
+    if not promoted:
+        return 0
+
+    db.session.execute(
+        update(TextSignature.__table__).where(TextSignature.cluster_id == bindparam('_old'))
+        .values(cluster_id=bindparam('_new')),
+        promoted
+    )
+    reps = [p['_new'] for p in promoted]
+    requeued = []
+    for part in _chunks(reps, QUERY_CHUNK):
+        requeued.extend(db.session.execute(
+            update(TaggingData)
+            .where(TaggingData.id.in_(part), TaggingData.status == 'duplicate')
+            .values(status='pending', version=TaggingData.version + 1, updated_at=datetime.utcnow())
+            .returning(TaggingData.id)
+        ).scalars())
+    items_entered_queue(requeued)
+    return len(promoted)
+
+
+def index_missing(batch_size: int = 1000) -> Dict[str, int]:
+    """يفهرس (على دفعات) العناصر التي لا توقيع لها بعد، مثل البيانات السابقة لهذه الميزة"""
+    total = {'indexed': 0, 'duplicates': 0}
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(TaggingData.id, TaggingData.text)
+            .outerjoin(TextSignature, TextSignature.data_id == TaggingData.id)
+            .where(TextSignature.data_id.is_(None), TaggingData.id > last_id)
+            .order_by(TaggingData.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        res = index_items([(r.id, r.text) for r in rows])
+        db.session.commit()
+        total['indexed'] += res['indexed']
+        total['duplicates'] += res['duplicates']
+        last_id = rows[-1].id
+    return total
@@ -1,8 +1,16 @@
 ﻿from __future__ import annotations
+import csv
 import os
-from typing import List, Dict, Any
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import pandas as pd
 
+from src.utils.csv_stream import detect_encoding
+
 # خرائط أسماء الأعمدة المحتملة -> الاسم الموحّد
 CANONICAL_MAP = {
     # النص
@@ -80,31 +88,18 @@ def _normalize_columns(cols) -> Dict[str, str]:
             mapping[c_str] = key
     return mapping
 
-def parse_bilingual_file(file_path: str) -> List[Dict[str, Any]]:
-    """
-    يقرأ ملف xlsx/xls/csv ويعيد قائمة سجلات قياسية:
-    [{
-        "text": "...",
-        "ideological_en": "...", "ideological_ar": "...",
-        "syntactic_en": "...",   "syntactic_ar": "...",
-        "functional_en": "...",  "functional_ar": "...",
-        "discourse_en": "...",   "discourse_ar": "..."
-    }, ...]
-    """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(file_path)
-
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext in [".xlsx", ".xls"]:
+def _guess_text_column(df: pd.DataFrame) -> Optional[str]:
+    """أول عمود متوسط طول قيمه أكبر من 20 حرفاً"""
+    for c in df.columns:
         try:
-            df = pd.read_excel(file_path, dtype=str)
-        except ImportError as e:
-            raise ImportError("Excel support requires the 'openpyxl' package. Please install it in your venv.") from e
-    elif ext == ".csv":
-        df = pd.read_csv(file_path, dtype=str)
-    else:
-        raise ValueError("Unsupported file type. Please upload xlsx/xls/csv.")
+            if df[c].astype(str).str.len().mean() > 20:
+                return c
+        except Exception:
+            continue
+    return None
 
+def _normalize_frame(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """يطبّع أعمدة ورقة واحدة ويحوّلها إلى سجلات قياسية"""
     # تنظيف الأعمدة وتطبيع الأسماء
     df.columns = [str(c).strip() for c in df.columns]
     col_map = _normalize_columns(df.columns)
@@ -113,14 +108,7 @@ def parse_bilingual_file(file_path: str) -> List[Dict[str, Any]]:
     # التحقق من وجود عمود النص
     if "text" not in df.columns:
         # محاولة تلقائية لاختيار عمود نصّي
-        text_candidate = None
-        for c in df.columns:
-            try:
-                if df[c].astype(str).str.len().mean() > 20:
-                    text_candidate = c
-                    break
-            except Exception:
-                continue
+        text_candidate = _guess_text_column(df)
         if text_candidate:
             df = df.rename(columns={text_candidate: "text"})
         else:
@@ -142,3 +130,208 @@ def parse_bilingual_file(file_path: str) -> List[Dict[str, Any]]:
                 r[k] = v.strip()
 
     return records
+
+def _read_excel(file_path: str, sheet_name=0) -> pd.DataFrame:
+    try:
+        return pd.read_excel(file_path, sheet_name=sheet_name, dtype=str)
+    except ImportError as e:
+        raise ImportError("Excel support requires the 'openpyxl' package. Please install it in your venv.") from e
+
+def parse_bilingual_file(file_path: str) -> List[Dict[str, Any]]:
+    """
+    يقرأ ملف xlsx/xls/csv (الورقة الأولى فقط) ويعيد قائمة سجلات قياسية:
+    [{
+        "text": "...",
+        "ideological_en": "...", "ideological_ar": "...",
+        "syntactic_en": "...",   "syntactic_ar": "...",
+        "functional_en": "...",  "functional_ar": "...",
+        "discourse_en": "...",   "discourse_ar": "..."
+    }, ...]
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in [".xlsx", ".xls"]:
+        df = _read_excel(file_path)
+    elif ext == ".csv":
+        df = pd.read_csv(file_path, dtype=str)
+    else:
+        raise ValueError("Unsupported file type. Please upload xlsx/xls/csv.")
+
+    return _normalize_frame(df)
+
+# ========================= أوراق متعددة بالتوازي =========================
+
+def _parse_sheet(file_path: str, sheet_name: str) -> Tuple[str, Optional[List[Dict[str, Any]]], Optional[str]]:
+    """يُنفَّذ داخل عملية منفصلة: يقرأ ورقة واحدة ويطبّعها. يعيد (الورقة، السجلات، الخطأ)"""
+    try:
+        return sheet_name, _normalize_frame(_read_excel(file_path, sheet_name)), None
+    except Exception as e:
+        return sheet_name, None, str(e)
+
+def iter_workbook_sheets(file_path: str, max_workers: Optional[int] = None
+                         ) -> Iterator[Tuple[str, Optional[List[Dict[str, Any]]], Optional[str]]]:
+    """
+    يقرأ كل أوراق المصنّف ويعيد (اسم الورقة، السجلات، الخطأ) بترتيب الأوراق.
+    الأوراق تُوزّع على مجمّع عمليات محدود (افتراضياً بعدد الأنوية)، ولا يبقى قيد التنفيذ
+    أكثر من ضعف عدد العمّال حتى لا تتكدس النتائج في الذاكرة إن كان المُدرِج أبطأ.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        yield "", parse_bilingual_file(file_path), None
+        return
+
+    with pd.ExcelFile(file_path) as xls:
+        sheet_names = [str(n) for n in xls.sheet_names]
+
+    workers = min(max_workers or os.cpu_count() or 1, len(sheet_names))
+    if workers <= 1:
+        for name in sheet_names:
+            yield _parse_sheet(file_path, name)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        names = iter(sheet_names)
+        for name in islice(names, workers * 2):
+            pending.append(pool.submit(_parse_sheet, file_path, name))
+        while pending:
+            result = pending.popleft().result()
+            for name in islice(names, 1):
+                pending.append(pool.submit(_parse_sheet, file_path, name))
+            yield result
+
+# ========================= معاينة سريعة دون إدراج =========================
+PREVIEW_HEAD_ROWS = 50
+PREVIEW_SAMPLE_SIZE = 200
+PREVIEW_SECONDS = 0.8  # ميزانية زمنية كلية لمسح بقية الملف لأجل العيّنة
+HISTOGRAM_TOP = 20
+TAG_MAX_LEN = 100  # كما يقتطع _ingest_records
+
+def _iter_sheet_rows(file_path: str) -> Iterator[Tuple[str, Iterator[tuple]]]:
+    """(اسم الورقة، مكرر صفوف خام) دون تحميل الملف كاملاً؛ الصف الأول هو الرأس"""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        with open(file_path, "rb") as raw:
+            encoding = detect_encoding(raw)
+        with open(file_path, newline="", encoding=encoding, errors="replace") as f:
+            yield "", (tuple(r) for r in csv.reader(f))
+        return
+    if ext == ".xlsx":
+        from openpyxl import load_workbook
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for ws in wb.worksheets:
+                yield ws.title, ws.iter_rows(values_only=True)
+        finally:
+            wb.close()
+        return
+    # xls: لا قراءة متدفقة، نكتفي بالرأس وأول الصفوف
+    with pd.ExcelFile(file_path) as xls:
+        for name in xls.sheet_names:
+            df = pd.read_excel(xls, sheet_name=name, dtype=str, header=None, nrows=PREVIEW_HEAD_ROWS + 1)
+            yield str(name), (tuple(r) for r in df.itertuples(index=False, name=None))
+
+def _cell(v) -> str:
+    if v is None or (isinstance(v, float) and pd.isna(v)):
+        return ""
+    return str(v).strip()
+
+def _preview_sheet(name: str, rows: Iterator[tuple], head_rows: int, sample_size: int,
+                   deadline: float, rng) -> Dict[str, Any]:
+    header = next(rows, None)
+    if header is None:
+        return {"sheet": name, "error": "الورقة فارغة"}
+    header = [_cell(h) for h in header]
+    width = len(header)
+
+    def values(r):
+        vals = [_cell(v) for v in r[:width]]
+        return vals + [""] * (width - len(vals))
+
+    head, sample = [], []
+    scanned = 0
+    complete = True
+    for r in rows:
+        vals = values(r)
+        if not any(vals):
+            continue
+        scanned += 1
+        if len(head) < head_rows:
+            head.append(vals)
+            continue
+        if not sample_size:
+            complete = False
+            break
+        # Reservoir (Algorithm R) على الصفوف بعد الرأس
+        k = scanned - len(head)
+        if len(sample) < sample_size:
+            sample.append(vals)
+        else:
+            j = rng.randrange(k)
+            if j < sample_size:
+                sample[j] = vals
+        if k % 256 == 0 and time.monotonic() > deadline:
+            complete = False
+            break
+
+    out: Dict[str, Any] = {"sheet": name, "header": header, "rows_head": len(head),
+                           "rows_sampled": len(sample), "rows_scanned": scanned, "scan_complete": complete}
+    df = pd.DataFrame(head + sample, columns=header, dtype=str)
+    df.columns = [str(c).strip() for c in df.columns]
+    mapping = _normalize_columns(df.columns)
+    df = df.rename(columns=mapping)
+    out["mapping"] = mapping
+    dup = sorted({c for c in df.columns if list(df.columns).count(c) > 1})
+    if dup:
+        out["duplicate_columns"] = dup
+
+    text_col, guessed = ("text", False) if "text" in df.columns else (_guess_text_column(df), True)
+    out["text_column"] = next((orig for orig, canon in mapping.items() if canon == text_col), None)
+    out["text_column_guessed"] = guessed and text_col is not None
+    if text_col is None:
+        out["error"] = "لم يتم العثور على عمود يمثل النص (Paragraph/Text)."
+        return out
+    df = df.loc[:, ~df.columns.duplicated()].rename(columns={text_col: "text"})
+
+    n = len(df)
+    tag_cols = [c for c in CANONICAL_ORDER[1:] if c in df.columns]
+    empty_text = int((df["text"] == "").sum())
+    no_tags = int((df[tag_cols] == "").all(axis=1).sum()) if tag_cols else n
+    truncated = int(sum((df[c].str.len() > TAG_MAX_LEN).sum() for c in tag_cols))
+    missing_ar = {}
+    for c in tag_cols:
+        if c.endswith("_en") and c[:-3] + "_ar" in df.columns:
+            m = int(((df[c] != "") & (df[c[:-3] + "_ar"] == "")).sum())
+            if m:
+                missing_ar[c[:-3]] = m
+    out["histograms"] = {c: df.loc[df[c] != "", c].value_counts().head(HISTOGRAM_TOP).to_dict()
+                         for c in tag_cols}
+    out["predicted_failures"] = {
+        "empty_text": empty_text,
+        "empty_text_rate": round(empty_text / n, 4) if n else 0,
+        "no_tags_become_unknown": no_tags,
+        "tags_truncated": truncated,
+        "missing_arabic_translated": missing_ar,
+    }
+    out["unmapped_columns"] = [orig for orig, canon in mapping.items()
+                               if canon not in CANONICAL_ORDER and orig != out["text_column"]]
+    out["examples"] = df.head(5).to_dict(orient="records")
+    return out
+
+def preview_file(file_path: str, head_rows: int = PREVIEW_HEAD_ROWS, sample_size: int = PREVIEW_SAMPLE_SIZE,
+                 seconds: float = PREVIEW_SECONDS, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    معاينة لكل ورقة: الرأس + أول head_rows صفاً + عيّنة reservoir من بقية الصفوف ضمن ميزانية
+    زمنية. يعيد ربط الأعمدة والمدرجات التكرارية للوسوم والأخطاء المتوقعة دون كتابة أي شيء.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+    deadline = time.monotonic() + max(seconds, 0)
+    rng = random.Random(seed)
+    return [_preview_sheet(name, rows, head_rows, sample_size, deadline, rng)
+            for name, rows in _iter_sheet_rows(file_path)]
@@ -0,0 +1,258 @@
+from __future__ import annotations
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from flask import g, request, session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# تحليل أداء عند الطلب لطلب واحد: ترويسة X-Profile من جلسة مشرف أو رمز لمرة واحدة (X-Profile-Token).
+# الطلبات غير المُحلَّلة لا تدفع شيئاً: لا خيط أخذ عينات ولا مستمعي SQL إلا أثناء تحليل فعلي.
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', '1') != '0'
+PROFILE_DIR = os.path.abspath(os.getenv('PROFILE_DIR', os.path.join('uploads', 'profiles')))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000
+PROFILE_TOKEN_TTL = int(os.getenv('PROFILE_TOKEN_TTL', '900'))
+MAX_PROFILES = int(os.getenv('MAX_PROFILES', '50'))  # يُحذف الأقدم عند التجاوز
+MAX_DEPTH = 128
+
+_active: Dict[int, 'RequestProfile'] = {}  # معرف الخيط -> التحليل الجاري
+_active_lock = threading.Lock()
+
+
+class RequestProfile:
+    """عيّنات مكدس خيط الطلب كل interval في خيط جانبي، مع زمن SQL محسوب من أحداث المحرك"""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{secrets.token_hex(3)}"
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.sql_time = 0.0
+        self.sql_count = 0
+        self.in_sql = False
+        self._sql_started = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self.started = time.perf_counter()
+        self.wall = 0.0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.wall = time.perf_counter() - self.started
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f'{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack.reverse()
+            if self.in_sql:
+                stack.append('[SQL]')  # إطار اصطناعي: الوقت عند قاعدة البيانات
+            self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """صيغة folded stacks (سطر لكل مكدس + العدد) المقبولة في flamegraph.pl و speedscope"""
+        return ''.join(f'{stack} {n}\n' for stack, n in self.stacks.most_common())
+
+
+# ========================= زمن SQL =========================
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get(threading.get_ident())
+    if profile is not None:
+        profile.in_sql = True
+        profile._sql_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get(threading.get_ident())
+    if profile is not None and profile.in_sql:
+        profile.in_sql = False
+        profile.sql_time += time.perf_counter() - profile._sql_started
+        profile.sql_count += 1
+
+
+def _on_error(context):
+    profile = _active.get(threading.get_ident())
+    if profile is not None and profile.in_sql:
+        profile.in_sql = False
+        profile.sql_time += time.perf_counter() - profile._sql_started
+
+
+def _activate(profile: RequestProfile) -> None:
+    # المستمعون يُركَّبون مع أول تحليل نشط ويُزالون مع آخره
+    with _active_lock:
+        if not _active:
+            event.listen(Engine, 'before_cursor_execute', _before_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_execute)
+            event.listen(Engine, 'handle_error', _on_error)
+        _active[profile.thread_id] = profile
+
+
+def _deactivate(profile: RequestProfile) -> None:
+    with _active_lock:
+        _active.pop(profile.thread_id, None)
+        if not _active:
+            event.remove(Engine, 'before_cursor_execute', _before_execute)
+            event.remove(Engine, 'after_cursor_execute', _after_execute)
+            event.remove(Engine, 'handle_error', _on_error)
+
+
+# ========================= رموز لمرة واحدة =========================
+def _token_path(token: str) -> str:
+    return os.path.join(PROFILE_DIR, 'tokens', token)
+
+
+def issue_token(user_id: Optional[str]) -> Dict[str, Any]:
+    """رمز يحلّل أول طلب يحمله (من أي مستخدم) ثم يُستهلك؛ ملف على القرص ليُرى من كل العمال"""
+    os.makedirs(os.path.join(PROFILE_DIR, 'tokens'), exist_ok=True)
+    token = secrets.token_urlsafe(18)
+    expires_at = time.time() + PROFILE_TOKEN_TTL
+    with open(_token_path(token), 'w', encoding='utf-8') as f:
+        json.dump({'issued_by': user_id, 'expires_at': expires_at}, f)
+    return {'token': token, 'header': 'X-Profile-Token', 'expires_at': datetime.utcfromtimestamp(expires_at).isoformat()}
+
+
+def _consume_token(token: str) -> Optional[Dict[str, Any]]:
+    if not token or os.sep in token or token.startswith('.'):
+        return None
+    path = _token_path(token)
+    claimed = f'{path}.{os.getpid()}.{threading.get_ident()}'
+    try:
+        os.rename(path, claimed)  # ذري: عامل واحد فقط يكسب الرمز
+    except OSError:
+        return None
+    try:
+        with open(claimed, encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        info = {}
+    finally:
+        os.remove(claimed)
+    return info if info.get('expires_at', 0) > time.time() else None
+
+
+# ========================= التخزين =========================
+def _profile_path(profile_id: str, ext: str) -> str:
+    return os.path.join(PROFILE_DIR, f'{profile_id}.{ext}')
+
+
+def _save(profile: RequestProfile, meta: Dict[str, Any]) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = profile.id
+    with open(_profile_path(profile_id, 'folded'), 'w', encoding='utf-8') as f:
+        f.write(profile.folded())
+    meta = dict(meta, id=profile_id, wall_ms=round(profile.wall * 1000, 2),
+                sql_ms=round(profile.sql_time * 1000, 2), sql_count=profile.sql_count,
+                samples=profile.samples, interval_ms=round(profile.interval * 1000, 2))
+    with open(_profile_path(profile_id, 'json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    _prune()
+    return profile_id
+
+
+def _prune() -> None:
+    metas = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith('.json'))
+    for name in metas[:max(len(metas) - MAX_PROFILES, 0)]:
+        for ext in ('json', 'folded'):
+            try:
+                os.remove(_profile_path(name[:-5], ext))
+            except OSError:
+                pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """بيانات التحليلات المحفوظة، الأحدث أولاً"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    out = []
+    for name in sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith('.json')), reverse=True):
+        try:
+            with open(os.path.join(PROFILE_DIR, name), encoding='utf-8') as f:
+                out.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def profile_file(profile_id: str) -> Optional[str]:
+    """مسار ملف folded لتحليل محفوظ، أو None"""
+    if not profile_id or os.sep in profile_id or profile_id.startswith('.'):
+        return None
+    path = _profile_path(profile_id, 'folded')
+    return path if os.path.isfile(path) else None
+
+
+# ========================= ربط التطبيق =========================
+def _wants_profile() -> Optional[Dict[str, Any]]:
+    token = request.headers.get('X-Profile-Token')
+    if token:
+        return _consume_token(token)
+    if request.headers.get('X-Profile') and (session.get('user_type') or '').lower() == 'admin':
+        return {'issued_by': session.get('user_id')}
+    return None
+
+
+def init_profiler(app) -> None:
+    """يسجّل خطافات التحليل عند الطلب"""
+    if not PROFILER_ENABLED:
+        return
+
+    @app.before_request
+    def _start_profile():
+        if 'X-Profile' not in request.headers and 'X-Profile-Token' not in request.headers:
+            return
+        info = _wants_profile()
+        if info is None:
+            return
+        profile = RequestProfile(threading.get_ident())
+        _activate(profile)
+        profile.start()
+        g.request_profile = profile
+        g.request_profile_info = info
+
+    @app.after_request
+    def _note_status(response):
+        if g.get('request_profile') is not None:
+            g.request_profile_status = response.status_code
+            response.headers['X-Profile-Id'] = g.request_profile.id
+        return response
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        # مع stream_with_context يصل هذا بعد انتهاء التدفق، فيُحسب زمن التوليد كاملاً
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return
+        profile.stop()
+        _deactivate(profile)
+        try:
+            _save(profile, {
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'status': g.get('request_profile_status'),
+                'error': repr(exc) if exc else None,
+                'user_id': session.get('user_id'),
+                'requested_by': (g.get('request_profile_info') or {}).get('issued_by'),
+                'at': datetime.utcnow().isoformat(),
+            })
+        except OSError as e:
+            print('Profile save error:', e)
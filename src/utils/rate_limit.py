@@ -0,0 +1,166 @@
+from __future__ import annotations
+import math
+import os
+import threading
+import time
+from functools import wraps
+from typing import Dict, Any, Optional, Tuple
+
+from flask import Response, jsonify, request, session
+
+# الحالة داخل العملية فقط (لكل عامل gunicorn حدوده الخاصة)
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') != '0'
+MAX_BUCKETS = 10000  # عند تجاوزه تُحذف الدلاء الخاملة (الممتلئة)
+
+
+class RateLimiter:
+    """token bucket لكل (مستخدم، مسار): rate رمز/ثانية وسعة burst"""
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.rejected = 0
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """يستهلك رمزاً؛ يعيد 0 عند السماح، وإلا عدد الثواني حتى يتوفر رمز"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                if len(self._buckets) > MAX_BUCKETS:
+                    self._prune(now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            self.rejected += 1
+            return (1 - tokens) / self.rate
+
+    def _prune(self, now: float) -> None:
+        full_after = self.burst / self.rate
+        for k, (_, updated) in list(self._buckets.items()):
+            if now - updated >= full_after:
+                del self._buckets[k]
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            levels = {k: min(self.burst, t + (now - u) * self.rate) for k, (t, u) in self._buckets.items()}
+        hottest = sorted(levels.items(), key=lambda kv: kv[1])[:10]
+        return {
+            'type': 'rate',
+            'rate_per_sec': self.rate,
+            'burst': self.burst,
+            'tracked_keys': len(levels),
+            'rejected': self.rejected,
+            'lowest_buckets': [{'key': k, 'tokens': round(t, 2)} for k, t in hottest]
+        }
+
+
+class ConcurrencyLimiter:
+    """حد أعلى لعدد الطلبات المتزامنة في مجموعة مسارات مكلفة؛ الزائد يُرفض فوراً بدل الانتظار"""
+
+    def __init__(self, name: str, max_concurrent: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_enter(self) -> bool:
+        with self._lock:
+            if self.active >= self.max_concurrent:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def leave(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'type': 'concurrency',
+            'max_concurrent': self.max_concurrent,
+            'active': self.active,
+            'rejected': self.rejected
+        }
+
+
+_limiters: Dict[str, Any] = {}
+_registry_lock = threading.Lock()
+
+
+def _too_many(retry_after: float):
+    seconds = max(1, math.ceil(retry_after))
+    resp = jsonify({'error': 'too_many_requests', 'retry_after': seconds})
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(seconds)
+    return resp
+
+
+def _client_key() -> str:
+    return str(session.get('user_id') or request.remote_addr or 'anonymous')
+
+
+def rate_limit(rate: float, burst: int, name: Optional[str] = None):
+    """مُزخرف: token bucket لكل مستخدم على هذا المسار"""
+    def decorator(fn):
+        default_name = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+        limiter = RateLimiter(name or default_name, rate, burst)
+        with _registry_lock:
+            _limiters[limiter.name] = limiter
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if RATE_LIMIT_ENABLED:
+                retry_after = limiter.acquire(_client_key())
+                if retry_after:
+                    return _too_many(retry_after)
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def concurrency_limit(group: str, max_concurrent: int):
+    """مُزخرف: حد تزامن مشترك بين كل المسارات في نفس المجموعة"""
+    with _registry_lock:
+        limiter = _limiters.get(group)
+        if limiter is None:
+            limiter = _limiters[group] = ConcurrencyLimiter(group, max_concurrent)
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED:
+                return fn(*args, **kwargs)
+            if not limiter.try_enter():
+                return _too_many(1)
+            streamed = False
+            try:
+                resp = fn(*args, **kwargs)
+                if isinstance(resp, Response) and resp.is_streamed:
+                    # الاستجابة المتدفقة تعمل بعد عودة الدالة: المكان يُحرَّر عند انتهاء الإرسال
+                    resp.call_on_close(limiter.leave)
+                    streamed = True
+                return resp
+            finally:
+                if not streamed:
+                    limiter.leave()
+        return wrapper
+    return decorator
+
+
+def limits_snapshot() -> Dict[str, Any]:
+    """حالة كل المحددات في هذه العملية"""
+    with _registry_lock:
+        limiters = dict(_limiters)
+    return {
+        'enabled': RATE_LIMIT_ENABLED,
+        'pid': os.getpid(),
+        'limiters': {name: l.snapshot() for name, l in limiters.items()}
+    }
@@ -0,0 +1,66 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import select, update, bindparam
+
+from src.models.user import db
+from src.models.tagging import TaggingData, TaggingReview
+
+RECONCILE_BATCH = 1000
+
+
+def reconcile_review_meta(batch_size: int = RECONCILE_BATCH) -> Dict[str, int]:
+    """
+    يعيد حساب review_count / last_reviewed_at / last_decision من tagging_reviews
+    على نطاقات معرفات متتالية، ويكتب فقط الصفوف المختلفة. كل نطاق في معاملة مستقلة.
+    """
+    items = TaggingData.__table__
+    scanned = fixed = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(items.c.id, items.c.review_count, items.c.last_reviewed_at, items.c.last_decision,
+                   items.c.requeue_review_id)
+            .where(items.c.id > last_id).order_by(items.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        lo, hi = rows[0].id, rows[-1].id
+        # مراجعات ما قبل إعادة العنصر للطابور لا تدخل في عدّاده
+        requeued = {r.id: r.requeue_review_id for r in rows if r.requeue_review_id is not None}
+
+        # المراجعات مرتبة تصاعدياً فآخر صف لكل عنصر هو آخر مراجعة
+        actual = {}
+        for review_id, data_id, decision, reviewed_at in db.session.execute(
+                select(TaggingReview.id, TaggingReview.data_id, TaggingReview.decision, TaggingReview.reviewed_at)
+                .where(TaggingReview.data_id.between(lo, hi))
+                .order_by(TaggingReview.data_id, TaggingReview.reviewed_at, TaggingReview.id)):
+            if review_id <= requeued.get(data_id, 0):
+                continue
+            count = actual.get(data_id, (0,))[0] + 1
+            actual[data_id] = (count, reviewed_at, decision)
+
+        changes = []
+        for r in rows:
+            want = actual.get(r.id, (0, None, None))
+            if (r.review_count, r.last_reviewed_at, r.last_decision) != want:
+                changes.append({'_id': r.id, '_seen': r.review_count, 'review_count': want[0],
+                                'last_reviewed_at': want[1], 'last_decision': want[2]})
+        if changes:
+            db.session.execute(
+                # لا نكتب فوق عدّاد زادته مراجعة متزامنة بعد القراءة؛ يلتقطه التشغيل التالي.
+                # version/updated_at كما في العمليات الجماعية: نموذج مفتوح يحصل على 409 واللقطة تلتقط التصحيح
+                update(items).where(items.c.id == bindparam('_id'),
+                                    items.c.review_count == bindparam('_seen'))
+                .values(review_count=bindparam('review_count'),
+                        last_reviewed_at=bindparam('last_reviewed_at'),
+                        last_decision=bindparam('last_decision'),
+                        version=items.c.version + 1, updated_at=datetime.utcnow()),
+                changes
+            )
+        db.session.commit()
+        scanned += len(rows)
+        fixed += len(changes)
+        last_id = hi
+    return {'scanned': scanned, 'fixed': fixed}
@@ -0,0 +1,312 @@
+from __future__ import annotations
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, func, update, delete, bindparam
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.tagging import TaggingData, TaggingReview, ReviewerProgress
+from src.utils.archive import data_union, reviews_union
+
+SCAN_CHUNK = 500
+QUEUE_TTL = 30  # ثوانٍ لتخزين عدد العناصر المعلّقة مؤقتاً
+QUEUE_STATUS = 'pending'
+
+# طابور المحكّم = العناصر المعلّقة التي لم يراجعها. لكل محكّم عدّادان يجعلان الطابور شبه ثابت الكلفة:
+# - pending_reviewed: كم عنصراً معلّقاً الآن يحمل بته في الخريطة؛ remaining = عدد المعلّق - هذا العدد.
+#   يُحدَّث مع كل مراجعة وكل انتقال عنصر من الطابور أو إليه (review_applied / items_left_queue / items_entered_queue).
+# - scan_from: كل عنصر معلّق معرفه أقل منه راجعه المحكّم؛ مسح الطابور يبدأ منه لا من 0،
+#   ويُخفَّض لكل المحكّمين عند عودة عنصر إلى الطابور.
+
+
+class IdBitmap:
+    """خريطة بتات على bytearray: البت n يمثل المعرف n"""
+
+    __slots__ = ('_bits',)
+
+    def __init__(self, data: Optional[bytes] = None):
+        self._bits = bytearray(data or b'')
+
+    def add(self, i: int) -> bool:
+        """يضبط البت؛ يعيد True إن لم يكن مضبوطاً من قبل"""
+        byte, bit = divmod(i, 8)
+        if byte >= len(self._bits):
+            self._bits.extend(b'\x00' * (byte + 1 - len(self._bits)))
+        mask = 1 << bit
+        if self._bits[byte] & mask:
+            return False
+        self._bits[byte] |= mask
+        return True
+
+    def __contains__(self, i: int) -> bool:
+        byte, bit = divmod(i, 8)
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << bit))
+
+    def __len__(self) -> int:
+        return int.from_bytes(self._bits, 'little').bit_count()
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bits)
+
+
+_queue_cache: Tuple[float, int] = (0.0, 0)
+_queue_lock = threading.Lock()
+
+
+def _pending_items() -> int:
+    """عدد العناصر المعلّقة (حجم الطابور قبل طرح ما راجعه المحكّم)، مخزّن مؤقتاً QUEUE_TTL ثانية"""
+    global _queue_cache
+    now = time.monotonic()
+    with _queue_lock:
+        stamp, total = _queue_cache
+        if now - stamp < QUEUE_TTL:
+            return total
+    total = db.session.execute(
+        select(func.count(TaggingData.id)).where(TaggingData.status == QUEUE_STATUS)).scalar() or 0
+    with _queue_lock:
+        _queue_cache = (now, total)
+    return total
+
+
+def invalidate_pending_items() -> None:
+    """بعد إضافة أو حذف أو تغيير حالة جماعي حتى لا ينتظر العدد انتهاء QUEUE_TTL"""
+    global _queue_cache
+    with _queue_lock:
+        _queue_cache = (0.0, 0)
+
+
+def drop_reviewer_progress(reviewer_ids) -> None:
+    """يحذف خرائط محكّمين حُذفت بعض مراجعاتهم؛ تُعاد بناؤها عند أول طلب (دون commit)"""
+    ids = [r for r in set(reviewer_ids) if r is not None]
+    if ids:
+        db.session.execute(delete(ReviewerProgress).where(ReviewerProgress.reviewer_id.in_(ids)))
+
+
+# ========================= صيانة العدّادات (دون commit) =========================
+def _counted_reviewers(data_ids: Sequence[int], exclude: Optional[str] = None) -> Dict[str, int]:
+    """لكل محكّم: عدد العناصر من data_ids التي تحمل بته (مراجعة بعد آخر إعادة للطابور)"""
+    stmt = select(TaggingReview.reviewer_id, func.count(func.distinct(TaggingReview.data_id)))\
+        .join(TaggingData, TaggingData.id == TaggingReview.data_id)\
+        .where(TaggingReview.data_id.in_(data_ids),
+               TaggingReview.id > func.coalesce(TaggingData.requeue_review_id, 0))\
+        .group_by(TaggingReview.reviewer_id)
+    if exclude is not None:
+        stmt = stmt.where(TaggingReview.reviewer_id != exclude)
+    return {r: n for r, n in db.session.execute(stmt) if r is not None}
+
+
+def _bump_pending_reviewed(deltas: Dict[str, int]) -> None:
+    if deltas:
+        db.session.execute(
+            update(ReviewerProgress.__table__)
+            .where(ReviewerProgress.__table__.c.reviewer_id == bindparam('_rid'))
+            .values(pending_reviewed=ReviewerProgress.__table__.c.pending_reviewed + bindparam('_n')),
+            [{'_rid': r, '_n': n} for r, n in deltas.items()]
+        )
+
+
+def lower_scan_from(min_id: int) -> None:
+    """عنصر بمعرف min_id (أو أكبر) عاد إلى الطابور: لا يتخطاه مسح أي محكّم"""
+    db.session.execute(
+        update(ReviewerProgress).where(ReviewerProgress.scan_from > min_id).values(scan_from=min_id)
+    )
+
+
+def items_left_queue(data_ids: Sequence[int], exclude: Optional[str] = None) -> None:
+    """عناصر خرجت من الطابور (لم تعد pending): ينقص pending_reviewed لكل من راجعها"""
+    if data_ids:
+        _bump_pending_reviewed({r: -n for r, n in _counted_reviewers(data_ids, exclude).items()})
+    invalidate_pending_items()
+
+
+def items_entered_queue(data_ids: Sequence[int]) -> None:
+    """عناصر عادت إلى الطابور (أصبحت pending): يزيد pending_reviewed لمن راجعها ويُخفَّض scan_from للجميع"""
+    if data_ids:
+        _bump_pending_reviewed(_counted_reviewers(data_ids))
+        lower_scan_from(min(data_ids))
+    invalidate_pending_items()
+
+
+def review_applied(data_id: int, reviewer_id: str, was_pending: bool, is_pending: bool) -> None:
+    """بعد إضافة مراجعة reviewer_id للعنصر وتطبيق قرارها، داخل معاملتها"""
+    if was_pending and is_pending:
+        _bump_pending_reviewed({reviewer_id: 1})
+    elif was_pending:
+        # خرج من الطابور: المراجِع الحالي لم يُحتسب له بعد فلا ينقص منه
+        items_left_queue([data_id], exclude=reviewer_id)
+    elif is_pending:
+        items_entered_queue([data_id])
+
+
+# ========================= الخريطة =========================
+def rebuild_reviewer_progress(reviewer_id: str) -> Tuple[IdBitmap, int]:
+    """يعيد بناء خريطة المحكّم وعدّاداته بالكامل من tagging_reviews"""
+    bitmap = IdBitmap()
+    max_review_id = 0
+    pending_reviewed = 0
+    # المراجعات المؤرشفة تُحتسب أيضاً حتى لا ينقص التقدّم بعد الأرشفة
+    reviews = reviews_union('id', 'data_id', 'reviewer_id')
+    items = data_union('id', 'requeue_review_id', 'status')
+    rows = db.session.execute(
+        select(reviews.c.id, reviews.c.data_id, items.c.requeue_review_id, items.c.status)
+        .select_from(reviews.outerjoin(items, items.c.id == reviews.c.data_id))
+        .where(reviews.c.reviewer_id == reviewer_id)
+    )
+    for review_id, data_id, requeue_review_id, status in rows:
+        # مراجعة سبقت إعادة العنصر للطابور لا تُخرجه من طابور المحكّم
+        if (requeue_review_id is None or review_id > requeue_review_id) and bitmap.add(data_id) \
+                and status == QUEUE_STATUS:
+            pending_reviewed += 1
+        max_review_id = max(max_review_id, review_id)
+    count = len(bitmap)
+
+    row = db.session.get(ReviewerProgress, reviewer_id)
+    if row is None:
+        row = ReviewerProgress(reviewer_id=reviewer_id)
+        db.session.add(row)
+    row.bitmap = bitmap.to_bytes()
+    row.reviewed_count = count
+    row.max_review_id = max_review_id
+    row.pending_reviewed = pending_reviewed
+    row.scan_from = 0
+    row.updated_at = datetime.utcnow()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # أعاد عامل آخر البناء في نفس اللحظة؛ النتيجة نفسها
+        db.session.rollback()
+    return bitmap, count
+
+
+def load_reviewed_set(reviewer_id: str) -> Tuple[IdBitmap, int, int]:
+    """
+    يحمّل خريطة المحكّم ويدمج فيها المراجعات الأحدث من max_review_id فقط،
+    ثم يحفظها بأسلوب compare-and-set. يعيد (الخريطة، عدد العناصر المراجعة، scan_from).
+    """
+    row = db.session.get(ReviewerProgress, reviewer_id)
+    if row is None or row.pending_reviewed is None:
+        # لا خريطة، أو صف سابق للعدّادات
+        bitmap, count = rebuild_reviewer_progress(reviewer_id)
+        return bitmap, count, 0
+
+    bitmap = IdBitmap(row.bitmap)
+    count = row.reviewed_count
+    old_max = row.max_review_id
+    new_max = old_max
+    rows = db.session.execute(
+        select(TaggingReview.id, TaggingReview.data_id)
+        .where(TaggingReview.reviewer_id == reviewer_id, TaggingReview.id > old_max)
+        .order_by(TaggingReview.id)
+    ).all()
+    for review_id, data_id in rows:
+        if bitmap.add(data_id):
+            count += 1
+        new_max = review_id
+
+    if new_max != old_max:
+        db.session.execute(
+            update(ReviewerProgress)
+            .where(ReviewerProgress.reviewer_id == reviewer_id, ReviewerProgress.max_review_id == old_max)
+            .values(bitmap=bitmap.to_bytes(), reviewed_count=count,
+                    max_review_id=new_max, updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+    return bitmap, count, row.scan_from or 0
+
+
+def _counters(reviewer_id: str):
+    """(reviewed_count, max_review_id, pending_reviewed) دون تحميل الخريطة؛ يعيد البناء عند الحاجة"""
+    row = db.session.execute(
+        select(ReviewerProgress.reviewed_count, ReviewerProgress.max_review_id, ReviewerProgress.pending_reviewed)
+        .where(ReviewerProgress.reviewer_id == reviewer_id)
+    ).first()
+    if row is None or row.pending_reviewed is None:
+        rebuild_reviewer_progress(reviewer_id)
+        row = db.session.execute(
+            select(ReviewerProgress.reviewed_count, ReviewerProgress.max_review_id, ReviewerProgress.pending_reviewed)
+            .where(ReviewerProgress.reviewer_id == reviewer_id)
+        ).first()
+    return row
+
+
+def reviewer_progress(reviewer_id: str) -> Dict[str, Any]:
+    """
+    ما راجعه المحكّم (كل الحالات) وما تبقى في طابوره (المعلّق غير المراجَع)، من العدّادات المحفوظة:
+    العدد المحفوظ + المراجعات بعد max_review_id (نطاق صغير على الفهرس).
+    """
+    row = _counters(reviewer_id)
+    newer = db.session.execute(
+        select(func.count(TaggingReview.id))
+        .where(TaggingReview.reviewer_id == reviewer_id, TaggingReview.id > row.max_review_id)
+    ).scalar() or 0
+    done = row.reviewed_count + newer
+    remaining = max(_pending_items() - row.pending_reviewed, 0)
+    return {'done': done, 'remaining': remaining, 'total': done + remaining}
+
+
+def unreviewed_ids(reviewer_id: str, status: str, filters: Sequence, limit: int, offset: int = 0) -> List[int]:
+    """
+    معرفات العناصر بالحالة status المطابقة لـ filters (الدفعة، مرشحات المراجعة) التي لم يراجعها المحكّم،
+    بترتيب المعرف. طابور المعلّق يبدأ المسح من scan_from ويقدّمه إلى أول عنصر غير مراجَع.
+    """
+    bitmap, _, scan_from = load_reviewed_set(reviewer_id)
+    queue = status == QUEUE_STATUS
+    last_id = scan_from - 1 if queue else 0
+    first_open = None
+    out: List[int] = []
+    skipped = 0
+    exhausted = False
+    while len(out) < limit:
+        ids = db.session.execute(
+            select(TaggingData.id)
+            .where(TaggingData.status == status, TaggingData.id > last_id, *filters)
+            .order_by(TaggingData.id).limit(SCAN_CHUNK)
+        ).scalars().all()
+        if not ids:
+            exhausted = True
+            break
+        for i in ids:
+            if i in bitmap:
+                continue
+            if first_open is None:
+                first_open = i
+            if skipped < offset:
+                skipped += 1
+                continue
+            out.append(i)
+            if len(out) >= limit:
+                break
+        last_id = ids[-1]
+
+    # العلامة صحيحة للطابور غير المُرشَّح فقط: المرشحات تتخطى عناصر معلّقة لم تُفحص
+    if queue and not filters:
+        new_from = first_open if first_open is not None else (last_id + 1 if exhausted else scan_from)
+        if new_from > scan_from:
+            db.session.execute(
+                update(ReviewerProgress)
+                .where(ReviewerProgress.reviewer_id == reviewer_id, ReviewerProgress.scan_from == scan_from)
+                .values(scan_from=new_from)
+            )
+            db.session.commit()
+    return out
+
+
+def unreviewed_count(reviewer_id: str, status: str, filters: Sequence) -> int:
+    """
+    عدد العناصر المطابقة التي لم يراجعها المحكّم، دون NOT IN:
+    الطابور غير المُرشَّح من العدّادات المحفوظة؛ غيره عدد المطابق ناقص ما راجعه منه (استعلام واحد على مراجعاته).
+    """
+    if status == QUEUE_STATUS and not filters:
+        return max(_pending_items() - _counters(reviewer_id).pending_reviewed, 0)
+    conds = [TaggingData.status == status, *filters]
+    total = db.session.execute(select(func.count(TaggingData.id)).where(*conds)).scalar() or 0
+    reviewed = db.session.execute(
+        select(func.count(func.distinct(TaggingReview.data_id)))
+        .join(TaggingData, TaggingData.id == TaggingReview.data_id)
+        .where(TaggingReview.reviewer_id == reviewer_id,
+               TaggingReview.id > func.coalesce(TaggingData.requeue_review_id, 0), *conds)
+    ).scalar() or 0
+    return max(total - reviewed, 0)
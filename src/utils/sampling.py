@@ -0,0 +1,185 @@
+from __future__ import annotations
+import hashlib
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update, func, bindparam, inspect, text
+
+from src.models.user import db
+from src.models.tagging import TaggingData
+from src.models.archive import tagging_data_archive
+from src.utils.archive import data_union
+
+SAMPLE_FIELDS = ('id', 'text', 'tag_en', 'tag_ar', 'status', 'original_tags')
+STATUSES = ('pending', 'reviewed', 'approved', 'rejected', 'duplicate')
+DIMENSIONS = ('ideological', 'syntactic', 'functional', 'discourse')
+BACKFILL_BATCH = 1000
+DIMENSION_SCAN = 500  # حجم دفعة المسح عند التقسيم حسب بُعد داخل original_tags
+STRATA_TTL = 60  # ثوانٍ لتخزين أحجام الطبقات مؤقتاً (population تقريبي بطبيعته)
+
+_strata_cache: Dict[Tuple[str, Optional[str]], Tuple[float, Dict[str, int]]] = {}
+_strata_lock = threading.Lock()
+
+
+def seed_start(seed: str) -> float:
+    """نقطة بدء ثابتة في [0, 1) لكل بذرة: نفس البذرة = نفس العيّنة ما دامت البيانات لم تتغير"""
+    digest = hashlib.sha256(str(seed).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+def _population():
+    """الجدول الحي والأرشيف معاً: archive_settled ينقل العناصر المعتمدة، وهي المجتمع الافتراضي للتدقيق"""
+    return data_union(*SAMPLE_FIELDS, 'sample_key')
+
+
+def _columns(pop):
+    return [pop.c[f] for f in SAMPLE_FIELDS]
+
+
+def _rows(stmt) -> List[Dict[str, Any]]:
+    return [dict(r) for r in db.session.execute(stmt).mappings()]
+
+
+def _take(pop, conds: Sequence, start: float, n: int) -> List[Dict[str, Any]]:
+    """
+    أول n عناصر بمفتاح >= start على الفهرس (في كل جدول، ثم دمج بالترتيب)، ثم الالتفاف من 0 إن لم تكفِ.
+    المفاتيح عشوائية مستقلة عن المحتوى، فأي n متتالية منها عيّنة عشوائية منتظمة.
+    """
+    key = pop.c.sample_key
+    items = _rows(select(*_columns(pop)).where(*conds, key >= start).order_by(key).limit(n))
+    if len(items) < n:
+        items += _rows(select(*_columns(pop)).where(*conds, key < start).order_by(key).limit(n - len(items)))
+    return items
+
+
+def _strata(field: str, status: Optional[str]) -> Dict[str, int]:
+    """أحجام الطبقات (GROUP BY على المجتمع كله) مخزّنة STRATA_TTL ثانية لكل (عمود، حالة)"""
+    cache_key = (field, status)
+    now = time.monotonic()
+    with _strata_lock:
+        hit = _strata_cache.get(cache_key)
+        if hit and now - hit[0] < STRATA_TTL:
+            return hit[1]
+    pop = data_union(field, 'status')
+    conds = [pop.c.status == status] if status else []
+    sizes = {v: c for v, c in db.session.execute(
+        select(pop.c[field], func.count()).where(*conds).group_by(pop.c[field])) if v is not None}
+    with _strata_lock:
+        _strata_cache[cache_key] = (now, sizes)
+    return sizes
+
+
+def invalidate_strata() -> None:
+    """بعد أرشفة أو حذف أو تغيير وسم/حالة جماعي حتى لا تنتظر الأحجام انتهاء STRATA_TTL"""
+    with _strata_lock:
+        _strata_cache.clear()
+
+
+def _dimension_sample(pop, dimension: str, conds: Sequence, start: float, n: int,
+                      wanted: Optional[Sequence[str]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    الوسوم لكل بُعد داخل original_tags (JSON غير مفهرس): نمسح بترتيب المفتاح من نقطة البدء
+    ونوزّع على الطبقات حتى تكتمل كل طبقة مطلوبة (أو ينتهي المسح)، فالكلفة تتبع n وتكرار الطبقة.
+    """
+    key = pop.c.sample_key
+    field = f'{dimension}_en'
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for lo, hi in ((start, None), (None, start)):
+        last = lo
+        first = True
+        while True:
+            where = list(conds)
+            if last is not None:
+                where.append(key >= last if first else key > last)
+            if hi is not None:
+                where.append(key < hi)
+            batch = db.session.execute(
+                select(*_columns(pop), key).where(*where).order_by(key).limit(DIMENSION_SCAN)
+            ).mappings().all()
+            if not batch:
+                break
+            for row in batch:
+                try:
+                    tag = (json.loads(row['original_tags'] or '{}') or {}).get(field)
+                except (TypeError, ValueError, AttributeError):
+                    tag = None
+                if not tag or (wanted and tag not in wanted):
+                    continue
+                bucket = out.setdefault(tag, [])
+                if len(bucket) < n:
+                    bucket.append({k: row[k] for k in SAMPLE_FIELDS})
+            if wanted and all(len(out.get(t, [])) >= n for t in wanted):
+                return out
+            last, first = batch[-1]['sample_key'], False
+    return out
+
+
+def stratified_sample(n: int, by: str = 'tag_en', status: Optional[str] = 'approved',
+                      seed: Optional[str] = None, strata: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    n عنصر عشوائي لكل طبقة. by: tag_en | status | dimension:<ideological|syntactic|functional|discourse>
+    status يقيّد المجتمع (يُتجاهل عند by=status). بدون seed تُولَّد بذرة وتُعاد لإعادة الإنتاج.
+    """
+    if seed is None:
+        seed = f'{random.getrandbits(48):012x}'
+    start = seed_start(seed)
+    pop = _population()
+    conds = [pop.c.status == status] if status and by != 'status' else []
+
+    result: Dict[str, Any] = {'seed': seed, 'by': by, 'n': n, 'status': None if by == 'status' else status}
+    if by == 'tag_en':
+        sizes = _strata('tag_en', status)
+        values = list(strata) if strata else sorted(sizes)
+        result['strata'] = [{'value': v, 'population': sizes.get(v, 0),
+                             'items': _take(pop, conds + [pop.c.tag_en == v], start, n)} for v in values]
+    elif by == 'status':
+        sizes = _strata('status', None)
+        values = list(strata) if strata else sorted(sizes)
+        result['strata'] = [{'value': v, 'population': sizes.get(v, 0),
+                             'items': _take(pop, [pop.c.status == v], start, n)} for v in values]
+    elif by.startswith('dimension:') and by.split(':', 1)[1] in DIMENSIONS:
+        samples = _dimension_sample(pop, by.split(':', 1)[1], conds, start, n, strata)
+        values = list(strata) if strata else sorted(samples)
+        result['strata'] = [{'value': v, 'population': None, 'items': samples.get(v, [])} for v in values]
+    else:
+        raise ValueError('قيمة by غير صالحة')
+    return result
+
+
+def backfill_sample_keys(batch_size: int = BACKFILL_BATCH) -> int:
+    """يملأ sample_key للعناصر القديمة (الحية والمؤرشفة) على دفعات؛ آمن للتكرار"""
+    filled = 0
+    for table in (TaggingData.__table__, tagging_data_archive):
+        while True:
+            ids = db.session.execute(
+                select(table.c.id).where(table.c.sample_key.is_(None)).order_by(table.c.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('_id'), table.c.sample_key.is_(None))
+                .values(sample_key=bindparam('key')),
+                [{'_id': i, 'key': random.random()} for i in ids]
+            )
+            db.session.commit()
+            filled += len(ids)
+    return filled
+
+
+def ensure_sample_keys() -> int:
+    """
+    عند الإقلاع: يملأ المفاتيح الناقصة (العناصر السابقة للميزة) ثم يجعل العمود NOT NULL،
+    فلا يحتاج أخذ العيّنات إلى عدّ العناصر بلا مفتاح في كل طلب.
+    """
+    filled = backfill_sample_keys()
+    if db.engine.dialect.name == 'postgresql':
+        cols = {c['name']: c for c in inspect(db.engine).get_columns(TaggingData.__tablename__)}
+        if cols.get('sample_key', {}).get('nullable'):
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {TaggingData.__tablename__} ALTER COLUMN sample_key SET NOT NULL'))
+            print("sample_key column set to NOT NULL.")
+    return filled
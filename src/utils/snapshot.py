@@ -0,0 +1,211 @@
+from __future__ import annotations
+import json
+import os
+import secrets
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+from sqlalchemy import select
+
+from src.models.user import db
+from src.models.tagging import TaggingData, DeletedItem
+from src.utils.archive import data_union, reviews_union
+
+try:  # Parquet يحتاج pyarrow؛ بدونه نكتب أجزاء pickle لـ pandas
+    import pyarrow  # noqa: F401
+    DEFAULT_FORMAT = 'parquet'
+except ImportError:  # pragma: no cover
+    DEFAULT_FORMAT = 'pickle'
+
+SNAPSHOT_CHUNK = 5000
+# التعديلات خلال آخر SNAPSHOT_LAG ثانية تُعاد في التشغيل التالي: معاملة ثبّتت بعد
+# بدء التشغيل بطابع updated_at أقدم منه لا تفوت العلامة (التكرار تزيله load_snapshot).
+# وعلامات المعرفات (المراجعات، العناصر، الحذف) لا تتجاوز صفاً أحدث من SNAPSHOT_LAG: معرف حُجز
+# مبكراً وثبّتت معاملته متأخرة يُلتقط ما دامت معاملته أقصر من هذه المهلة (كما في tag_analytics)
+SNAPSHOT_LAG = int(os.getenv('SNAPSHOT_LAG_SECONDS', '300'))
+MANIFEST = 'manifest.json'
+EXTENSIONS = {'parquet': '.parquet', 'pickle': '.pkl'}
+
+DATA_COLUMNS = ('id', 'text', 'tag_en', 'tag_ar', 'status', 'uploaded_by', 'uploaded_at', 'original_tags')
+REVIEW_COLUMNS = ('id', 'data_id', 'reviewer_id', 'decision', 'new_tag_en', 'new_tag_ar',
+                  'original_tag_en', 'confidence', 'reviewed_at', 'time_spent')
+DIMENSIONS = ('ideological', 'syntactic', 'functional', 'discourse')
+
+
+def _load_manifest(path: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'review_id': 0, 'data_id': 0, 'updated_at': None, 'deletion_id': 0, 'runs': []}
+
+
+def _save_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    # كتابة ذرية: لا يرى القارئ نصف ملف
+    tmp = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+def _keyset(subq, after_id: int, chunk: int, stamp: str, cutoff: datetime) -> Iterator[List[Dict[str, Any]]]:
+    """
+    دفعات مرتبة بالمعرف بعد after_id (ذاكرة محدودة بحجم الدفعة)، تتوقف عند أول صف
+    طابعه stamp بعد cutoff: ما بعده يُقرأ في تشغيل لاحق مع أي معرف أصغر ثبّت متأخراً.
+    """
+    while True:
+        rows = db.session.execute(
+            select(subq).where(subq.c.id > after_id).order_by(subq.c.id).limit(chunk)
+        ).mappings().all()
+        settled = []
+        for row in rows:
+            if row[stamp] is not None and row[stamp] >= cutoff:
+                break
+            settled.append(dict(row))
+        if settled:
+            yield settled
+        if len(settled) < chunk:
+            return
+        after_id = settled[-1]['id']
+
+
+def _by_ids(subq, ids: List[int], chunk: int) -> Iterator[List[Dict[str, Any]]]:
+    for i in range(0, len(ids), chunk):
+        rows = db.session.execute(select(subq).where(subq.c.id.in_(ids[i:i + chunk]))).mappings().all()
+        if rows:
+            yield [dict(r) for r in rows]
+
+
+def dimension_tags(items: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """يفكّ original_tags إلى صف لكل بُعد: (data_id, dimension, tag_en, tag_ar)"""
+    out = []
+    for item in items:
+        try:
+            tags = json.loads(item.get('original_tags') or '{}')
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(tags, dict):
+            continue
+        for dim in DIMENSIONS:
+            en, ar = tags.get(f'{dim}_en'), tags.get(f'{dim}_ar')
+            if en or ar:
+                out.append({'data_id': item['id'], 'dimension': dim, 'tag_en': en, 'tag_ar': ar})
+    return out
+
+
+class _PartWriter:
+    """
+    يكتب كل دفعة كجزء مستقل: tables/<name>/part-<run>-<n><ext>.
+    run فريد لكل تشغيل (ميكروثانية + لاحقة عشوائية) والملف يُنشأ حصرياً، فلا يُستبدل جزء سابق بصمت.
+    """
+
+    def __init__(self, root: str, run: str, fmt: str):
+        self.root, self.run, self.fmt = root, run, fmt
+        self.counts: Dict[str, int] = {}
+        self.parts: Dict[str, int] = {}
+
+    def write(self, name: str, rows: List[Dict[str, Any]], run_ts: datetime) -> None:
+        if not rows:
+            return
+        frame = pd.DataFrame.from_records(rows)
+        frame['snapshot_at'] = run_ts
+        folder = os.path.join(self.root, name)
+        os.makedirs(folder, exist_ok=True)
+        n = self.parts.get(name, 0) + 1
+        path = os.path.join(folder, f'part-{self.run}-{n:05d}{EXTENSIONS[self.fmt]}')
+        with open(path, 'xb') as f:
+            if self.fmt == 'parquet':
+                frame.to_parquet(f, index=False)
+            else:
+                frame.to_pickle(f)
+        self.parts[name] = n
+        self.counts[name] = self.counts.get(name, 0) + len(rows)
+
+
+def build_snapshot(path: str, chunk: int = SNAPSHOT_CHUNK, fmt: Optional[str] = None) -> Dict[str, Any]:
+    """
+    يُلحق بلقطة عمودية في path الصفوف الجديدة منذ آخر تشغيل فقط:
+    - tagging_reviews: المراجعات بعد علامة المعرف (الحية والمؤرشفة) حتى أول مراجعة أحدث من SNAPSHOT_LAG.
+    - tagging_data: العناصر الجديدة + نسخة حديثة لكل عنصر رُوجع أو تغيّر (updated_at) منذ التشغيل السابق
+      (يأخذ المحلل آخر snapshot_at لكل id، انظر load_snapshot).
+    - original_tags: صف لكل (عنصر، بُعد) من العناصر المكتوبة.
+    - deleted_items: العناصر المحذوفة (تراجع عن دفعة، حذف جماعي) لتسقطها load_snapshot.
+    العلامات تُحفظ في manifest.json بعد كتابة كل الأجزاء فقط.
+    """
+    fmt = fmt or DEFAULT_FORMAT
+    os.makedirs(path, exist_ok=True)
+    manifest = _load_manifest(path)
+    run_ts = datetime.utcnow()
+    writer = _PartWriter(path, f"{run_ts.strftime('%Y%m%dT%H%M%S%f')}-{secrets.token_hex(3)}", fmt)
+
+    reviews = reviews_union(*REVIEW_COLUMNS)
+    items = data_union(*DATA_COLUMNS)
+    cutoff = run_ts - timedelta(seconds=SNAPSHOT_LAG)
+
+    review_id = manifest['review_id']
+    touched = set()
+    for rows in _keyset(reviews, review_id, chunk, 'reviewed_at', cutoff):
+        writer.write('tagging_reviews', rows, run_ts)
+        touched.update(r['data_id'] for r in rows)
+        review_id = rows[-1]['id']
+
+    data_id = manifest['data_id']
+    for rows in _keyset(items, data_id, chunk, 'uploaded_at', cutoff):
+        writer.write('tagging_data', rows, run_ts)
+        writer.write('original_tags', dimension_tags(rows), run_ts)
+        data_id = rows[-1]['id']
+
+    # العناصر القديمة التي تغيّرت: بمراجعات هذا التشغيل أو بتعديل دون مراجعة (عمليات جماعية، المكررات)
+    # الأرشيف لا يتغيّر بعد النقل، فيكفي الجدول الحي على فهرس updated_at
+    changed = {i for i in touched if i <= manifest['data_id']}
+    since = manifest.get('updated_at')
+    if since:
+        changed.update(db.session.execute(
+            select(TaggingData.id).where(TaggingData.updated_at > datetime.fromisoformat(since),
+                                         TaggingData.id <= manifest['data_id'])
+        ).scalars())
+    for rows in _by_ids(items, sorted(changed), chunk):
+        writer.write('tagging_data', rows, run_ts)
+        writer.write('original_tags', dimension_tags(rows), run_ts)
+
+    deletions = DeletedItem.__table__
+    deletion_id = manifest.get('deletion_id', 0)
+    for rows in _keyset(select(deletions).subquery(), deletion_id, chunk, 'deleted_at', cutoff):
+        writer.write('deleted_items', rows, run_ts)
+        deletion_id = rows[-1]['id']
+
+    run = {'at': run_ts.isoformat(), 'format': fmt, 'rows': writer.counts}
+    manifest.pop('reviewed_at', None)
+    manifest.update(review_id=review_id, data_id=data_id, deletion_id=deletion_id,
+                    updated_at=cutoff.isoformat())
+    manifest['runs'].append(run)
+    _save_manifest(path, manifest)
+    return run
+
+
+def load_snapshot(path: str, name: str, latest: bool = True) -> pd.DataFrame:
+    """
+    يقرأ جدولاً من اللقطة إلى DataFrame واحد. مع latest تبقى آخر نسخة لكل عنصر
+    (tagging_data بالمعرف، original_tags بـ (data_id, dimension)) وتُسقط العناصر المحذوفة.
+    """
+    folder = os.path.join(path, name)
+    if not os.path.isdir(folder):
+        return pd.DataFrame()
+    frames = []
+    for fname in sorted(os.listdir(folder)):
+        full = os.path.join(folder, fname)
+        if fname.endswith('.parquet'):
+            frames.append(pd.read_parquet(full))
+        elif fname.endswith('.pkl'):
+            frames.append(pd.read_pickle(full))
+    if not frames:
+        return pd.DataFrame()
+    frame = pd.concat(frames, ignore_index=True)
+    keys = {'tagging_data': ['id'], 'original_tags': ['data_id', 'dimension']}.get(name)
+    if latest and keys:
+        frame = frame.sort_values('snapshot_at', kind='stable').drop_duplicates(keys, keep='last')
+        deleted = load_snapshot(path, 'deleted_items', latest=False)
+        if not deleted.empty:
+            frame = frame[~frame[keys[0]].isin(deleted['data_id'])]
+    return frame.reset_index(drop=True)
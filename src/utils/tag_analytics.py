@@ -0,0 +1,195 @@
+from __future__ import annotations
+import os
+import threading
+import traceback
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Any
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.analytics import TagTransition, AnalyticsWatermark
+from src.utils.archive import data_union, reviews_union
+
+WATERMARK_NAME = 'tag_transitions'
+BATCH_SIZE = 5000
+DECISIONS = ('approve', 'reject', 'modify')
+# العلامة لا تتجاوز مراجعة أحدث من REFRESH_LAG ثانية: معرف حُجز مبكراً وثبّتت معاملته متأخرة
+# (معرف أصغر يظهر بعد معرف أكبر) يُحتسب ما دامت معاملته أقصر من هذه المهلة.
+REFRESH_LAG = int(os.getenv('TAG_ANALYTICS_LAG_SECONDS', '300'))
+
+_refresh_lock = threading.Lock()
+
+
+def _advance_watermark(last_id: int, new_last_id: int, exists: bool) -> bool:
+    """
+    يحرّك العلامة بأسلوب compare-and-set؛ يعيد False إن سبقنا عامل آخر
+    (فلا تُحتسب الدفعة نفسها مرتين).
+    """
+    if not exists:
+        db.session.add(AnalyticsWatermark(name=WATERMARK_NAME, last_id=new_last_id))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        return True
+
+    res = db.session.execute(
+        update(AnalyticsWatermark)
+        .where(AnalyticsWatermark.name == WATERMARK_NAME, AnalyticsWatermark.last_id == last_id)
+        .values(last_id=new_last_id, updated_at=datetime.utcnow())
+    )
+    if res.rowcount == 0:
+        db.session.rollback()
+        return False
+    return True
+
+
+def _add_counts(counts: Counter) -> None:
+    """يزيد العدادات المجمّعة (تحديث ثم إدراج إن لم يوجد الصف)"""
+    for (from_tag, to_tag, decision), n in counts.items():
+        res = db.session.execute(
+            update(TagTransition)
+            .where(TagTransition.from_tag == from_tag,
+                   TagTransition.to_tag == to_tag,
+                   TagTransition.decision == decision)
+            .values(count=TagTransition.count + n)
+        )
+        if res.rowcount == 0:
+            db.session.add(TagTransition(from_tag=from_tag, to_tag=to_tag, decision=decision, count=n))
+
+
+def _review_rows(*conds, limit=None):
+    """
+    (id, decision, original_tag_en, new_tag_en, tag_en الحالي للعنصر, reviewed_at) بترتيب المعرف،
+    من المراجعات الحية والمؤرشفة معاً: مراجعة أُرشفت قبل احتسابها تبقى ضمن المسح.
+    """
+    reviews = reviews_union('id', 'data_id', 'decision', 'original_tag_en', 'new_tag_en', 'reviewed_at')
+    items = data_union('id', 'tag_en')
+    stmt = select(reviews.c.id, reviews.c.decision, reviews.c.original_tag_en, reviews.c.new_tag_en,
+                  items.c.tag_en, reviews.c.reviewed_at)\
+        .select_from(reviews.outerjoin(items, items.c.id == reviews.c.data_id))\
+        .where(*[cond(reviews.c) for cond in conds])\
+        .order_by(reviews.c.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.session.execute(stmt).all()
+
+
+def _transition_counts(rows) -> Counter:
+    """rows: (id, decision, original_tag_en, new_tag_en, tag_en الحالي للعنصر, ...)"""
+    counts: Counter = Counter()
+    for _, decision, original_tag, new_tag, current_tag, *_ in rows:
+        # المراجعات القديمة لا تحمل الوسم الأصلي؛ نكتفي بالوسم الحالي للعنصر
+        from_tag = original_tag or current_tag or 'Unknown'
+        to_tag = (new_tag or from_tag) if decision == 'modify' else from_tag
+        counts[(from_tag, to_tag, decision)] += 1
+    return counts
+
+
+def forget_reviews(data_ids) -> None:
+    """
+    يطرح من المصفوفة المجمّعة مراجعات العناصر التي ستُحذف، حية أو مؤرشفة (المحتسبة فقط، أي حتى العلامة).
+    يُستدعى داخل معاملة الحذف وقبله (دون commit).
+    """
+    wm = db.session.get(AnalyticsWatermark, WATERMARK_NAME)
+    if not wm or not data_ids:
+        return
+    data_ids = list(data_ids)
+    rows = _review_rows(lambda c: c.data_id.in_(data_ids), lambda c: c.id <= wm.last_id)
+    counts = _transition_counts(rows)
+    _add_counts(Counter({k: -n for k, n in counts.items()}))
+    db.session.execute(delete(TagTransition).where(TagTransition.count <= 0))
+
+
+def refresh_tag_transitions(batch_size: int = BATCH_SIZE) -> int:
+    """
+    يضيف إلى مصفوفة الالتباس المراجعات الجديدة فقط (معرفها بعد العلامة المحفوظة)،
+    على دفعات، ويتوقف عند أول مراجعة أحدث من REFRESH_LAG. يعيد عدد المراجعات التي تمت معالجتها.
+    تُشغَّل في الخلفية (refresh_in_background) أو من refresh_tag_analytics.py، لا داخل طلب قراءة.
+    """
+    processed = 0
+    cutoff = datetime.utcnow() - timedelta(seconds=REFRESH_LAG)
+    while True:
+        db.session.expire_all()
+        wm = db.session.get(AnalyticsWatermark, WATERMARK_NAME)
+        last_id = wm.last_id if wm else 0
+
+        rows = _review_rows(lambda c: c.id > last_id, limit=batch_size)
+        settled = []
+        for row in rows:
+            if row.reviewed_at is not None and row.reviewed_at >= cutoff:
+                break
+            settled.append(row)
+        if not settled:
+            break
+
+        counts = _transition_counts(settled)
+
+        if not _advance_watermark(last_id, settled[-1][0], wm is not None):
+            continue
+        _add_counts(counts)
+        db.session.commit()
+
+        processed += len(settled)
+        if len(settled) < batch_size:
+            break
+    return processed
+
+
+def refresh_in_background(app) -> bool:
+    """يشغّل refresh_tag_transitions في خيط خلفي؛ False إن كان تحديث جارياً في هذه العملية"""
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+
+    def _run():
+        try:
+            with app.app_context():
+                refresh_tag_transitions()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            _refresh_lock.release()
+
+    threading.Thread(target=_run, name='tag-analytics-refresh', daemon=True).start()
+    return True
+
+
+def tag_analytics_snapshot() -> Dict[str, Any]:
+    """يبني مصفوفة الالتباس ونسب القرارات لكل وسم من الجدول المجمّع الصغير"""
+    rows = db.session.query(
+        TagTransition.from_tag, TagTransition.to_tag, TagTransition.decision, TagTransition.count
+    ).all()
+
+    matrix: Dict[str, Dict[str, int]] = {}
+    per_tag: Dict[str, Dict[str, Any]] = {}
+    for from_tag, to_tag, decision, n in rows:
+        stats = per_tag.setdefault(from_tag, {'total': 0, **{d: 0 for d in DECISIONS}})
+        stats['total'] += n
+        if decision in DECISIONS:
+            stats[decision] += n
+        if decision == 'modify':
+            matrix.setdefault(from_tag, {})
+            matrix[from_tag][to_tag] = matrix[from_tag].get(to_tag, 0) + n
+
+    for stats in per_tag.values():
+        total = stats['total']
+        for d in DECISIONS:
+            stats[f'{d}_rate'] = round(stats[d] / total * 100, 2) if total > 0 else 0
+
+    top_changes = sorted(
+        ({'from_tag': f, 'to_tag': t, 'count': n} for f, row in matrix.items() for t, n in row.items()),
+        key=lambda x: x['count'], reverse=True
+    )
+
+    wm = db.session.get(AnalyticsWatermark, WATERMARK_NAME)
+    return {
+        'confusion_matrix': matrix,
+        'per_tag': per_tag,
+        'top_changes': top_changes[:20],
+        'last_review_id': wm.last_id if wm else 0,
+        'updated_at': wm.updated_at.isoformat() if wm and wm.updated_at else None,
+    }
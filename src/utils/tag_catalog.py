@@ -0,0 +1,213 @@
+from __future__ import annotations
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, func
+
+from src.models.user import db
+from src.models.catalog import TagCatalog
+from src.utils.near_dup import normalize_arabic
+
+# نسخة من القاموس في ذاكرة كل عملية: trie للبادئات + خرائط مطابقة تامة.
+# التعديل المحلي يُسقطها فوراً؛ العمليات الأخرى تلاحظ التغيير خلال CATALOG_RECHECK ثانية
+# باستعلام بصمة خفيف (count/max) لا باستعلام لكل بحث.
+CATALOG_RECHECK = float(os.getenv('TAG_CATALOG_RECHECK', '30'))
+MAX_SUGGEST = 20  # أقصى اقتراحات محفوظة في كل عقدة
+DIMENSIONS = ('general', 'ideological', 'syntactic', 'functional', 'discourse')
+ALL = '*'
+
+_CAMEL = re.compile(r'(?<=[a-z])(?=[A-Z])')
+
+
+def normalize_tag(value: Optional[str]) -> str:
+    """مفتاح مطابقة للّغتين: ReligiousReference و religious_reference و «مَرجِع دينيّ» تتطابق مع نظائرها"""
+    return normalize_arabic(_CAMEL.sub(' ', value or ''))
+
+
+def _keys(value: str) -> List[str]:
+    """المفتاح كاملاً، ودون مسافات، ومن بداية كل كلمة (ليُقترح Negative_Other عند كتابة other)"""
+    norm = normalize_tag(value)
+    if not norm:
+        return []
+    words = norm.split(' ')
+    keys = [norm, norm.replace(' ', '')]
+    keys += [' '.join(words[i:]) for i in range(1, len(words))]
+    return keys
+
+
+class _Node:
+    __slots__ = ('children', 'hits')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.hits: List[Dict[str, Any]] = []
+
+
+class _Snapshot:
+    """trie لكل بُعد (و * للكل) مع أفضل MAX_SUGGEST مدخلات محسوبة مسبقاً في كل عقدة"""
+
+    def __init__(self, entries: List[Dict[str, Any]], fingerprint: Tuple):
+        self.fingerprint = fingerprint
+        self.checked = time.monotonic()
+        self.size = len(entries)
+        self.tries: Dict[str, _Node] = {}
+        self.by_en: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.by_ar: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # الأقصر أولاً: «Neutral» قبل «Neutral_Framing» لنفس البادئة
+        for entry in sorted(entries, key=lambda e: (len(e['tag_en']), e['tag_en'].lower())):
+            for dim in (entry['dimension'], ALL):
+                self.by_en.setdefault((dim, normalize_tag(entry['tag_en'])), entry)
+                self.by_ar.setdefault((dim, normalize_tag(entry['tag_ar'])), entry)
+                root = self.tries.setdefault(dim, _Node())
+                for key in _keys(entry['tag_en']) + _keys(entry['tag_ar']):
+                    self._insert(root, key, entry)
+
+    @staticmethod
+    def _insert(root: _Node, key: str, entry: Dict[str, Any]) -> None:
+        node = root
+        for ch in key:
+            node = node.children.setdefault(ch, _Node())
+            # مفاتيح المدخل الواحد تُدرج متتالية، فالتكرار في العقدة يكون دائماً آخر عنصر
+            if len(node.hits) < MAX_SUGGEST and (not node.hits or node.hits[-1] is not entry):
+                node.hits.append(entry)
+
+    def suggest(self, prefix: str, dimension: str, limit: int) -> List[Dict[str, Any]]:
+        node = self.tries.get(dimension)
+        for ch in normalize_tag(prefix):
+            if node is None:
+                break
+            node = node.children.get(ch)
+        if node is None:
+            return []
+        out, seen = [], set()
+        for entry in node.hits:
+            if entry['id'] not in seen:
+                seen.add(entry['id'])
+                out.append(entry)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def match(self, dimension: str, tag_en: Optional[str] = None,
+              tag_ar: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """مطابقة تامة (بعد التطبيع) في البُعد، ثم في general، ثم في أي بُعد"""
+        for dim in dict.fromkeys((dimension, 'general', ALL)):
+            if tag_en:
+                hit = self.by_en.get((dim, normalize_tag(tag_en)))
+                if hit:
+                    return hit
+            if tag_ar:
+                hit = self.by_ar.get((dim, normalize_tag(tag_ar)))
+                if hit:
+                    return hit
+        return None
+
+
+_snapshot: Optional[_Snapshot] = None
+_lock = threading.Lock()
+
+
+# اتصال مستقل عن جلسة الطلب: لا autoflush لعمل المستدعي المعلّق ولا تأثير على معاملته عند الخطأ
+def _fingerprint() -> Tuple:
+    with db.engine.connect() as conn:
+        return tuple(conn.execute(
+            select(func.count(TagCatalog.id), func.max(TagCatalog.id), func.max(TagCatalog.updated_at))
+        ).one())
+
+
+def _load(fingerprint: Tuple) -> _Snapshot:
+    with db.engine.connect() as conn:
+        rows = conn.execute(
+            select(TagCatalog.id, TagCatalog.dimension, TagCatalog.tag_en, TagCatalog.tag_ar)
+        ).mappings().all()
+    if rows:
+        entries = [dict(r) for r in rows]
+    else:
+        # القاموس لم يُملأ بعد: القاموس الثابت القديم كبديل
+        from src.models.tagging import TAG_TRANSLATIONS
+        entries = [{'id': -i, 'dimension': 'general', 'tag_en': en, 'tag_ar': ar}
+                   for i, (en, ar) in enumerate(TAG_TRANSLATIONS.items(), 1)]
+    return _Snapshot(entries, fingerprint)
+
+
+def catalog() -> Optional[_Snapshot]:
+    """النسخة الحالية في الذاكرة؛ يُعاد بناؤها فقط عند تغيّر بصمة الجدول. None خارج سياق التطبيق."""
+    global _snapshot
+    snap = _snapshot
+    if snap is not None and time.monotonic() - snap.checked < CATALOG_RECHECK:
+        return snap
+    try:
+        fingerprint = _fingerprint()
+    except Exception:
+        # لا سياق تطبيق أو تعذّر الاتصال: نكمل بما في الذاكرة
+        return snap
+    with _lock:
+        snap = _snapshot
+        if snap is not None and snap.fingerprint == fingerprint:
+            snap.checked = time.monotonic()
+            return snap
+        try:
+            _snapshot = _load(fingerprint)
+        except Exception:
+            return snap
+        return _snapshot
+
+
+def invalidate_catalog() -> None:
+    """بعد أي تعديل على tag_catalog في هذه العملية"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+def suggest(prefix: str, dimension: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    snap = catalog()
+    if snap is None or not prefix:
+        return []
+    return [{k: e[k] for k in ('dimension', 'tag_en', 'tag_ar')}
+            for e in snap.suggest(prefix, dimension or ALL, limit)]
+
+
+def arabic_for(tag_en: Optional[str], dimension: Optional[str] = None) -> Optional[str]:
+    snap = catalog()
+    hit = snap.match(dimension or 'general', tag_en=tag_en) if snap is not None and tag_en else None
+    return hit['tag_ar'] if hit else None
+
+
+def canonical_pair(tag_en: Optional[str], tag_ar: Optional[str],
+                   dimension: str = 'general') -> Tuple[Optional[str], Optional[str]]:
+    """
+    يوحّد الإملاء على القاموس: إن طابق tag_en (أو tag_ar عند غيابه) مدخلاً يُعاد زوجه المعتمد كاملاً،
+    وإلا يُعاد المُدخل كما هو.
+    """
+    snap = catalog()
+    if snap is None:
+        return tag_en, tag_ar
+    hit = snap.match(dimension, tag_en=tag_en) if tag_en else snap.match(dimension, tag_ar=tag_ar)
+    if hit:
+        return hit['tag_en'], hit['tag_ar']
+    return tag_en, tag_ar
+
+
+def seed_catalog(user_id: Optional[str] = None) -> int:
+    """يملأ القاموس الفارغ من TAG_TRANSLATIONS (بُعد general)؛ لا يفعل شيئاً إن كان فيه مدخلات"""
+    from src.models.tagging import TAG_TRANSLATIONS
+    if db.session.execute(select(func.count(TagCatalog.id))).scalar():
+        return 0
+    db.session.add_all([TagCatalog(dimension='general', tag_en=en, tag_ar=ar, created_by=user_id)
+                        for en, ar in TAG_TRANSLATIONS.items()])
+    db.session.commit()
+    invalidate_catalog()
+    return len(TAG_TRANSLATIONS)
+
+
+def catalog_status() -> Dict[str, Any]:
+    snap = catalog()
+    return {
+        'entries': snap.size if snap else 0,
+        'dimensions': sorted(d for d in snap.tries if d != ALL) if snap else [],
+        'recheck_seconds': CATALOG_RECHECK
+    }